@@ -0,0 +1,567 @@
+# -*- coding: utf-8 -*-
+"""
+Análise de pedidos: produtos mais pedidos, pedidos por usuário e por dia/semana
+
+Os números saem de tabelas de resumo por dia (e por mês, para produtos), mantidas
+de forma incremental pelo OrderManager (criação, mudança de status e exclusão de
+pedidos) na mesma transação do pedido. As consultas do painel somam as linhas de
+resumo do período em vez de agrupar orders/order_items inteiras.
+
+Pedidos cancelados continuam no resumo por status, mas não contam nos
+rankings de produtos e usuários.
+
+Reconstruir a partir das tabelas de pedidos (e dos arquivados): python analise_pedidos.py --backfill
+Benchmark (um ano sintético, SQLite temporário): python analise_pedidos.py --benchmark
+"""
+if __name__ == '__main__':
+    # Executado diretamente: importa pelo nome do módulo (o app importa este arquivo
+    # via pedidos.py e os modelos não podem ser definidos duas vezes)
+    import argparse
+    import os
+    import tempfile
+
+    parser = argparse.ArgumentParser(description='Resumos de pedidos: reconstrução ou benchmark')
+    parser.add_argument('--backfill', action='store_true', help='recalcula os resumos a partir dos pedidos')
+    parser.add_argument('--benchmark', action='store_true', help='um ano sintético de pedidos num SQLite temporário')
+    parser.add_argument('--dias', type=int, default=365)
+    parser.add_argument('--pedidos-dia', type=int, default=120)
+    args = parser.parse_args()
+
+    if args.benchmark:
+        os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'benchmark.db')
+        os.environ.setdefault('SECRET_KEY', 'benchmark')
+        os.environ.setdefault('SUPABASE_URL', 'http://127.0.0.1:1')
+        os.environ.setdefault('SUPABASE_KEY', 'eyJhbGciOiJIUzI1NiJ9.e30.abc')
+        from analise_pedidos import _benchmark
+        _benchmark(args.dias, args.pedidos_dia)
+    elif args.backfill:
+        from analise_pedidos import app, reconstruir
+        with app.app_context():
+            print(f"Resumos reconstruídos: {reconstruir()} pedidos")
+    else:
+        parser.print_help()
+    raise SystemExit
+
+from app import app, db, admin_required, categoria_required, User
+from flask import render_template, request, session, jsonify
+import json
+from datetime import date, datetime, timedelta
+from itertools import chain
+from sqlalchemy import Column, Integer, String, Float, Date, delete, func, select, union_all
+
+# Dia do pedido no horário de Brasília (created_at é gravado em UTC)
+FUSO_HORARIO = timedelta(hours=-3)
+# Status que não entram nos rankings de produtos e usuários
+STATUS_IGNORADOS = {'cancelado'}
+
+
+class ResumoPedidosDia(db.Model):
+    """Pedidos, itens e valor por dia, setor e status"""
+    __tablename__ = 'order_rollup_dia'
+
+    dia = Column(Date, primary_key=True)
+    categoria_loja = Column(String(20), primary_key=True)
+    status = Column(String(50), primary_key=True)
+    pedidos = Column(Integer, nullable=False, default=0)
+    itens = Column(Integer, nullable=False, default=0)
+    valor = Column(Float, nullable=False, default=0)
+
+
+class ResumoProdutoDia(db.Model):
+    """Quantidade pedida por dia, setor e produto"""
+    __tablename__ = 'order_rollup_produto_dia'
+
+    dia = Column(Date, primary_key=True)
+    categoria_loja = Column(String(20), primary_key=True)
+    product_id = Column(Integer, primary_key=True)
+    product_name = Column(String(200))  # Último nome visto (o produto pode ser renomeado)
+    quantidade = Column(Integer, nullable=False, default=0)
+    pedidos = Column(Integer, nullable=False, default=0)
+    valor = Column(Float, nullable=False, default=0)
+
+
+class ResumoProdutoMes(db.Model):
+    """Mesmo resumo de produtos por mês: períodos longos somam meses inteiros e só as pontas em dias"""
+    __tablename__ = 'order_rollup_produto_mes'
+
+    mes = Column(Date, primary_key=True)  # Primeiro dia do mês
+    categoria_loja = Column(String(20), primary_key=True)
+    product_id = Column(Integer, primary_key=True)
+    product_name = Column(String(200))
+    quantidade = Column(Integer, nullable=False, default=0)
+    pedidos = Column(Integer, nullable=False, default=0)
+    valor = Column(Float, nullable=False, default=0)
+
+
+class ResumoUsuarioDia(db.Model):
+    """Pedidos e itens por dia, setor e usuário"""
+    __tablename__ = 'order_rollup_usuario_dia'
+
+    dia = Column(Date, primary_key=True)
+    categoria_loja = Column(String(20), primary_key=True)
+    user_id = Column(Integer, primary_key=True)
+    pedidos = Column(Integer, nullable=False, default=0)
+    itens = Column(Integer, nullable=False, default=0)
+    valor = Column(Float, nullable=False, default=0)
+
+
+def dia_do_pedido(created_at):
+    return (created_at + FUSO_HORARIO).date()
+
+
+def _por_mes(linhas_produto):
+    """Linhas do resumo diário de produtos convertidas para o mensal"""
+    mensais = []
+    for linha in linhas_produto:
+        linha = dict(linha, mes=linha['dia'].replace(day=1))
+        del linha['dia']
+        mensais.append(linha)
+    return mensais
+
+
+def _somar(modelo, linhas, chaves, valores, substituir=()):
+    """
+    Soma `valores` nas linhas do resumo, criando as que não existem.
+    SQLite e PostgreSQL: um único INSERT ... ON CONFLICT DO UPDATE em lote.
+    Outros bancos: lê e atualiza linha a linha pela sessão.
+    """
+    if not linhas:
+        return
+    dialeto = db.session.get_bind().dialect.name
+    if dialeto in ('sqlite', 'postgresql'):
+        if dialeto == 'sqlite':
+            from sqlalchemy.dialects.sqlite import insert
+        else:
+            from sqlalchemy.dialects.postgresql import insert
+        stmt = insert(modelo)
+        atualizar = {v: getattr(modelo, v) + getattr(stmt.excluded, v) for v in valores}
+        atualizar.update({c: getattr(stmt.excluded, c) for c in substituir})
+        db.session.execute(stmt.on_conflict_do_update(index_elements=chaves, set_=atualizar), linhas)
+        return
+
+    for linha in linhas:
+        atual = db.session.get(modelo, tuple(linha[c] for c in chaves))
+        if atual is None:
+            db.session.add(modelo(**linha))
+            continue
+        for v in valores:
+            setattr(atual, v, getattr(atual, v) + linha[v])
+        for c in substituir:
+            setattr(atual, c, linha[c])
+    db.session.flush()
+
+
+def _contribuicao(pedido, itens, sinal, status, rankings=True):
+    """
+    Soma (sinal=1) ou retira (sinal=-1) um pedido dos resumos.
+    pedido: {'user_id', 'categoria_loja', 'created_at'}; itens: dicts com
+    product_id, product_name, quantity e unit_price
+    """
+    dia = dia_do_pedido(pedido['created_at'])
+    setor = pedido['categoria_loja'] or ''
+
+    total_itens = 0
+    valor_total = 0.0
+    produtos = {}
+    for item in itens:
+        quantidade = item['quantity'] or 0
+        valor = (item['unit_price'] or 0) * quantidade
+        total_itens += quantidade
+        valor_total += valor
+        linha = produtos.get(item['product_id'])
+        if linha is None:
+            produtos[item['product_id']] = {
+                'dia': dia, 'categoria_loja': setor, 'product_id': item['product_id'],
+                'product_name': item['product_name'], 'quantidade': sinal * quantidade,
+                'pedidos': sinal, 'valor': sinal * valor}
+        else:
+            linha['quantidade'] += sinal * quantidade
+            linha['valor'] += sinal * valor
+
+    _somar(ResumoPedidosDia, [{'dia': dia, 'categoria_loja': setor, 'status': status or '', 'pedidos': sinal,
+                               'itens': sinal * total_itens, 'valor': sinal * valor_total}],
+           ['dia', 'categoria_loja', 'status'], ['pedidos', 'itens', 'valor'])
+    if rankings:
+        _somar(ResumoProdutoDia, list(produtos.values()), ['dia', 'categoria_loja', 'product_id'],
+               ['quantidade', 'pedidos', 'valor'], substituir=['product_name'])
+        _somar(ResumoProdutoMes, _por_mes(produtos.values()), ['mes', 'categoria_loja', 'product_id'],
+               ['quantidade', 'pedidos', 'valor'], substituir=['product_name'])
+        _somar(ResumoUsuarioDia, [{'dia': dia, 'categoria_loja': setor, 'user_id': pedido['user_id'],
+                                   'pedidos': sinal, 'itens': sinal * total_itens, 'valor': sinal * valor_total}],
+               ['dia', 'categoria_loja', 'user_id'], ['pedidos', 'itens', 'valor'])
+
+    if sinal < 0:
+        # Linhas que zeraram não aparecem mais nos rankings
+        for modelo in (ResumoPedidosDia, ResumoProdutoDia, ResumoUsuarioDia):
+            db.session.execute(delete(modelo).where(modelo.dia == dia, modelo.pedidos <= 0))
+        db.session.execute(delete(ResumoProdutoMes).where(ResumoProdutoMes.mes == dia.replace(day=1),
+                                                          ResumoProdutoMes.pedidos <= 0))
+
+
+def _dados_pedido(order):
+    return {'user_id': order.user_id, 'categoria_loja': order.categoria_loja, 'created_at': order.created_at}
+
+
+def registrar_pedido(order, itens):
+    """Pedido novo (chamado pelo OrderManager antes do commit)"""
+    _contribuicao(_dados_pedido(order), itens, 1, order.status,
+                  rankings=order.status not in STATUS_IGNORADOS)
+
+
+def remover_pedido(order, itens):
+    """Pedido excluído (chamado pelo OrderManager antes do commit)"""
+    _contribuicao(_dados_pedido(order), itens, -1, order.status,
+                  rankings=order.status not in STATUS_IGNORADOS)
+
+
+def mudar_status(order, itens, anterior):
+    """Pedido que mudou de `anterior` para order.status"""
+    if anterior == order.status:
+        return
+    dados = _dados_pedido(order)
+    contava = anterior not in STATUS_IGNORADOS
+    conta = order.status not in STATUS_IGNORADOS
+    _contribuicao(dados, itens, -1, anterior, rankings=contava and not conta)
+    _contribuicao(dados, itens, 1, order.status, rankings=conta and not contava)
+
+
+# Consultas do painel (setor None = todos; inicio/fim são datas inclusivas)
+def _filtrar(consulta, modelo, setor, inicio, fim):
+    if setor:
+        consulta = consulta.where(modelo.categoria_loja == setor)
+    if inicio:
+        consulta = consulta.where(modelo.dia >= inicio)
+    if fim:
+        consulta = consulta.where(modelo.dia <= fim)
+    return consulta
+
+
+def _dividir_periodo(inicio, fim):
+    """
+    Divide [inicio, fim] em meses inteiros e pontas em dias.
+    Retorna (meses, pontas): meses é None ou (primeiro_mes, fim_exclusivo), com None
+    nos limites abertos; pontas é uma lista de (de, ate) em dias.
+    """
+    primeiro_mes = inicio
+    if inicio is not None and inicio.day != 1:
+        primeiro_mes = (inicio.replace(day=28) + timedelta(days=4)).replace(day=1)
+    fim_meses = None
+    if fim is not None:
+        seguinte = fim + timedelta(days=1)
+        fim_meses = seguinte if seguinte.day == 1 else fim.replace(day=1)
+
+    if primeiro_mes is not None and fim_meses is not None and primeiro_mes >= fim_meses:
+        return None, [(inicio, fim)]
+    pontas = []
+    if inicio is not None and inicio < primeiro_mes:
+        pontas.append((inicio, primeiro_mes - timedelta(days=1)))
+    if fim is not None and fim_meses <= fim:
+        pontas.append((fim_meses, fim))
+    return (primeiro_mes, fim_meses), pontas
+
+
+def top_produtos(setor=None, inicio=None, fim=None, limite=20):
+    """Produtos mais pedidos no período (por quantidade); meses inteiros vêm do resumo mensal"""
+    meses, pontas = _dividir_periodo(inicio, fim)
+
+    partes = [_filtrar(select(ResumoProdutoDia.product_id, ResumoProdutoDia.product_name,
+                              ResumoProdutoDia.quantidade, ResumoProdutoDia.pedidos, ResumoProdutoDia.valor),
+                       ResumoProdutoDia, setor, de, ate) for de, ate in pontas]
+    if meses:
+        mensal = select(ResumoProdutoMes.product_id, ResumoProdutoMes.product_name, ResumoProdutoMes.quantidade,
+                        ResumoProdutoMes.pedidos, ResumoProdutoMes.valor)
+        if setor:
+            mensal = mensal.where(ResumoProdutoMes.categoria_loja == setor)
+        if meses[0] is not None:
+            mensal = mensal.where(ResumoProdutoMes.mes >= meses[0])
+        if meses[1] is not None:
+            mensal = mensal.where(ResumoProdutoMes.mes < meses[1])
+        partes.append(mensal)
+
+    linhas = (partes[0] if len(partes) == 1 else union_all(*partes)).subquery()
+    quantidade = func.sum(linhas.c.quantidade)
+    consulta = select(linhas.c.product_id, func.max(linhas.c.product_name).label('product_name'),
+                      quantidade.label('quantidade'), func.sum(linhas.c.pedidos).label('pedidos'),
+                      func.sum(linhas.c.valor).label('valor')) \
+        .group_by(linhas.c.product_id) \
+        .order_by(quantidade.desc(), linhas.c.product_id).limit(limite)
+    return [dict(linha) for linha in db.session.execute(consulta).mappings()]
+
+
+def por_usuario(setor=None, inicio=None, fim=None, limite=50):
+    """Pedidos e itens por usuário no período (quem mais pede primeiro)"""
+    pedidos = func.sum(ResumoUsuarioDia.pedidos)
+    consulta = select(ResumoUsuarioDia.user_id, User.username, pedidos.label('pedidos'),
+                      func.sum(ResumoUsuarioDia.itens).label('itens'),
+                      func.sum(ResumoUsuarioDia.valor).label('valor')) \
+        .outerjoin(User, User.id == ResumoUsuarioDia.user_id)
+    consulta = _filtrar(consulta, ResumoUsuarioDia, setor, inicio, fim) \
+        .group_by(ResumoUsuarioDia.user_id, User.username) \
+        .order_by(pedidos.desc(), ResumoUsuarioDia.user_id).limit(limite)
+    return [dict(linha, username=linha['username'] or 'Desconhecido')
+            for linha in db.session.execute(consulta).mappings()]
+
+
+def serie(setor=None, inicio=None, fim=None, periodo='dia'):
+    """Pedidos por dia ou por semana (semana começando na segunda), com a quebra por status"""
+    consulta = select(ResumoPedidosDia.dia, ResumoPedidosDia.status,
+                      func.sum(ResumoPedidosDia.pedidos).label('pedidos'),
+                      func.sum(ResumoPedidosDia.itens).label('itens'),
+                      func.sum(ResumoPedidosDia.valor).label('valor'))
+    consulta = _filtrar(consulta, ResumoPedidosDia, setor, inicio, fim) \
+        .group_by(ResumoPedidosDia.dia, ResumoPedidosDia.status).order_by(ResumoPedidosDia.dia)
+
+    pontos = {}
+    for linha in db.session.execute(consulta):
+        chave = linha.dia - timedelta(days=linha.dia.weekday()) if periodo == 'semana' else linha.dia
+        ponto = pontos.setdefault(chave, {'inicio': chave, 'pedidos': 0, 'itens': 0, 'valor': 0.0,
+                                          'por_status': {}})
+        ponto['por_status'][linha.status] = ponto['por_status'].get(linha.status, 0) + linha.pedidos
+        if linha.status not in STATUS_IGNORADOS:
+            ponto['pedidos'] += linha.pedidos
+            ponto['itens'] += linha.itens
+            ponto['valor'] += linha.valor
+    return list(pontos.values())
+
+
+def _lotes_pedidos(tamanho_lote):
+    """Pedidos de orders/order_items em lotes por id: (pedidos, {order_id: itens})"""
+    from pedidos import Order, OrderItem
+
+    ultimo_id = 0
+    while True:
+        pedidos = db.session.execute(
+            select(Order.id, Order.user_id, Order.categoria_loja, Order.created_at, Order.status)
+            .where(Order.id > ultimo_id).order_by(Order.id).limit(tamanho_lote)).mappings().all()
+        if not pedidos:
+            return
+        ultimo_id = pedidos[-1]['id']
+
+        itens = {}
+        consulta_itens = select(OrderItem.order_id, OrderItem.product_id, OrderItem.product_name,
+                                OrderItem.quantity, OrderItem.unit_price) \
+            .where(OrderItem.order_id.in_([p['id'] for p in pedidos]))
+        for item in db.session.execute(consulta_itens).mappings():
+            itens.setdefault(item['order_id'], []).append(item)
+        yield pedidos, itens
+
+
+def _lotes_arquivados(tamanho_lote):
+    """Pedidos de orders_archive em lotes por id, com os itens lidos de items_json"""
+    from pedidos import OrderArchive
+
+    ultimo_id = 0
+    while True:
+        pedidos = db.session.execute(
+            select(OrderArchive.id, OrderArchive.user_id, OrderArchive.categoria_loja,
+                   OrderArchive.created_at, OrderArchive.status, OrderArchive.items_json)
+            .where(OrderArchive.id > ultimo_id).order_by(OrderArchive.id).limit(tamanho_lote)).mappings().all()
+        if not pedidos:
+            return
+        ultimo_id = pedidos[-1]['id']
+
+        # items_json: [[product_id, product_name, product_brand, quantity, unit_price, notes], ...]
+        itens = {p['id']: [{'product_id': i[0], 'product_name': i[1], 'quantity': i[3], 'unit_price': i[4]}
+                           for i in json.loads(p['items_json'] or '[]')]
+                 for p in pedidos}
+        yield pedidos, itens
+
+
+def reconstruir(tamanho_lote=2000):
+    """
+    Apaga os resumos e recalcula a partir de orders/order_items e dos pedidos
+    arquivados em orders_archive (backfill), lendo os pedidos em lotes por id.
+    Retorna o número de pedidos processados.
+    """
+    for modelo in (ResumoPedidosDia, ResumoProdutoDia, ResumoProdutoMes, ResumoUsuarioDia):
+        db.session.execute(delete(modelo))
+
+    total = 0
+    # Arquivados saíram de orders, mas continuam nos resumos (o arquivamento não os retira)
+    for pedidos, itens in chain(_lotes_pedidos(tamanho_lote), _lotes_arquivados(tamanho_lote)):
+        # Agrega o lote inteiro antes de gravar: um upsert por tabela por lote
+        resumos = {ResumoPedidosDia: {}, ResumoProdutoDia: {}, ResumoProdutoMes: {}, ResumoUsuarioDia: {}}
+
+        def acumular(modelo, chave, linha, valores):
+            atual = resumos[modelo].get(chave)
+            if atual is None:
+                resumos[modelo][chave] = linha
+            else:
+                for v in valores:
+                    atual[v] += linha[v]
+
+        for pedido in pedidos:
+            dia = dia_do_pedido(pedido['created_at'])
+            setor = pedido['categoria_loja'] or ''
+            status = pedido['status'] or ''
+            itens_pedido = itens.get(pedido['id'], [])
+            quantidade = sum(i['quantity'] or 0 for i in itens_pedido)
+            valor = sum((i['unit_price'] or 0) * (i['quantity'] or 0) for i in itens_pedido)
+
+            acumular(ResumoPedidosDia, (dia, setor, status),
+                     {'dia': dia, 'categoria_loja': setor, 'status': status, 'pedidos': 1,
+                      'itens': quantidade, 'valor': valor}, ('pedidos', 'itens', 'valor'))
+            if status in STATUS_IGNORADOS:
+                continue
+            acumular(ResumoUsuarioDia, (dia, setor, pedido['user_id']),
+                     {'dia': dia, 'categoria_loja': setor, 'user_id': pedido['user_id'], 'pedidos': 1,
+                      'itens': quantidade, 'valor': valor}, ('pedidos', 'itens', 'valor'))
+            vistos = set()
+            for item in itens_pedido:
+                chave = (dia, setor, item['product_id'])
+                acumular(ResumoProdutoDia, chave,
+                         {'dia': dia, 'categoria_loja': setor, 'product_id': item['product_id'],
+                          'product_name': item['product_name'], 'quantidade': item['quantity'] or 0,
+                          'pedidos': 0 if chave in vistos else 1,
+                          'valor': (item['unit_price'] or 0) * (item['quantity'] or 0)},
+                         ('quantidade', 'pedidos', 'valor'))
+                vistos.add(chave)
+                chave_mes = (dia.replace(day=1), setor, item['product_id'])
+                acumular(ResumoProdutoMes, chave_mes,
+                         {'mes': chave_mes[0], 'categoria_loja': setor, 'product_id': item['product_id'],
+                          'product_name': item['product_name'], 'quantidade': item['quantity'] or 0,
+                          'pedidos': 0 if chave_mes in vistos else 1,
+                          'valor': (item['unit_price'] or 0) * (item['quantity'] or 0)},
+                         ('quantidade', 'pedidos', 'valor'))
+                vistos.add(chave_mes)
+
+        _somar(ResumoPedidosDia, list(resumos[ResumoPedidosDia].values()),
+               ['dia', 'categoria_loja', 'status'], ['pedidos', 'itens', 'valor'])
+        _somar(ResumoProdutoDia, list(resumos[ResumoProdutoDia].values()),
+               ['dia', 'categoria_loja', 'product_id'], ['quantidade', 'pedidos', 'valor'],
+               substituir=['product_name'])
+        _somar(ResumoProdutoMes, list(resumos[ResumoProdutoMes].values()),
+               ['mes', 'categoria_loja', 'product_id'], ['quantidade', 'pedidos', 'valor'],
+               substituir=['product_name'])
+        _somar(ResumoUsuarioDia, list(resumos[ResumoUsuarioDia].values()),
+               ['dia', 'categoria_loja', 'user_id'], ['pedidos', 'itens', 'valor'])
+        total += len(pedidos)
+
+    db.session.commit()
+    return total
+
+
+# Rotas
+def _periodo_da_requisicao():
+    """inicio/fim (YYYY-MM-DD) e periodo da query string; padrão: últimos 30 dias por dia"""
+    hoje = dia_do_pedido(datetime.utcnow())
+    fim = date.fromisoformat(request.args['fim']) if request.args.get('fim') else hoje
+    inicio = date.fromisoformat(request.args['inicio']) if request.args.get('inicio') else fim - timedelta(days=29)
+    periodo = request.args.get('periodo', 'dia')
+    if periodo not in ('dia', 'semana') or inicio > fim:
+        raise ValueError('Período inválido')
+    return inicio, fim, periodo
+
+
+def _analise(setor, inicio, fim, periodo):
+    return {
+        'inicio': inicio.isoformat(),
+        'fim': fim.isoformat(),
+        'periodo': periodo,
+        'top_produtos': top_produtos(setor, inicio, fim),
+        'usuarios': por_usuario(setor, inicio, fim),
+        'serie': [dict(p, inicio=p['inicio'].isoformat()) for p in serie(setor, inicio, fim, periodo)]
+    }
+
+
+@app.route('/admin/pedidos/analise')
+@admin_required
+@categoria_required
+def admin_analise_pedidos():
+    try:
+        inicio, fim, periodo = _periodo_da_requisicao()
+    except ValueError:
+        inicio, fim, periodo = dia_do_pedido(datetime.utcnow()) - timedelta(days=29), \
+            dia_do_pedido(datetime.utcnow()), 'dia'
+    analise = _analise(session.get('categoria_loja'), inicio, fim, periodo)
+    categoria_nome = 'Automotivo' if session.get('categoria_loja') == 'automotivo' else 'Imobiliário'
+    return render_template('admin/analise_pedidos.html', analise=analise, categoria_nome=categoria_nome)
+
+
+@app.route('/admin/api/pedidos/analise')
+@admin_required
+@categoria_required
+def admin_analise_pedidos_api():
+    try:
+        inicio, fim, periodo = _periodo_da_requisicao()
+    except ValueError:
+        return jsonify({'error': 'Período inválido (use inicio/fim no formato AAAA-MM-DD)'}), 400
+    return jsonify(_analise(session.get('categoria_loja'), inicio, fim, periodo))
+
+
+def _benchmark(dias, pedidos_dia):
+    import random
+    import time
+    from sqlalchemy import insert
+    from pedidos import Order, OrderItem, OrderManager
+
+    aleatorio = random.Random(42)
+    with app.app_context():
+        db.create_all()
+        db.session.execute(insert(User), [{'username': f'balconista{i}', 'password': 'x'} for i in range(40)])
+        usuarios = db.session.scalars(select(User.id)).all()
+        produtos = {pid: {'id': pid, 'name': f'Produto {pid}', 'brand': 'Coral',
+                          'em_queima_estoque': pid % 10 == 0, 'preco_queima': 49.9}
+                    for pid in range(1, 3001)}
+        ids_produtos = list(produtos)
+        pesos = [1 / (i + 1) for i in range(len(ids_produtos))]  # Poucos produtos concentram os pedidos
+
+        # Um ano de pedidos gravados direto nas tabelas (sem resumos)
+        fim = datetime(2025, 12, 31, 12)
+        inicio_carga = time.perf_counter()
+        total_itens = 0
+        for d in range(dias):
+            dia = fim - timedelta(days=dias - 1 - d)
+            pedidos = [{'user_id': aleatorio.choice(usuarios), 'categoria_loja': 'automotivo',
+                        'status': aleatorio.choice(['finalizado'] * 8 + ['pendente', 'cancelado']),
+                        'total_items': 0, 'created_at': dia + timedelta(minutes=aleatorio.randrange(600))}
+                       for _ in range(pedidos_dia)]
+            ids = db.session.scalars(insert(Order).returning(Order.id), pedidos).all()
+            itens = []
+            for order_id in ids:
+                for pid in set(aleatorio.choices(ids_produtos, pesos, k=aleatorio.randint(1, 15))):
+                    p = produtos[pid]
+                    itens.append({'order_id': order_id, 'product_id': pid, 'product_name': p['name'],
+                                  'product_brand': 'Coral', 'quantity': aleatorio.randint(1, 12),
+                                  'unit_price': p['preco_queima'] if p['em_queima_estoque'] else None})
+            db.session.execute(insert(OrderItem), itens)
+            total_itens += len(itens)
+        db.session.commit()
+        print(f"{dias * pedidos_dia} pedidos / {total_itens} itens em {dias} dias "
+              f"(carga {time.perf_counter() - inicio_carga:.1f}s)")
+
+        t = time.perf_counter()
+        reconstruir()
+        linhas = sum(db.session.scalar(select(func.count()).select_from(m))
+                     for m in (ResumoPedidosDia, ResumoProdutoDia, ResumoProdutoMes, ResumoUsuarioDia))
+        print(f"Backfill: {time.perf_counter() - t:.1f}s ({linhas} linhas de resumo)")
+
+        ultimo = dia_do_pedido(fim)
+        ano = (ultimo - timedelta(days=dias - 1), ultimo)
+
+        def medir(nome, funcao, repeticoes=5):
+            t = time.perf_counter()
+            for _ in range(repeticoes):
+                funcao()
+            print(f"{nome:<44} {(time.perf_counter() - t) / repeticoes * 1000:8.1f} ms")
+
+        quantidade = func.sum(OrderItem.quantity)
+        medir('GROUP BY nas tabelas: top produtos (ano)', lambda: db.session.execute(
+            select(OrderItem.product_id, quantidade).join(Order, Order.id == OrderItem.order_id)
+            .where(Order.categoria_loja == 'automotivo', Order.status != 'cancelado')
+            .group_by(OrderItem.product_id).order_by(quantidade.desc()).limit(20)).all())
+        medir('resumo: top produtos (ano)', lambda: top_produtos('automotivo', *ano))
+        medir('GROUP BY nas tabelas: por usuário (ano)', lambda: db.session.execute(
+            select(Order.user_id, func.count()).where(Order.categoria_loja == 'automotivo',
+                                                      Order.status != 'cancelado')
+            .group_by(Order.user_id)).all())
+        medir('resumo: por usuário (ano)', lambda: por_usuario('automotivo', *ano))
+        medir('resumo: série semanal (ano)', lambda: serie('automotivo', *ano, periodo='semana'))
+        medir('resumo: top produtos (30 dias)', lambda: top_produtos('automotivo', ultimo - timedelta(days=29), ultimo))
+
+        # Custo da manutenção incremental num pedido novo de 15 itens
+        itens_pedido = [{'product_id': pid, 'quantity': 2} for pid in ids_produtos[:15]]
+        t = time.perf_counter()
+        for _ in range(50):
+            OrderManager.create_order(usuarios[0], itens_pedido, produtos=produtos, categoria_loja='automotivo')
+        print(f"{'create_order (15 itens, com resumos)':<44} {(time.perf_counter() - t) / 50 * 1000:8.1f} ms")
@@ -1,14 +1,37 @@
-from flask import Flask, render_template, request, redirect, url_for, session, flash, jsonify
+from flask import (Flask, Response, render_template, request, redirect, url_for, session, flash, jsonify,
+                   g, has_request_context)
 from flask_sqlalchemy import SQLAlchemy
 from werkzeug.security import generate_password_hash, check_password_hash
 from werkzeug.utils import secure_filename
+from werkzeug.middleware.proxy_fix import ProxyFix
 from functools import wraps
-from fuzzywuzzy import fuzz
-from supabase import create_client, Client
+from supabase import Client
+from cliente_supabase import CircuitoAberto, criar_cliente
+from cache_catalogo import CatalogoCache
+from repositorio_catalogo import CatalogoRepositorio
+from busca_catalogo import IndiceNomes
+from busca_fuzzy import MotorBuscaFuzzy
+from normalizacao import normalizar, anotar_chaves_busca
+from catalogo import (SnapshotCatalogo, GrafoRelacionados, ListagemAdmin, extrair_marca,
+                      separar_nome_marca, ids_relacionados, lista_ids_relacionados,
+                      codificar_cursor, decodificar_cursor)
+from delta_catalogo import HistoricoCatalogo
+from eventos_catalogo import ServidorEventos
+from queima_lote import aplicar_lote, validar_itens, validar_precos, MAX_ITENS
+from importacao_catalogo import ErroImportacao, ler_planilha, importar, exportar_csv
+from estatisticas import EstatisticasAdmin
+from imagens_produto import ProcessadorImagens, copiar_com_hash, validar_imagem
+from fila_tarefas import FilaTarefas
 import os
+import sys
 from datetime import datetime
+import tempfile
+import threading
 import time
-import uuid
+try:
+    import fcntl  # Trava entre processos (Linux/Hostinger); no Windows o Waitress roda num processo só
+except ImportError:
+    fcntl = None
 
 app = Flask(__name__)
 
@@ -21,14 +44,151 @@ else:
     from config import DevelopmentConfig
     app.config.from_object(DevelopmentConfig)
 
+# Atrás do proxy da Hostinger: esquema, host e IP vêm dos cabeçalhos X-Forwarded-*
+if app.config['PROXY_SALTOS']:
+    saltos = app.config['PROXY_SALTOS']
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=saltos, x_proto=saltos, x_host=saltos)
+
 # Criar pasta de uploads se não existir
 os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
+# Fotos recebidas aguardando a fila (fora do /tmp para sobreviver a reinícios)
+FOTOS_PENDENTES = os.path.join(app.instance_path, 'fotos_pendentes')
+os.makedirs(FOTOS_PENDENTES, exist_ok=True)
 
 db = SQLAlchemy(app)
 
 # Inicializar Supabase
-supabase: Client = create_client(app.config['SUPABASE_URL'], app.config['SUPABASE_KEY'])
+# Pool compartilhado, timeouts, repetição de leituras e disjuntor (cliente_supabase.py)
+supabase: Client = criar_cliente(app.config['SUPABASE_URL'], app.config['SUPABASE_KEY'],
+                                 conexoes=app.config['SUPABASE_CONEXOES'],
+                                 timeout=app.config['SUPABASE_TIMEOUT'],
+                                 prazo=app.config['SUPABASE_PRAZO'],
+                                 tentativas=app.config['SUPABASE_TENTATIVAS'],
+                                 falhas_disjuntor=app.config['SUPABASE_DISJUNTOR_FALHAS'],
+                                 espera_disjuntor=app.config['SUPABASE_DISJUNTOR_ESPERA'])
 SUPABASE_BUCKET = os.getenv('SUPABASE_BUCKET', 'produtos')
+SETORES = ['automotivo', 'imobiliario']
+
+# Leituras da tabela produtos (páginas buscadas em paralelo)
+catalogo_repo = CatalogoRepositorio(supabase, max_workers=app.config['CATALOGO_PAGINAS_PARALELAS'])
+
+# Cache do catálogo por setor (invalidado nas escritas do admin)
+catalogo_cache = CatalogoCache(ttl=app.config['CATALOGO_CACHE_TTL'],
+                               max_setores=app.config['CATALOGO_CACHE_MAX_SETORES'],
+                               max_desatualizado=app.config['CATALOGO_MAX_DESATUALIZADO'])
+
+# Deltas entre versões do catálogo (por processo)
+historico_catalogo = HistoricoCatalogo(max_versoes=app.config['CATALOGO_DELTA_VERSOES'])
+
+# Eventos para as abas da vitrine (iniciado pelo wsgi.py quando EVENTOS_PORTA > 0)
+eventos_catalogo = ServidorEventos(app.config['SECRET_KEY'], porta=app.config['EVENTOS_PORTA'])
+
+def carregar_produtos_supabase(categoria):
+    """Busca TODOS os produtos do setor no Supabase (todas as colunas, ordenados por nome)"""
+    # O catálogo em cache atende todas as telas; usa '*' porque a coluna de imagem
+    # pode se chamar 'imagem' ou 'image' dependendo do projeto no Supabase
+    produtos = catalogo_repo.listar(categoria, colunas='*', ordem='nome')
+    # Normaliza os nomes uma única vez por carga: nenhuma busca volta a tocar no nome cru
+    return anotar_chaves_busca(produtos)
+
+def entrada_do_setor(categoria):
+    """Catálogo do setor em cache; marca a requisição quando é uma cópia antiga (Supabase fora)"""
+    entrada = catalogo_cache.obter_entrada(categoria, carregar_produtos_supabase)
+    if entrada.desatualizada and has_request_context():
+        g.catalogo_desatualizado = True
+    return entrada
+
+def produtos_do_setor(categoria):
+    """Produtos do setor (ordenados por nome) servidos a partir do cache"""
+    return entrada_do_setor(categoria).produtos
+
+def derivado_do_setor(categoria, nome, construir):
+    """Estrutura construída sobre o catálogo em cache (uma vez por carga do setor)"""
+    return entrada_do_setor(categoria).derivado(nome, construir)
+
+def catalogo_alterado(categoria, evento='catalogo', **dados):
+    """Descarta o cache do setor e avisa as abas abertas da vitrine"""
+    catalogo_cache.invalidar(categoria)
+    estatisticas_admin.invalidar(categoria)
+    eventos_catalogo.publicar(categoria, evento, dados)
+
+# Escritas lentas no Supabase rodam na fila; as rotas só enfileiram (threads iniciadas no primeiro uso
+# e por iniciar_servicos(), que retoma o que ficou pendente de antes do reinício)
+fila_tarefas = FilaTarefas(app.config['FILA_TAREFAS_DB'] or os.path.join(app.instance_path, 'tarefas.db'),
+                           workers=app.config['FILA_TAREFAS_WORKERS'],
+                           max_tentativas=app.config['FILA_TAREFAS_TENTATIVAS'])
+
+# Fotos: versões thumb/card/full geradas e enviadas ao Storage pela fila
+processador_imagens = ProcessadorImagens(supabase, SUPABASE_BUCKET,
+                                         ao_concluir=lambda setor, produto_id: catalogo_alterado(setor, id=produto_id))
+
+@fila_tarefas.tarefa('foto_produto', ao_desistir=lambda dados: processador_imagens.descartar(dados['caminho']))
+def tarefa_foto_produto(dados):
+    return processador_imagens.processar(**dados)
+
+def enfileirar_foto(categoria, produto_id, caminho, campo_imagem, content_type, sha):
+    """Uma foto repetida não precisa de chave: o Storage já deduplica pelo hash do conteúdo"""
+    return fila_tarefas.enfileirar('foto_produto', {
+        'setor': categoria, 'produto_id': produto_id, 'caminho': caminho,
+        'campo_imagem': campo_imagem, 'content_type': content_type, 'sha': sha
+    }, setor=categoria)
+
+@fila_tarefas.tarefa('limpar_relacionados')
+def tarefa_limpar_relacionados(dados):
+    """Um update por valor novo de produto_relacionado_ids; repetir tudo numa nova tentativa é seguro"""
+    for valores, ids in dados['limpezas']:
+        supabase.table('produtos').update(valores).in_('id', ids).execute()
+    catalogo_alterado(dados['setor'])
+    return {'atualizados': sum(len(ids) for _, ids in dados['limpezas'])}
+
+@fila_tarefas.tarefa('queima_lote')
+def tarefa_queima_lote(dados):
+    resultados = aplicar_lote(supabase, catalogo_repo, dados['setor'], dados['itens'])
+    sucesso = sum(1 for r in resultados if r['success'])
+    if sucesso:
+        catalogo_alterado(dados['setor'])
+    print(f"Queima em lote - {sucesso} de {len(resultados)} itens atualizados")
+    return {'success': sucesso == len(resultados), 'atualizados': sucesso, 'resultados': resultados}
+
+def chave_idempotencia(prefixo):
+    """Chave da tarefa a partir do cabeçalho Idempotency-Key (repetir a requisição não repete a tarefa)"""
+    chave = request.headers.get('Idempotency-Key', '').strip()
+    return f"{prefixo}:{session.get('categoria_loja')}:{chave[:100]}" if chave else None
+
+def arquivo_foto_pendente(nome_enviado):
+    """Arquivo vazio em FOTOS_PENDENTES, com a extensão do nome enviado pelo navegador"""
+    extensao = os.path.splitext(secure_filename(nome_enviado))[1]
+    descritor, caminho = tempfile.mkstemp(prefix='foto_', suffix=extensao, dir=FOTOS_PENDENTES)
+    os.close(descritor)
+    return caminho
+
+def receber_foto(imagem_file):
+    """
+    Copia o upload em blocos para um arquivo temporário, calculando o SHA-256 no caminho,
+    e confere se é imagem. Retorna (caminho, sha); ValueError se não for imagem
+    """
+    caminho = arquivo_foto_pendente(imagem_file.filename)
+    try:
+        sha = copiar_com_hash(imagem_file.stream, caminho)
+        validar_imagem(caminho)
+    except Exception:
+        os.remove(caminho)
+        raise
+    return caminho, sha
+
+def snapshot_do_setor(categoria, entrada=None):
+    """
+    Snapshot do setor; cada snapshot novo entra no histórico de versões (deltas).
+    Com `entrada`, usa essa carga do cache (para combinar com outras estruturas dela)
+    """
+    def construir(produtos):
+        snapshot = SnapshotCatalogo(produtos)
+        historico_catalogo.registrar(categoria, snapshot)
+        snapshot.preparar_payload()
+        return snapshot
+    if entrada is None:
+        return derivado_do_setor(categoria, 'snapshot', construir)
+    return entrada.derivado('snapshot', construir)
 
 # Models
 class User(db.Model):
@@ -39,6 +199,9 @@ class User(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
 class Product(db.Model):
+    """Espelho local da tabela produtos do Supabase (preenchido por sync_catalogo.py)"""
+    __table_args__ = (db.Index('ix_product_categoria_nome', 'categoria_loja', 'name'),)
+
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(200), nullable=False)
     brand = db.Column(db.String(100), nullable=False)
@@ -46,15 +209,47 @@ class Product(db.Model):
     image = db.Column(db.String(300))
     categoria_loja = db.Column(db.String(20), nullable=False, default='automotivo', index=True)  # 'automotivo' ou 'imobiliario'
     related_product_id = db.Column(db.Integer, db.ForeignKey('product.id'), nullable=True)  # Catalisador/produto relacionado
+    related_product_ids = db.Column(db.String(500))  # IDs separados por vírgula (produto_relacionado_ids)
+    em_queima_estoque = db.Column(db.Boolean, default=False)
+    preco_original = db.Column(db.Float)
+    preco_queima = db.Column(db.Float)
+    supabase_updated_at = db.Column(db.String(40))  # Marca d'água da sincronização
+    search_key = db.Column(db.String(200))  # Nome normalizado (sem acentos, minúsculo)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
     # Relacionamento para obter o produto relacionado
     related_product = db.relationship('Product', remote_side=[id], foreign_keys=[related_product_id])
 
+class SyncCatalogo(db.Model):
+    """Estado da sincronização do catálogo por setor"""
+    setor = db.Column(db.String(20), primary_key=True)
+    coluna_watermark = db.Column(db.String(40))  # 'updated_at' ou 'id'
+    watermark = db.Column(db.String(40))
+    versao = db.Column(db.Integer, default=0, nullable=False)  # Incrementa a cada mudança aplicada
+    ultima_sync = db.Column(db.DateTime)
+    ultima_sync_completa = db.Column(db.DateTime)
+
 class AdminConfig(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     whatsapp_number = db.Column(db.String(20), nullable=False)
 
+def calcular_estatisticas(categoria):
+    """Contadores do painel a partir do catálogo em cache (sem count='exact' no Supabase)"""
+    with app.app_context():
+        produtos = produtos_do_setor(categoria)
+        sync = db.session.get(SyncCatalogo, categoria)
+        return {
+            'total_produtos': len(produtos),
+            'em_queima': sum(1 for p in produtos if p.get('em_queima_estoque')),
+            'sem_imagem': sum(1 for p in produtos if not (p.get('imagem') or p.get('image'))),
+            'total_usuarios': User.query.filter_by(is_admin=False).count(),
+            'versao_catalogo': snapshot_do_setor(categoria).versao,
+            'ultima_sync': sync.ultima_sync if sync else None
+        }
+
+# Contadores do painel por setor (atualizados em segundo plano)
+estatisticas_admin = EstatisticasAdmin(calcular_estatisticas, ttl=app.config['ESTATISTICAS_TTL'])
+
 # Decoradores
 def login_required(f):
     @wraps(f)
@@ -85,6 +280,22 @@ def categoria_required(f):
         return f(*args, **kwargs)
     return decorated_function
 
+@app.after_request
+def sinalizar_catalogo_desatualizado(response):
+    """Respostas montadas com a cópia antiga do catálogo levam X-Catalogo-Desatualizado: 1"""
+    if g.get('catalogo_desatualizado'):
+        response.headers['X-Catalogo-Desatualizado'] = '1'
+    return response
+
+SUPABASE_INDISPONIVEL = 'Servidor de produtos indisponível no momento. Tente novamente em instantes.'
+
+@app.errorhandler(CircuitoAberto)
+def supabase_indisponivel(e):
+    """Disjuntor aberto: responde na hora em vez de prender a thread esperando o Supabase"""
+    if request.path.startswith(('/api/', '/admin/api/')) or request.is_json:
+        return jsonify({'error': SUPABASE_INDISPONIVEL}), 503, {'Retry-After': '30'}
+    return SUPABASE_INDISPONIVEL, 503, {'Retry-After': '30', 'Content-Type': 'text/plain; charset=utf-8'}
+
 # Rotas públicas
 @app.route('/selecionar-setor')
 @login_required
@@ -94,7 +305,7 @@ def selecionar_setor():
 @app.route('/set-setor/<categoria>')
 @login_required
 def set_setor(categoria):
-    if categoria in ['automotivo', 'imobiliario']:
+    if categoria in SETORES:
         session['categoria_loja'] = categoria
         # Se for admin, vai para o dashboard admin
         if session.get('is_admin'):
@@ -109,49 +320,77 @@ def set_setor(categoria):
 def index():
     categoria = session.get('categoria_loja')
 
-    # Buscar TODOS os produtos do Supabase com paginação (limite padrão é 1000)
-    produtos_supabase = []
-    page = 0
-    page_size = 1000
-    
-    while True:
-        response = supabase.table('produtos').select('*').eq('setor', categoria) \
-            .range(page * page_size, (page + 1) * page_size - 1).execute()
-        
-        if not response.data:
-            break
-            
-        produtos_supabase.extend(response.data)
-        page += 1
-
-    # Extrair marcas únicas dos nomes dos produtos (última palavra)
-    brands_set = set()
-    for p in produtos_supabase:
-        parts = p['nome'].split()
-        if len(parts) > 1:
-            marca = parts[-1]
-            brands_set.add(marca)
-    brands = sorted(list(brands_set))
-
-    # Converter para formato esperado pelo template
-    products_json = []
-    for p in produtos_supabase:
-        parts = p['nome'].split()
-        marca = parts[-1] if len(parts) > 1 else ''
-        products_json.append({
-            'id': p['id'],
-            'name': p['nome'],
-            'brand': marca,
-            'description': p.get('descricao') or '',
-            # Usar URL da imagem se existir (imagem ou image)
-            'image': p.get('imagem') or p.get('image'),
-            'related_product_ids': p.get('produto_relacionado_ids') or (str(p.get('produto_relacionado_id')) if p.get('produto_relacionado_id') else ''),
-            'em_queima_estoque': p.get('em_queima_estoque', False),
-            'preco_original': p.get('preco_original'),
-            'preco_queima': p.get('preco_queima')
-        })
+    # Marcas já calculadas no snapshot; os produtos são carregados pelo navegador em /api/catalogo
+    snapshot = snapshot_do_setor(categoria)
 
-    return render_template('index.html', products=[], brands=brands, products_json=products_json)
+    return render_template('index.html', products=[], brands=snapshot.marcas)
+
+@app.route('/api/catalogo')
+@login_required
+@categoria_required
+def catalogo_api():
+    """Catálogo do setor pré-serializado e comprimido, com ETag forte para revalidação (304)"""
+    categoria = session.get('categoria_loja')
+    snapshot = snapshot_do_setor(categoria)
+
+    if request.if_none_match.contains(snapshot.versao):
+        response = app.response_class(status=304)
+    else:
+        corpo, encoding = snapshot.payload.corpo(request.accept_encodings)
+        response = app.response_class(corpo, mimetype='application/json')
+        if encoding:
+            response.headers['Content-Encoding'] = encoding
+
+    response.set_etag(snapshot.versao)
+    response.headers['Vary'] = 'Accept-Encoding, Cookie'
+    # Sempre revalida com o servidor; o navegador reaproveita o corpo quando receber 304
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+@app.route('/api/catalog/changes')
+@login_required
+@categoria_required
+def catalogo_mudancas():
+    """
+    Produtos incluídos/alterados e IDs removidos desde a versão `since`.
+    Quando a versão não está no histórico (ou o delta é grande) devolve o
+    catálogo completo, no mesmo formato de /api/catalogo.
+    """
+    categoria = session.get('categoria_loja')
+    snapshot = snapshot_do_setor(categoria)
+    delta = historico_catalogo.mudancas(categoria, request.args.get('since', ''))
+
+    if delta is None or delta[0] != snapshot.versao:
+        # Só o catálogo completo precisa do payload comprimido
+        corpo, encoding = snapshot.payload.corpo(request.accept_encodings)
+        response = app.response_class(corpo, mimetype='application/json')
+        if encoding:
+            response.headers['Content-Encoding'] = encoding
+        response.headers['Vary'] = 'Accept-Encoding, Cookie'
+    else:
+        versao, alterados, removidos = delta
+        response = jsonify({'versao': versao, 'alterados': alterados, 'removidos': removidos})
+
+    response.headers['Cache-Control'] = 'no-store'
+    return response
+
+@app.route('/api/eventos/token')
+@login_required
+@categoria_required
+def eventos_token():
+    """URL assinada do stream de eventos do setor (None quando os eventos estão desligados)"""
+    if not eventos_catalogo.habilitado:
+        return jsonify({'url': None})
+    base = app.config['EVENTOS_URL']
+    if not base:
+        # A porta própria fala HTTP puro: numa página HTTPS o navegador bloquearia o stream
+        if request.is_secure:
+            return jsonify({'url': None})
+        base = f"http://{request.host.split(':')[0]}:{eventos_catalogo.porta}/eventos"
+    # O token leva a origem da página: só ela recebe Access-Control-Allow-Origin
+    origem = request.host_url.rstrip('/')
+    token = eventos_catalogo.gerar_token(session.get('categoria_loja'), origem)
+    return jsonify({'url': f'{base}?token={token}'})
 
 @app.route('/login', methods=['GET', 'POST'])
 def login():
@@ -183,37 +422,41 @@ def logout():
 @login_required
 @categoria_required
 def search_products():
-    query = request.args.get('q', '').lower()
+    query = request.args.get('q', '')
     brands = request.args.getlist('brands[]')
+    limit = request.args.get('limit', type=int)  # opcional; sem ele, todos os resultados (como sempre foi)
     categoria = session.get('categoria_loja')
 
-    # Filtrar apenas produtos da categoria selecionada
-    products = Product.query.filter_by(categoria_loja=categoria).all()
-
-    # Filtro por marca
-    if brands:
-        products = [p for p in products if p.brand in brands]
-
-    # Busca fuzzy
-    if query:
-        results = []
-        for product in products:
-            score = fuzz.partial_ratio(query, product.name.lower())
-            if score > 60:  # Threshold de similaridade
-                results.append({
-                    'product': product,
-                    'score': score
-                })
-        results.sort(key=lambda x: x['score'], reverse=True)
-        products = [r['product'] for r in results]
-
-    return jsonify([{
-        'id': p.id,
-        'name': p.name,
-        'brand': p.brand,
-        'description': p.description,
-        'image': p.image
-    } for p in products])
+    # Nomes e marcas do setor, refeitos quando a sincronização muda a tabela
+    motor = motor_busca_fuzzy(categoria)
+    return jsonify(motor.buscar(query, brands, limite=max(limit, 1) if limit is not None else None))
+
+# Motores de busca fuzzy por setor: {setor: (versão da sincronização, motor)}
+_motores_fuzzy = {}
+_motores_fuzzy_lock = threading.Lock()
+
+def motor_busca_fuzzy(categoria):
+    """Motor de busca fuzzy do setor sobre a tabela local product"""
+    estado = db.session.get(SyncCatalogo, categoria)
+    versao = estado.versao if estado else 0
+
+    with _motores_fuzzy_lock:
+        atual = _motores_fuzzy.get(categoria)
+        if atual and atual[0] == versao:
+            return atual[1]
+
+        colunas = (Product.id, Product.name, Product.brand, Product.description, Product.image,
+                   Product.search_key)
+        linhas = db.session.execute(
+            db.select(*colunas).filter_by(categoria_loja=categoria).order_by(Product.id)
+        ).mappings().all()
+        motor = MotorBuscaFuzzy(
+            [{'id': l['id'], 'name': l['name'], 'brand': l['brand'],
+              'description': l['description'], 'image': l['image']} for l in linhas],
+            chaves=[l['search_key'] or normalizar(l['name']) for l in linhas],
+        )
+        _motores_fuzzy[categoria] = (versao, motor)
+        return motor
 
 @app.route('/api/whatsapp-config')
 @login_required
@@ -232,50 +475,32 @@ def search_products_api():
     exclude_id = request.args.get('exclude_id', type=int)
     categoria = session.get('categoria_loja')
 
+    return jsonify(sugestoes_relacionados(categoria, query, exclude_id))
+
+def sugestoes_relacionados(categoria, query, exclude_id=None):
+    """Produtos do setor que podem ser vinculados (id, name, brand), só com o catálogo em cache"""
     if not query or len(query) < 2:
-        return jsonify([])
+        return []
 
-    # Buscar produtos do Supabase - buscar TODOS e filtrar depois para melhor resultado
-    all_produtos = []
-    page = 0
-    page_size = 1000
-    
-    while True:
-        response = supabase.table('produtos').select('*').eq('setor', categoria) \
-            .range(page * page_size, (page + 1) * page_size - 1).execute()
-        
-        if not response.data:
-            break
-            
-        all_produtos.extend(response.data)
-        page += 1
-    
-    # Filtrar produtos que contenham o termo de busca (case-insensitive)
-    query_lower = query.lower()
-    produtos = [p for p in all_produtos if query_lower in p['nome'].lower()]
-    
-    # Excluir o próprio produto se estiver editando
-    if exclude_id:
-        produtos = [p for p in produtos if p['id'] != exclude_id]
-    
-    # Ordenar por relevância (quanto mais próximo do início, melhor)
-    produtos.sort(key=lambda p: p['nome'].lower().index(query_lower))
-    
-    # Limitar a 50 resultados mais relevantes
-    produtos = produtos[:50]
+    # Índice e snapshot da mesma carga do cache: uma invalidação no meio não os desencontra
+    entrada = entrada_do_setor(categoria)
+
+    # Índice de n-gramas do setor (refeito quando o catálogo em cache muda).
+    # Ordena por relevância (quanto mais próximo do início, melhor) e limita a 50
+    indice = entrada.derivado('indice_nomes', IndiceNomes)
+    produtos = indice.buscar(query, limite=50, excluir_id=exclude_id)
 
-    # Formatar resposta (extrair marca da última palavra)
+    # Formatar resposta a partir dos produtos já formatados do snapshot
+    snapshot = snapshot_do_setor(categoria, entrada)
     result = []
     for p in produtos:
-        parts = p['nome'].split()
-        marca = parts[-1] if len(parts) > 1 else ''
+        vm = snapshot.por_id[p['id']]
         result.append({
-            'id': p['id'],
-            'name': p['nome'],
-            'brand': marca
+            'id': vm['id'],
+            'name': vm['name'],
+            'brand': vm['brand']
         })
-
-    return jsonify(result)
+    return result
 
 @app.route('/api/product/<int:product_id>/photo', methods=['POST'])
 @admin_required
@@ -285,74 +510,98 @@ def upload_product_photo(product_id):
     categoria = session.get('categoria_loja')
 
     # Verificar se o produto existe e pertence à categoria
-    response = supabase.table('produtos').select('*').eq('id', product_id).eq('setor', categoria).execute()
-    if not response.data:
+    product = catalogo_repo.buscar(product_id, categoria)
+    if not product:
         return jsonify({'success': False, 'error': 'Produto não encontrado'}), 404
 
-    product = response.data[0]
     imagem_file = request.files.get('image')
 
     if not imagem_file or not imagem_file.filename:
         return jsonify({'success': False, 'error': 'Nenhuma imagem enviada'}), 400
 
     try:
-        filename = secure_filename(imagem_file.filename)
-        storage_path = f"produtos/{int(time.time())}_{uuid.uuid4().hex}_{filename}"
+        caminho, sha = receber_foto(imagem_file)
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
 
-        file_bytes = imagem_file.read()
-        # Upload para bucket configurado
-        supabase.storage.from_(SUPABASE_BUCKET).upload(storage_path, file_bytes, {
-            "content-type": imagem_file.mimetype or "application/octet-stream"
-        })
-        public_url_resp = supabase.storage.from_(SUPABASE_BUCKET).get_public_url(storage_path)
-        public_url = public_url_resp.get('publicUrl') if isinstance(public_url_resp, dict) else public_url_resp
+    # Redimensionamento e envio ficam com a fila de tarefas; a página consulta o status
+    image_field = 'imagem' if 'imagem' in product else 'image'
+    tarefa_id = enfileirar_foto(categoria, product_id, caminho, image_field, imagem_file.mimetype, sha)
+    return jsonify({'success': True, 'processing': True,
+                    'status_url': url_for('admin_tarefa_status', tarefa_id=tarefa_id)}), 202
 
-        # Atualizar o produto com a nova URL da imagem
-        image_field = 'imagem' if 'imagem' in product else 'image'
-        supabase.table('produtos').update({image_field: public_url}).eq('id', product_id).execute()
+@app.route('/admin/api/tarefas')
+@admin_required
+@categoria_required
+def admin_tarefas():
+    """Tarefas recentes do setor e o total por status (pendente, executando, ok, erro)"""
+    limite = min(request.args.get('limit', 50, type=int) or 50, 200)
+    return jsonify({'contagem': fila_tarefas.contagem(),
+                    'tarefas': fila_tarefas.listar(session.get('categoria_loja'), limite)})
 
-        return jsonify({'success': True, 'image_url': public_url})
-    except Exception as e:
-        return jsonify({'success': False, 'error': str(e)}), 500
+@app.route('/admin/api/tarefas/<int:tarefa_id>')
+@admin_required
+@categoria_required
+def admin_tarefa_status(tarefa_id):
+    """Andamento de uma tarefa enfileirada (status, tentativas, resultado ou erro)"""
+    tarefa = fila_tarefas.status(tarefa_id)
+    if not tarefa or tarefa['setor'] != session.get('categoria_loja'):
+        return jsonify({'error': 'Tarefa não encontrada'}), 404
+    return jsonify(tarefa)
 
-# Rotas Admin
 @app.route('/admin')
 @admin_required
 @categoria_required
 def admin_dashboard():
     categoria = session.get('categoria_loja')
-    # Contar produtos do Supabase
-    response = supabase.table('produtos').select('id', count='exact').eq('setor', categoria).execute()
-    total_products = response.count or 0
-    total_users = User.query.filter_by(is_admin=False).count()
+    # Contadores em memória (calculados fora da requisição)
+    stats = estatisticas_admin.obter(categoria)
     categoria_nome = 'Automotivo' if categoria == 'automotivo' else 'Imobiliário'
 
     return render_template('admin/dashboard.html',
-                         total_products=total_products,
-                         total_users=total_users,
+                         total_products=stats['total_produtos'],
+                         total_users=stats['total_usuarios'],
+                         stats=stats,
                          categoria_nome=categoria_nome)
 
 @app.route('/admin/products')
 @admin_required
 @categoria_required
 def admin_products():
+    # As linhas são carregadas pela página em /admin/api/products (rolagem infinita)
+    return render_template('admin/products.html')
+
+@app.route('/admin/api/products')
+@admin_required
+@categoria_required
+def admin_products_api():
+    """Página da listagem do admin: filtro por nome no servidor e cursor (keyset) em (nome, id)"""
     categoria = session.get('categoria_loja')
-    # Buscar TODOS os produtos do Supabase com paginação
-    products = []
-    page = 0
-    page_size = 1000
-    
-    while True:
-        response = supabase.table('produtos').select('*').eq('setor', categoria).order('nome') \
-            .range(page * page_size, (page + 1) * page_size - 1).execute()
-        
-        if not response.data:
-            break
-            
-        products.extend(response.data)
-        page += 1
-    
-    return render_template('admin/products.html', products=products)
+    termo = request.args.get('q', '').strip()
+    cursor = request.args.get('cursor')
+
+    # queima=1 só produtos em queima de estoque, queima=0 só os normais
+    queima = request.args.get('queima')
+    em_queima = None if queima in (None, '') else queima == '1'
+
+    try:
+        limite = min(max(int(request.args.get('limit', 50)), 1), 200)
+        depois = decodificar_cursor(cursor) if cursor else None
+    except ValueError:
+        return jsonify({'error': 'Parâmetros inválidos'}), 400
+
+    listagem = derivado_do_setor(categoria, 'listagem_admin', ListagemAdmin)
+    produtos, proximo = listagem.pagina(depois, termo, limite, em_queima)
+
+    resposta = {
+        'produtos': [{'id': p['id'], 'nome': p['nome'], 'setor': p.get('setor'),
+                      'em_queima_estoque': bool(p.get('em_queima_estoque'))} for p in produtos],
+        'proximo': codificar_cursor(proximo) if proximo else None
+    }
+    # Total só na primeira página (é o único passo que percorre o setor inteiro)
+    if not cursor:
+        resposta['total'] = listagem.contar(termo, em_queima)
+    return jsonify(resposta)
 
 @app.route('/admin/products/add', methods=['GET', 'POST'])
 @admin_required
@@ -381,23 +630,60 @@ def admin_add_product():
 
         # Inserir no Supabase
         supabase.table('produtos').insert(produto_data).execute()
+        catalogo_alterado(categoria)
 
         flash('Produto cadastrado com sucesso!', 'success')
         return redirect(url_for('admin_products'))
 
     return render_template('admin/add_product.html')
 
+@app.route('/admin/products/import', methods=['GET', 'POST'])
+@admin_required
+@categoria_required
+def admin_import_products():
+    """Importação de produtos por planilha (CSV/XLSX), lida em streaming e inserida em lotes"""
+    relatorio = None
+    if request.method == 'POST':
+        categoria = session.get('categoria_loja')
+        arquivo = request.files.get('arquivo')
+        if not arquivo or not arquivo.filename:
+            flash('Selecione uma planilha.', 'warning')
+            return redirect(url_for('admin_import_products'))
+
+        try:
+            relatorio = importar(supabase, categoria, ler_planilha(arquivo.stream, arquivo.filename))
+        except ErroImportacao as e:
+            flash(str(e), 'danger')
+            return redirect(url_for('admin_import_products'))
+
+        if relatorio['inseridos']:
+            catalogo_alterado(categoria)
+        print(f"Importação - {relatorio['inseridos']} inseridos, {relatorio['total_erros']} erros ({arquivo.filename})")
+        flash(f"{relatorio['inseridos']} produto(s) importado(s).",
+              'success' if not relatorio['total_erros'] else 'warning')
+
+    return render_template('admin/import_products.html', relatorio=relatorio)
+
+@app.route('/admin/products/export.csv')
+@admin_required
+@categoria_required
+def admin_export_products():
+    """Catálogo do setor em CSV, gerado em blocos enquanto é enviado"""
+    categoria = session.get('categoria_loja')
+    produtos = produtos_do_setor(categoria)
+    return Response(exportar_csv(produtos), mimetype='text/csv',
+                    headers={'Content-Disposition': f'attachment; filename=catalogo_{categoria}.csv'})
+
 @app.route('/admin/products/edit/<int:id>', methods=['GET', 'POST'])
 @admin_required
 @categoria_required
 def admin_edit_product(id):
     categoria = session.get('categoria_loja')
     # Buscar produto do Supabase
-    response = supabase.table('produtos').select('*').eq('id', id).eq('setor', categoria).execute()
-    if not response.data:
+    product = catalogo_repo.buscar(id, categoria)
+    if not product:
         flash('Produto não encontrado!', 'danger')
         return redirect(url_for('admin_products'))
-    product = response.data[0]
 
     if request.method == 'POST':
         nome_produto = request.form.get('name')
@@ -406,12 +692,9 @@ def admin_edit_product(id):
         relacionado_ids = request.form.get('related_product_ids', '').strip()
         imagem_file = request.files.get('image')
 
-        # Se a marca foi apagada, manter a marca anterior
+        # Se a marca foi apagada, manter a marca anterior (extraída do nome completo)
         if not marca:
-            # Extrair a marca anterior do nome completo
-            partes = product.get('nome', '').split()
-            if len(partes) > 1:
-                marca = partes[-1]
+            marca = extrair_marca(product.get('nome', ''))
 
         # Se houver marca, adicionar ao final do nome
         nome_completo = nome_produto
@@ -432,64 +715,50 @@ def admin_edit_product(id):
         else:
             update_data['produto_relacionado_ids'] = None
 
-        # Upload de imagem no Supabase Storage, se enviado
+        # Foto nova: processada em segundo plano depois que os dados do produto forem salvos
+        foto = None
         if imagem_file and imagem_file.filename:
-            filename = secure_filename(imagem_file.filename)
-            storage_path = f"produtos/{int(time.time())}_{uuid.uuid4().hex}_{filename}"
-
-            try:
-                file_bytes = imagem_file.read()
-                # Upload para bucket configurado
-                supabase.storage.from_(SUPABASE_BUCKET).upload(storage_path, file_bytes, {
-                    "content-type": imagem_file.mimetype or "application/octet-stream"
-                })
-                public_url_resp = supabase.storage.from_(SUPABASE_BUCKET).get_public_url(storage_path)
-                public_url = public_url_resp.get('publicUrl') if isinstance(public_url_resp, dict) else public_url_resp
-
-                image_field = 'imagem' if 'imagem' in product else ('image' if 'image' in product else None)
-                if image_field:
-                    update_data[image_field] = public_url
-                else:
-                    flash('Imagem enviada, mas a coluna de imagem não existe na tabela.', 'warning')
-            except Exception as e:
-                flash(f'Erro ao enviar imagem para o Supabase Storage: {e}', 'danger')
+            image_field = 'imagem' if 'imagem' in product else ('image' if 'image' in product else None)
+            if not image_field:
+                flash('A coluna de imagem não existe na tabela; a foto não foi salva.', 'warning')
+            else:
+                try:
+                    foto, sha = receber_foto(imagem_file)
+                except ValueError as e:
+                    flash(str(e), 'danger')
 
         # Atualizar no Supabase
         supabase.table('produtos').update(update_data).eq('id', id).execute()
-
-        flash('Produto atualizado com sucesso!', 'success')
+        catalogo_alterado(categoria, id=id)
+        if foto:
+            enfileirar_foto(categoria, id, foto, image_field, imagem_file.mimetype, sha)
+            flash('Produto atualizado com sucesso! A foto aparece no catálogo em instantes.', 'success')
+        else:
+            flash('Produto atualizado com sucesso!', 'success')
         return redirect(url_for('admin_products'))
 
     # Separar nome e marca (marca é a última palavra)
     nome_completo = product.get('nome', '')
-    partes = nome_completo.split()
-    if len(partes) > 1:
-        marca = partes[-1]
-        nome_base = ' '.join(partes[:-1])
-    else:
-        marca = ''
-        nome_base = nome_completo
+    nome_base, marca = separar_nome_marca(nome_completo)
 
-    # Buscar dados dos produtos relacionados (múltiplos catalisadores)
-    related_products_data = []
-    produto_relacionado_ids = product.get('produto_relacionado_ids') or ''
+    # Produtos relacionados (múltiplos catalisadores) resolvidos pelo grafo do catálogo em cache;
+    # só os que ainda não estão no cache vão ao Supabase, numa única consulta
+    produto_relacionado_ids = ids_relacionados(product)
+    ids_list = lista_ids_relacionados(product)
+    grafo = derivado_do_setor(categoria, 'relacionados', GrafoRelacionados)
 
-    # Compatibilidade com campo antigo (single ID)
-    if not produto_relacionado_ids and product.get('produto_relacionado_id'):
-        produto_relacionado_ids = str(product.get('produto_relacionado_id'))
-
-    if produto_relacionado_ids:
+    encontrados = {p['id']: p for p in grafo.relacionados(product['id'], ids_list)}
+    faltando = [i for i in ids_list if i not in encontrados]
+    if faltando:
         try:
-            ids_list = [int(id.strip()) for id in produto_relacionado_ids.split(',') if id.strip()]
-            for rel_id in ids_list:
-                rel_response = supabase.table('produtos').select('id, nome').eq('id', rel_id).execute()
-                if rel_response.data and len(rel_response.data) > 0:
-                    related_products_data.append({
-                        'id': rel_response.data[0]['id'],
-                        'name': rel_response.data[0]['nome']
-                    })
-        except:
-            pass
+            for rel in catalogo_repo.buscar_varios(faltando, colunas='id, nome'):
+                encontrados[rel['id']] = rel
+        except Exception as e:
+            print(f"Erro ao buscar produtos relacionados: {str(e)}")
+
+    related_products_data = [{'id': i, 'name': encontrados[i]['nome']} for i in ids_list if i in encontrados]
+    # Índice reverso: quem usa este produto como catalisador
+    usado_por = [{'id': p['id'], 'name': p['nome']} for p in grafo.usado_por(product['id'])]
 
     product_display = {
         'id': product['id'],
@@ -500,6 +769,7 @@ def admin_edit_product(id):
         'descricao': product.get('descricao', ''),
         'produto_relacionado_ids': produto_relacionado_ids,
         'related_products_data': related_products_data,
+        'usado_por': usado_por,
         'imagem': product.get('imagem') or product.get('image')
     }
 
@@ -510,9 +780,19 @@ def admin_edit_product(id):
 @categoria_required
 def admin_delete_product(id):
     categoria = session.get('categoria_loja')
+    # Quem aponta para este produto como catalisador (antes de invalidar o cache)
+    limpezas = derivado_do_setor(categoria, 'relacionados', GrafoRelacionados).limpezas(id)
+
     # Deletar do Supabase
     supabase.table('produtos').delete().eq('id', id).eq('setor', categoria).execute()
 
+    catalogo_alterado(categoria, id=id)
+
+    # Remover o ID apagado dos relacionados dos outros produtos fica com a fila
+    if limpezas:
+        fila_tarefas.enfileirar('limpar_relacionados', {'setor': categoria, 'limpezas': limpezas},
+                                chave=f'limpar_relacionados:{categoria}:{id}', setor=categoria)
+
     flash('Produto excluído com sucesso!', 'success')
     return redirect(url_for('admin_products'))
 
@@ -542,6 +822,7 @@ def admin_add_user():
         )
         db.session.add(user)
         db.session.commit()
+        estatisticas_admin.invalidar()
 
         flash('Usuário criado com sucesso!', 'success')
         return redirect(url_for('admin_users'))
@@ -560,6 +841,7 @@ def admin_delete_user(id):
 
     db.session.delete(user)
     db.session.commit()
+    estatisticas_admin.invalidar()
 
     flash('Usuário excluído com sucesso!', 'success')
     return redirect(url_for('admin_users'))
@@ -591,29 +873,14 @@ def admin_config():
 def admin_queima_estoque():
     """Página de gerenciamento de produtos em queima de estoque"""
     categoria = session.get('categoria_loja')
-    
-    # Buscar todos os produtos do setor
-    all_produtos = []
-    page = 0
-    page_size = 1000
-    
-    while True:
-        response = supabase.table('produtos').select('*').eq('setor', categoria) \
-            .range(page * page_size, (page + 1) * page_size - 1).execute()
-        
-        if not response.data:
-            break
-            
-        all_produtos.extend(response.data)
-        page += 1
-    
-    # Separar produtos em queima e normais
-    produtos_queima = [p for p in all_produtos if p.get('em_queima_estoque', False)]
-    produtos_normais = [p for p in all_produtos if not p.get('em_queima_estoque', False)]
-    
-    return render_template('admin/queima_estoque.html', 
-                         produtos_queima=produtos_queima, 
-                         produtos_normais=produtos_normais)
+
+    # Produtos em queima vêm do índice da promoção (pré-calculado no catálogo em cache);
+    # os normais são carregados pela página em /admin/api/products?queima=0
+    listagem = derivado_do_setor(categoria, 'listagem_admin', ListagemAdmin)
+
+    return render_template('admin/queima_estoque.html',
+                         produtos_queima=listagem.em_queima,
+                         total_normais=listagem.contar(em_queima=False))
 
 @app.route('/admin/queima-estoque/toggle/<int:product_id>', methods=['POST'])
 @admin_required
@@ -624,21 +891,23 @@ def toggle_queima_estoque(product_id):
     
     try:
         # Buscar produto
-        response = supabase.table('produtos').select('*').eq('id', product_id).eq('setor', categoria).execute()
-        
-        if not response.data:
+        produto = catalogo_repo.buscar(product_id, categoria, colunas='id, em_queima_estoque')
+
+        if not produto:
             return jsonify({'error': 'Produto não encontrado'}), 404
-        
-        produto = response.data[0]
+
         novo_status = not produto.get('em_queima_estoque', False)
         
         # Atualizar
         update_response = supabase.table('produtos').update({'em_queima_estoque': novo_status}).eq('id', product_id).execute()
+        catalogo_alterado(categoria, 'queima', id=product_id, em_queima_estoque=novo_status)
         
         print(f"Toggle queima - Produto ID: {product_id}, Status anterior: {produto.get('em_queima_estoque')}, Novo status: {novo_status}")
         
         return jsonify({'success': True, 'em_queima_estoque': novo_status})
     
+    except CircuitoAberto:
+        raise  # 503 do supabase_indisponivel
     except Exception as e:
         print(f"Erro ao toggle queima estoque: {str(e)}")
         return jsonify({'error': f'Erro ao atualizar produto: {str(e)}'}), 500
@@ -649,23 +918,17 @@ def toggle_queima_estoque(product_id):
 def save_queima_prices(product_id):
     """Salvar preços de queima de estoque"""
     categoria = session.get('categoria_loja')
-    data = request.get_json()
-    
+    data = request.get_json() or {}
+
     try:
-        # Validar dados
-        preco_original = float(data.get('preco_original', 0))
-        preco_queima = float(data.get('preco_queima', 0))
-    except (TypeError, ValueError):
-        return jsonify({'error': 'Preços inválidos'}), 400
-    
-    if preco_original <= 0 or preco_queima <= 0 or preco_queima >= preco_original:
-        return jsonify({'error': 'Preços inválidos. O preço de queima deve ser menor que o original'}), 400
+        # Validar dados (mesma regra das operações em lote)
+        preco_original, preco_queima = validar_precos(data.get('preco_original', 0), data.get('preco_queima', 0))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     
     try:
         # Buscar produto para validar
-        response = supabase.table('produtos').select('*').eq('id', product_id).eq('setor', categoria).execute()
-        
-        if not response.data:
+        if not catalogo_repo.buscar(product_id, categoria, colunas='id'):
             return jsonify({'error': 'Produto não encontrado'}), 404
         
         # Atualizar preços
@@ -673,13 +936,47 @@ def save_queima_prices(product_id):
             'preco_original': preco_original,
             'preco_queima': preco_queima
         }).eq('id', product_id).execute()
+        catalogo_alterado(categoria, 'precos', id=product_id,
+                          preco_original=preco_original, preco_queima=preco_queima)
         
         return jsonify({'success': True})
     
+    except CircuitoAberto:
+        raise  # 503 do supabase_indisponivel
     except Exception as e:
         print(f"Erro ao salvar preços: {str(e)}")
         return jsonify({'error': f'Erro ao salvar preços: {str(e)}'}), 500
 
+@app.route('/admin/queima-estoque/bulk', methods=['POST'])
+@admin_required
+@categoria_required
+def queima_estoque_lote():
+    """
+    Status e/ou preços de queima para vários produtos numa requisição, aplicados pela fila.
+    Corpo: {"itens": [{"id": 1, "em_queima_estoque": true, "preco_original": 50, "preco_queima": 39.9}, ...]}
+    Itens inválidos (IDs, preços, repetidos) respondem 400 com o erro de cada um, sem enfileirar.
+    Responde 202 com status_url; o resultado por item fica no resultado da tarefa.
+    O cabeçalho Idempotency-Key evita aplicar duas vezes a mesma requisição repetida.
+    """
+    categoria = session.get('categoria_loja')
+    data = request.get_json(silent=True) or {}
+    itens = data.get('itens')
+
+    if not isinstance(itens, list) or not itens:
+        return jsonify({'error': 'Informe a lista de itens'}), 400
+    if len(itens) > MAX_ITENS:
+        return jsonify({'error': f'No máximo {MAX_ITENS} itens por lote'}), 400
+
+    # Validação na requisição: a fila só recebe itens já normalizados
+    itens, erros = validar_itens(itens)
+    if erros:
+        return jsonify({'error': 'Itens inválidos', 'itens': erros}), 400
+
+    tarefa_id = fila_tarefas.enfileirar('queima_lote', {'setor': categoria, 'itens': itens},
+                                        chave=chave_idempotencia('queima_lote'), setor=categoria)
+    return jsonify({'success': True, 'processing': True, 'tarefa_id': tarefa_id,
+                    'status_url': url_for('admin_tarefa_status', tarefa_id=tarefa_id)}), 202
+
 # Rota para trocar de setor
 @app.route('/trocar-setor')
 @login_required
@@ -724,6 +1021,47 @@ def init_db():
                     conn.execute(db.text('ALTER TABLE product ADD COLUMN related_product_id INTEGER'))
                     conn.commit()
                 print("Coluna related_product_id adicionada à tabela product")
+
+            # Migração: colunas espelhadas do Supabase pela sincronização do catálogo
+            colunas_sync = {
+                'related_product_ids': 'VARCHAR(500)',
+                'em_queima_estoque': 'BOOLEAN DEFAULT FALSE',
+                'preco_original': 'FLOAT',
+                'preco_queima': 'FLOAT',
+                'supabase_updated_at': 'VARCHAR(40)',
+                'search_key': 'VARCHAR(200)',
+            }
+            with db.engine.connect() as conn:
+                for coluna, tipo in colunas_sync.items():
+                    if coluna not in columns:
+                        conn.execute(db.text(f'ALTER TABLE product ADD COLUMN {coluna} {tipo}'))
+                        print(f"Coluna {coluna} adicionada à tabela product")
+                conn.execute(db.text('CREATE INDEX IF NOT EXISTS ix_product_categoria_nome ON product (categoria_loja, name)'))
+                conn.commit()
+
+            # Migração: colunas novas dos pedidos
+            colunas_pedidos = {
+                'orders': {'categoria_loja': 'VARCHAR(20)'},
+                'order_items': {'unit_price': 'FLOAT'},
+            }
+            with db.engine.connect() as conn:
+                for tabela, colunas in colunas_pedidos.items():
+                    existentes = [col['name'] for col in inspector.get_columns(tabela)]
+                    for coluna, tipo in colunas.items():
+                        if coluna not in existentes:
+                            conn.execute(db.text(f'ALTER TABLE {tabela} ADD COLUMN {coluna} {tipo}'))
+                            print(f"Coluna {coluna} adicionada à tabela {tabela}")
+                # Migração: order_items.product_id deixou de ser FK para product (IDs do Supabase).
+                # SQLite não aplica FKs sem PRAGMA foreign_keys; no PostgreSQL a restrição é removida
+                if db.engine.dialect.name != 'sqlite':
+                    for fk in inspector.get_foreign_keys('order_items'):
+                        if fk['referred_table'] == 'product' and fk.get('name'):
+                            conn.execute(db.text(f'ALTER TABLE order_items DROP CONSTRAINT "{fk["name"]}"'))
+                            print(f"Restrição {fk['name']} removida de order_items")
+                conn.execute(db.text('CREATE INDEX IF NOT EXISTS ix_orders_user_created ON orders (user_id, created_at, id)'))
+                conn.execute(db.text('CREATE INDEX IF NOT EXISTS ix_order_items_order_id ON order_items (order_id)'))
+                conn.execute(db.text('CREATE INDEX IF NOT EXISTS ix_orders_status_updated ON orders (status, updated_at)'))
+                conn.commit()
         except Exception as e:
             print(f"Aviso na migração: {e}")
 
@@ -740,6 +1078,68 @@ def init_db():
             db.session.commit()
             print("Admin criado! Usuario: admin - TROQUE A SENHA IMEDIATAMENTE!")
 
+# Rotas e modelos de pedidos (pedidos.py importa o app; `python app.py` roda como __main__)
+sys.modules.setdefault('app', sys.modules[__name__])
+import pedidos
+
+# Sincronização, arquivamento e eventos rodam num único processo por instalação:
+# o Passenger (e o gunicorn com vários workers) sobe vários processos do app
+TRAVA_SERVICOS = os.path.join(app.instance_path, 'servicos.lock')
+_trava_servicos = None
+
+def _reservar_servicos():
+    """Trava o arquivo de serviços sem esperar; o sistema a libera quando o processo termina"""
+    global _trava_servicos
+    if fcntl is None:
+        return True
+    arquivo = open(TRAVA_SERVICOS, 'a')
+    try:
+        fcntl.flock(arquivo, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        arquivo.close()
+        return False
+    _trava_servicos = arquivo
+    return True
+
+def _iniciar_servicos_exclusivos():
+    # Sincronização periódica do catálogo (CATALOGO_SYNC_INTERVALO no .env)
+    from sync_catalogo import iniciar_sync_periodico
+    iniciar_sync_periodico()
+
+    # Arquivamento periódico de pedidos finalizados (PEDIDOS_ARQUIVAR_INTERVALO no .env)
+    from exportacao_pedidos import iniciar_arquivamento_periodico
+    iniciar_arquivamento_periodico()
+
+    # Eventos em tempo real da vitrine (EVENTOS_PORTA no .env)
+    if app.config['EVENTOS_PORTA']:
+        if env == 'production' and not app.config['EVENTOS_URL']:
+            print("EVENTOS_URL não configurada: com HTTPS as abas não recebem eventos")
+        try:
+            eventos_catalogo.iniciar()
+        except OSError as e:
+            print(f"ERRO: eventos do catálogo não iniciados na porta {app.config['EVENTOS_PORTA']} ({e})")
+
+def _assumir_servicos(intervalo=60):
+    """Processo sem a trava: assume os serviços se o processo que os rodava terminar"""
+    while not _reservar_servicos():
+        time.sleep(intervalo)
+    print(f"Processo {os.getpid()} assumiu os serviços em segundo plano")
+    _iniciar_servicos_exclusivos()
+
+def iniciar_servicos():
+    """Banco local e serviços em segundo plano do processo servidor (wsgi.py, passenger_wsgi.py e asgi.py)"""
+    init_db()
+
+    # Fila de tarefas: retoma o que ficou pendente antes do reinício (a reserva no SQLite
+    # é segura com vários processos, então todos consomem)
+    fila_tarefas.iniciar()
+
+    if _reservar_servicos():
+        _iniciar_servicos_exclusivos()
+    else:
+        # Eventos publicados aqui são repassados ao processo que escuta EVENTOS_PORTA
+        threading.Thread(target=_assumir_servicos, name='assumir-servicos', daemon=True).start()
+
 if __name__ == '__main__':
     init_db()
     app.run(debug=True, host='0.0.0.0', port=5000)
@@ -0,0 +1,483 @@
+# -*- coding: utf-8 -*-
+"""
+Servidor assíncrono (ASGI), alternativa opcional ao wsgi.py
+Execute: python asgi.py   (ou: uvicorn asgi:application --host 0.0.0.0 --port 5000)
+Requer: pip install uvicorn a2wsgi
+
+No Waitress cada requisição ocupa uma das 6 threads enquanto espera o
+Supabase. Aqui um único event loop atende, sem thread por requisição, as
+rotas que os vendedores mais chamam:
+
+- GET  /api/catalogo             catálogo do setor, direto da memória
+- GET  /api/search-products      busca de produtos relacionados no índice em cache
+- POST /api/product/<id>/photo   o upload é recebido em blocos enquanto o produto
+                                 é conferido no Supabase pelo cliente assíncrono
+
+As demais rotas continuam no Flask, num pool de ASGI_THREADS threads (a2wsgi).
+O que trava o loop (montar o catálogo com o cache frio, consultar o banco
+local, gravar na fila de tarefas) vai para uma thread.
+
+Teste de carga (Waitress x ASGI contra o Supabase local):
+python asgi.py --carga --usuarios 100 --latencia 0.1
+"""
+if __name__ == '__main__':
+    # Executado diretamente: o teste de carga aponta o app para o Supabase local antes de importá-lo
+    import argparse
+    import os
+    import tempfile
+
+    parser = argparse.ArgumentParser(description='Servidor ASGI ou teste de carga Waitress x ASGI')
+    parser.add_argument('--porta', type=int, default=5000)
+    parser.add_argument('--carga', action='store_true', help='compara Waitress e ASGI contra o Supabase local')
+    parser.add_argument('--usuarios', type=int, default=100)
+    parser.add_argument('--duracao', type=float, default=20.0, help='segundos de carga em cada servidor')
+    parser.add_argument('--latencia', type=float, default=0.1, help='latência de cada chamada ao Supabase (s)')
+    args = parser.parse_args()
+
+    if args.carga:
+        from supabase_local import BancoLocal, iniciar_servidor
+
+        banco = BancoLocal()
+        banco.popular_produtos(1500, setores=('automotivo',))
+        banco.latencia = args.latencia
+        servidor, url = iniciar_servidor(banco)
+        pasta = tempfile.mkdtemp()
+        # Fila sem threads: o teste mede as requisições, não o processamento das fotos
+        os.environ.update(SUPABASE_URL=url, FILA_TAREFAS_WORKERS='0',
+                          DATABASE_URL='sqlite:///' + os.path.join(pasta, 'carga.db'))
+        os.environ.setdefault('SECRET_KEY', 'carga')
+        os.environ.setdefault('SUPABASE_KEY', 'eyJhbGciOiJIUzI1NiJ9.e30.abc')
+        from asgi import _teste_carga
+        _teste_carga(pasta, args.usuarios, args.duracao, args.latencia)
+        servidor.shutdown()
+    else:
+        import uvicorn
+        uvicorn.run('asgi:application', host='0.0.0.0', port=args.porta)
+    raise SystemExit
+
+import asyncio
+import hashlib
+import os
+from collections import namedtuple
+from urllib.parse import parse_qsl
+
+from itsdangerous import BadSignature
+from werkzeug.datastructures import MultiDict
+from werkzeug.exceptions import HTTPException, RequestEntityTooLarge
+from werkzeug.http import parse_accept_header, parse_cookie, parse_etags, parse_options_header, quote_etag
+from werkzeug.routing import Map, Rule
+from werkzeug.sansio.multipart import Data, Epilogue, Field, File, MultipartDecoder, NeedData
+
+try:
+    from a2wsgi import WSGIMiddleware
+except ImportError:
+    raise ImportError('O servidor ASGI precisa do a2wsgi e do uvicorn: pip install a2wsgi uvicorn')
+
+# Mesma configuração do wsgi.py e do passenger_wsgi.py
+os.environ.setdefault('FLASK_ENV', 'production')
+
+from app import (app, db, User, supabase, catalogo_cache, snapshot_do_setor, sugestoes_relacionados,
+                 arquivo_foto_pendente, enfileirar_foto, iniciar_servicos, SUPABASE_INDISPONIVEL)
+from cliente_supabase import CircuitoAberto, criar_postgrest_async
+from imagens_produto import validar_imagem
+from repositorio_catalogo import CatalogoRepositorioAsync
+
+# Rotas atendidas no event loop (os endpoints têm o nome dos métodos de AplicacaoAssincrona)
+ROTAS = Map([
+    Rule('/api/catalogo', endpoint='catalogo_api', methods=['GET']),
+    Rule('/api/search-products', endpoint='search_products_api', methods=['GET']),
+    Rule('/api/product/<int:product_id>/photo', endpoint='upload_product_photo', methods=['POST']),
+])
+
+FotoRecebida = namedtuple('FotoRecebida', 'caminho sha mimetype')
+
+
+class Requisicao:
+    """O que as rotas do event loop usam da requisição ASGI"""
+
+    def __init__(self, scope, receive):
+        self.scope = scope
+        self.receive = receive
+        self.cabecalhos = {nome.decode('latin-1').lower(): valor.decode('latin-1')
+                           for nome, valor in scope['headers']}
+        self.args = MultiDict(parse_qsl(scope.get('query_string', b'').decode('latin-1')))
+        self.sessao = ler_sessao(self.cabecalhos.get('cookie'))
+
+
+def ler_sessao(cookie):
+    """Sessão do Flask lida do cookie assinado (mesma validação do app); {} se ausente ou inválida"""
+    valor = parse_cookie(cookie or '').get(app.config['SESSION_COOKIE_NAME'])
+    serializador = app.session_interface.get_signing_serializer(app)
+    if not valor or serializador is None:
+        return {}
+    try:
+        return serializador.loads(valor, max_age=int(app.permanent_session_lifetime.total_seconds()))
+    except BadSignature:
+        return {}
+
+
+def _usuario_admin(user_id):
+    with app.app_context():
+        user = db.session.get(User, user_id)
+        return bool(user and user.is_admin)
+
+
+async def acesso_negado(sessao, admin=False):
+    """Regras de login_required, admin_required e categoria_required: caminho do redirecionamento ou None"""
+    if 'user_id' not in sessao:
+        return '/login'
+    if admin and not await asyncio.to_thread(_usuario_admin, sessao['user_id']):
+        return '/'
+    if 'categoria_loja' not in sessao:
+        return '/selecionar-setor'
+    return None
+
+
+def derivados_prontos(categoria, *nomes):
+    """Entrada do setor em cache se todas as estruturas já estiverem montadas, senão None"""
+    entrada = catalogo_cache.entrada_pronta(categoria)
+    if entrada is None or any(entrada.derivado_pronto(nome) is None for nome in nomes):
+        return None
+    return entrada
+
+
+async def receber_foto(req, limite):
+    """
+    Lê o multipart em blocos, sem juntar o corpo na memória: o campo `image` vai para
+    FOTOS_PENDENTES com o SHA-256 calculado no caminho, como app.receber_foto.
+    ValueError se não vier uma imagem válida; RequestEntityTooLarge acima de `limite` bytes
+    """
+    tipo, opcoes = parse_options_header(req.cabecalhos.get('content-type'))
+    if tipo != 'multipart/form-data' or not opcoes.get('boundary'):
+        raise ValueError('Nenhuma imagem enviada')
+    if limite and int(req.cabecalhos.get('content-length') or 0) > limite:
+        raise RequestEntityTooLarge()
+
+    decoder = MultipartDecoder(opcoes['boundary'].encode('latin-1'))
+    sha = hashlib.sha256()
+    arquivo = caminho = mimetype = None
+    gravando = False
+    recebidos = 0
+
+    def proximo_evento():
+        try:
+            return decoder.next_event()
+        except ValueError:
+            raise ValueError('Nenhuma imagem enviada') from None  # multipart malformado
+
+    def processar(bloco):
+        nonlocal arquivo, caminho, mimetype, gravando
+        decoder.receive_data(bloco)
+        evento = proximo_evento()
+        while not isinstance(evento, (NeedData, Epilogue)):
+            if isinstance(evento, File):
+                # Só o primeiro campo `image` com arquivo; os demais campos são ignorados
+                gravando = evento.name == 'image' and bool(evento.filename) and arquivo is None
+                if gravando:
+                    caminho = arquivo_foto_pendente(evento.filename)
+                    arquivo = open(caminho, 'wb')
+                    mimetype = parse_options_header(evento.headers.get('content-type'))[0]
+            elif isinstance(evento, Field):
+                gravando = False
+            elif isinstance(evento, Data) and gravando:
+                arquivo.write(evento.data)
+                sha.update(evento.data)
+            evento = proximo_evento()
+
+    try:
+        mais = True
+        while mais:
+            mensagem = await req.receive()
+            if mensagem['type'] == 'http.disconnect':
+                raise ValueError('Upload interrompido')
+            bloco = mensagem.get('body', b'')
+            mais = mensagem.get('more_body', False)
+            recebidos += len(bloco)
+            if limite and recebidos > limite:
+                raise RequestEntityTooLarge()
+            processar(bloco)
+        processar(None)
+        if arquivo is None:
+            raise ValueError('Nenhuma imagem enviada')
+        arquivo.close()
+        await asyncio.to_thread(validar_imagem, caminho)
+    except BaseException:
+        if arquivo is not None:
+            arquivo.close()
+            os.remove(caminho)
+        raise
+    return FotoRecebida(caminho, sha.hexdigest(), mimetype)
+
+
+async def responder(send, status, corpo=b'', cabecalhos=()):
+    cabecalhos = [(nome.lower().encode('latin-1'), str(valor).encode('latin-1')) for nome, valor in cabecalhos]
+    if status != 304:
+        cabecalhos.append((b'content-length', str(len(corpo)).encode('latin-1')))
+    await send({'type': 'http.response.start', 'status': status, 'headers': cabecalhos})
+    await send({'type': 'http.response.body', 'body': corpo})
+
+
+async def responder_json(send, status, dados, cabecalhos=()):
+    """Equivalente ao jsonify do Flask"""
+    corpo = f'{app.json.dumps(dados)}\n'.encode('utf-8')
+    await responder(send, status, corpo, [('Content-Type', 'application/json'), *cabecalhos])
+
+
+async def redirecionar(req, send, caminho):
+    await responder(send, 302, cabecalhos=[('Location', req.scope.get('root_path', '') + caminho)])
+
+
+class AplicacaoAssincrona:
+    """Rotas de ROTAS no event loop; o resto vai para o Flask num pool de threads"""
+
+    def __init__(self, flask_app, threads):
+        self.flask = WSGIMiddleware(flask_app, workers=threads)
+        self.rotas = ROTAS.bind('localhost')
+        self._repo = None
+
+    @property
+    def repo(self):
+        # O cliente assíncrono pertence ao event loop: é criado na primeira requisição
+        if self._repo is None:
+            self._repo = CatalogoRepositorioAsync(criar_postgrest_async(supabase))
+        return self._repo
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            return await self._ciclo_de_vida(receive, send)
+        if scope['type'] == 'http' and scope['method'] != 'HEAD':
+            try:
+                endpoint, argumentos = self.rotas.match(scope['path'], scope['method'])
+            except HTTPException:
+                endpoint = None
+            if endpoint:
+                return await self._atender(endpoint, argumentos, Requisicao(scope, receive), send)
+        await self.flask(scope, receive, send)
+
+    async def _ciclo_de_vida(self, receive, send):
+        while True:
+            mensagem = await receive()
+            if mensagem['type'] == 'lifespan.startup':
+                try:
+                    await asyncio.to_thread(iniciar_servicos)
+                except Exception as e:
+                    await send({'type': 'lifespan.startup.failed', 'message': str(e)})
+                    return
+                await send({'type': 'lifespan.startup.complete'})
+            elif mensagem['type'] == 'lifespan.shutdown':
+                if self._repo is not None:
+                    await self._repo.client.aclose()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def _atender(self, endpoint, argumentos, req, send):
+        try:
+            await getattr(self, endpoint)(req, send, **argumentos)
+        except CircuitoAberto:
+            await responder_json(send, 503, {'error': SUPABASE_INDISPONIVEL}, [('Retry-After', '30')])
+        except HTTPException as e:
+            await responder_json(send, e.code, {'success': False, 'error': e.description})
+        except Exception as e:
+            print(f"Erro em {req.scope['method']} {req.scope['path']}: {e}")
+            await responder_json(send, 500, {'error': 'Erro interno do servidor'})
+
+    async def catalogo_api(self, req, send):
+        """Mesmo corpo, ETag e cabeçalhos da rota do Flask"""
+        destino = await acesso_negado(req.sessao)
+        if destino:
+            return await redirecionar(req, send, destino)
+        categoria = req.sessao['categoria_loja']
+
+        entrada = derivados_prontos(categoria, 'snapshot')
+        payload = entrada.derivado_pronto('snapshot').payload_pronto if entrada else None
+        if payload is None:
+            # Cache frio: carga do Supabase, snapshot e compressão são CPU; ficam numa thread (uma carga por setor)
+            payload = await asyncio.to_thread(lambda: snapshot_do_setor(categoria).payload)
+            entrada = catalogo_cache.entrada_pronta(categoria)
+
+        cabecalhos = [('ETag', quote_etag(payload.versao)), ('Vary', 'Accept-Encoding, Cookie'),
+                      ('Cache-Control', 'private, no-cache')]
+        if entrada is not None and entrada.desatualizada:
+            cabecalhos.append(('X-Catalogo-Desatualizado', '1'))
+        if parse_etags(req.cabecalhos.get('if-none-match')).contains(payload.versao):
+            return await responder(send, 304, cabecalhos=cabecalhos)
+
+        corpo, encoding = payload.corpo(parse_accept_header(req.cabecalhos.get('accept-encoding')))
+        cabecalhos.append(('Content-Type', 'application/json'))
+        if encoding:
+            cabecalhos.append(('Content-Encoding', encoding))
+        await responder(send, 200, corpo, cabecalhos)
+
+    async def search_products_api(self, req, send):
+        """Produtos para vincular como relacionados; no loop quando o índice já está montado"""
+        destino = await acesso_negado(req.sessao, admin=True)
+        if destino:
+            return await redirecionar(req, send, destino)
+        categoria = req.sessao['categoria_loja']
+        query = req.args.get('q', '').strip()
+        exclude_id = req.args.get('exclude_id', type=int)
+
+        entrada = derivados_prontos(categoria, 'indice_nomes', 'snapshot')
+        if entrada is not None:
+            resultado = sugestoes_relacionados(categoria, query, exclude_id)
+        else:
+            resultado = await asyncio.to_thread(sugestoes_relacionados, categoria, query, exclude_id)
+            entrada = catalogo_cache.entrada_pronta(categoria)
+        cabecalhos = [('X-Catalogo-Desatualizado', '1')] if entrada is not None and entrada.desatualizada else []
+        await responder_json(send, 200, resultado, cabecalhos)
+
+    async def upload_product_photo(self, req, send, product_id):
+        """O Supabase confere o produto enquanto o upload ainda está chegando"""
+        destino = await acesso_negado(req.sessao, admin=True)
+        if destino:
+            return await redirecionar(req, send, destino)
+        categoria = req.sessao['categoria_loja']
+
+        product, foto = await asyncio.gather(self.repo.buscar(product_id, categoria),
+                                             receber_foto(req, app.config['MAX_CONTENT_LENGTH']),
+                                             return_exceptions=True)
+        if isinstance(foto, FotoRecebida) and (isinstance(product, BaseException) or not product):
+            os.remove(foto.caminho)
+        if isinstance(product, BaseException):
+            raise product
+        if not product:
+            return await responder_json(send, 404, {'success': False, 'error': 'Produto não encontrado'})
+        if isinstance(foto, ValueError):
+            return await responder_json(send, 400, {'success': False, 'error': str(foto)})
+        if isinstance(foto, BaseException):
+            raise foto
+
+        image_field = 'imagem' if 'imagem' in product else 'image'
+        tarefa_id = await asyncio.to_thread(enfileirar_foto, categoria, product_id, foto.caminho, image_field,
+                                            foto.mimetype, foto.sha)
+        urls = app.url_map.bind('localhost', script_name=req.scope.get('root_path') or '/')
+        await responder_json(send, 202, {'success': True, 'processing': True,
+                                         'status_url': urls.build('admin_tarefa_status', {'tarefa_id': tarefa_id})})
+
+
+application = AplicacaoAssincrona(app, threads=app.config['ASGI_THREADS'])
+
+
+def _teste_carga(pasta, usuarios, duracao, latencia):
+    import io
+    import json
+    import random
+    import socket
+    import sqlite3
+    import subprocess
+    import sys
+    import time
+    from collections import Counter
+
+    import httpx
+    from PIL import Image
+    from app import init_db
+
+    init_db()
+    with app.app_context():
+        admin = User.query.filter_by(username='admin').first()
+        cookie = app.session_interface.get_signing_serializer(app).dumps(
+            {'user_id': admin.id, 'username': 'admin', 'is_admin': True, 'categoria_loja': 'automotivo'})
+    cabecalhos = {'Cookie': f"{app.config['SESSION_COOKIE_NAME']}={cookie}", 'Accept-Encoding': 'br, gzip'}
+    termos = ['tinta', 'verniz azul', 'primer', 'esmalte br', 'lixa', 'catalisador', 'spray pr', 'massa']
+    imagem = io.BytesIO()
+    Image.new('RGB', (64, 64), 'red').save(imagem, 'PNG')
+    foto = imagem.getvalue()
+
+    async def pedir(cliente, metodo, url, **kwargs):
+        # Lê o corpo sem descomprimir: quem mede é o servidor, não o cliente
+        resposta = await cliente.send(cliente.build_request(metodo, url, **kwargs), stream=True)
+        async for _ in resposta.aiter_raw():
+            pass
+        await resposta.aclose()
+        return resposta.status_code
+
+    async def carga(base):
+        tempos = {'catálogo': [], 'busca relacionados': [], 'foto': []}
+        erros = Counter()
+        limites = httpx.Limits(max_connections=usuarios, max_keepalive_connections=usuarios)
+        async with httpx.AsyncClient(base_url=base, headers=cabecalhos, limits=limites, timeout=30) as cliente:
+            fim = time.monotonic() + duracao
+
+            async def vendedor(numero):
+                rnd = random.Random(numero)
+                while time.monotonic() < fim:
+                    sorteio = rnd.random()
+                    inicio = time.perf_counter()
+                    try:
+                        if sorteio < 0.4:
+                            rota, esperado = 'catálogo', 200
+                            status = await pedir(cliente, 'GET', '/api/catalogo')
+                        elif sorteio < 0.8:
+                            rota, esperado = 'busca relacionados', 200
+                            status = await pedir(cliente, 'GET', '/api/search-products',
+                                                 params={'q': rnd.choice(termos)})
+                        else:
+                            rota, esperado = 'foto', 202
+                            status = await pedir(cliente, 'POST', f'/api/product/{rnd.randint(1, 1500)}/photo',
+                                                 files={'image': ('foto.png', foto, 'image/png')})
+                    except httpx.HTTPError as e:
+                        status = type(e).__name__
+                    if time.monotonic() > fim:
+                        break  # só conta o que terminou dentro da janela
+                    if status == esperado:
+                        tempos[rota].append(time.perf_counter() - inicio)
+                    else:
+                        erros[f'{rota}: {status}'] += 1
+
+            await asyncio.gather(*(vendedor(numero) for numero in range(usuarios)))
+        return tempos, erros
+
+    def porta_livre():
+        with socket.socket() as s:
+            s.bind(('127.0.0.1', 0))
+            return s.getsockname()[1]
+
+    servidores = (
+        ('Waitress (6 threads)', [sys.executable, '-m', 'waitress', '--listen=127.0.0.1:{porta}', '--threads=6',
+                                  'app:app']),
+        ('ASGI (uvicorn)', [sys.executable, '-m', 'uvicorn', 'asgi:application', '--host', '127.0.0.1',
+                            '--port', '{porta}', '--log-level', 'warning']),
+    )
+    print(f"{usuarios} vendedores sem pausa por {duracao:.0f}s; Supabase local com {latencia * 1000:.0f} ms por chamada")
+    print("40% catálogo, 40% busca de relacionados, 20% upload de foto\n")
+    vazao = {}
+    for nome, comando in servidores:
+        porta = porta_livre()
+        fila_db = os.path.join(pasta, f'tarefas_{porta}.db')
+        processo = subprocess.Popen([parte.format(porta=porta) for parte in comando],
+                                    cwd=os.path.dirname(os.path.abspath(__file__)),
+                                    env=dict(os.environ, FILA_TAREFAS_DB=fila_db),
+                                    stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        base = f'http://127.0.0.1:{porta}'
+        try:
+            # Espera o servidor subir e deixa o catálogo e o índice de busca em cache
+            for _ in range(300):
+                if processo.poll() is not None:
+                    raise SystemExit(f"{nome} não subiu: {' '.join(processo.args)}")
+                try:
+                    httpx.get(base + '/api/search-products', params={'q': 'tinta'}, headers=cabecalhos)
+                    break
+                except httpx.TransportError:
+                    time.sleep(0.1)
+            tempos, erros = asyncio.run(carga(base))
+            vazao[nome] = sum(len(t) for t in tempos.values()) / duracao
+            print(f"{nome}: {vazao[nome]:.0f} req/s, {sum(erros.values())} erros {dict(erros) or ''}")
+            for rota, lista in tempos.items():
+                lista.sort()
+                if lista:
+                    print(f"  {rota:<20} {len(lista):>6} | mediana {lista[len(lista) // 2] * 1000:6.0f} ms | "
+                          f"p95 {lista[int(len(lista) * 0.95)] * 1000:6.0f} ms")
+        finally:
+            processo.terminate()
+            processo.wait()
+            # As fotos ficaram pendentes na fila (sem threads): apaga os arquivos recebidos
+            if os.path.exists(fila_db):
+                with sqlite3.connect(fila_db) as conexao:
+                    for (dados,) in conexao.execute("SELECT dados FROM tarefas WHERE tipo = 'foto_produto'"):
+                        caminho = json.loads(dados)['caminho']
+                        if os.path.exists(caminho):
+                            os.remove(caminho)
+        print()
+    primeiro, segundo = (vazao[nome] for nome, _ in servidores)
+    print(f"Vazão do ASGI: {segundo / primeiro:.1f}x a do Waitress")
@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+"""
+Índice invertido posicional de trigramas sobre os nomes dos produtos
+Usado pela busca de produtos relacionados (/api/search-products)
+"""
+import heapq
+
+from normalizacao import normalizar
+
+# Marca o fim do nome para que todo bigrama do nome seja prefixo de um trigrama
+FIM = '\x00'
+
+
+class IndiceNomes:
+    """
+    Busca por substring nos nomes de um setor sem varrer o catálogo.
+
+    Cada par (trigrama, posição no nome) aponta para a lista, em ordem de
+    catálogo, dos produtos que têm aquele trigrama naquela posição. Como o
+    ranking é "ocorrência mais perto do início primeiro, depois ordem do
+    catálogo", a busca percorre as posições a partir de 0 e para assim que
+    junta o limite de resultados.
+    """
+
+    def __init__(self, produtos):
+        self.produtos = produtos
+        # Chave de busca já normalizada na carga do catálogo (anotar_chaves_busca)
+        self.nomes = [p.get('chave_busca') or normalizar(p.get('nome')) for p in produtos]
+        self.maior_nome = max((len(n) for n in self.nomes), default=0)
+
+        self._postings = {}
+        for posicao, nome in enumerate(self.nomes):
+            texto = nome + FIM
+            for inicio in range(len(texto) - 2):
+                self._postings.setdefault((texto[inicio:inicio + 3], inicio), []).append(posicao)
+
+        # Bigrama -> trigramas que começam com ele (termos de 2 letras)
+        self._por_prefixo = {}
+        for trigrama in {t for t, _ in self._postings}:
+            self._por_prefixo.setdefault(trigrama[:2], []).append(trigrama)
+
+    def _candidatos_em(self, termo, inicio):
+        """Produtos (em ordem de catálogo) que podem ter `termo` começando em `inicio`"""
+        if len(termo) >= 3:
+            # A lista mais curta entre os trigramas do termo já basta; o resto é conferido no nome
+            menor = None
+            for k in range(len(termo) - 2):
+                lista = self._postings.get((termo[k:k + 3], inicio + k))
+                if not lista:
+                    return ()
+                if menor is None or len(lista) < len(menor):
+                    menor = lista
+            return menor
+        listas = [self._postings[(t, inicio)] for t in self._por_prefixo.get(termo, ())
+                  if (t, inicio) in self._postings]
+        return heapq.merge(*listas)
+
+    def buscar(self, termo, limite=50, excluir_id=None):
+        """
+        Produtos cujo nome contém `termo`, ordenados pela posição da
+        ocorrência (mais perto do início primeiro) e depois pela ordem do catálogo
+        """
+        termo = normalizar(termo)
+        if not termo:
+            return []
+
+        if len(termo) < 2:
+            achados = [(n.find(termo), i) for i, n in enumerate(self.nomes)
+                       if termo in n and self.produtos[i]['id'] != excluir_id]
+            return [self.produtos[i] for _, i in heapq.nsmallest(limite, achados)]
+
+        resultado = []
+        for inicio in range(self.maior_nome - len(termo) + 1):
+            for posicao in self._candidatos_em(termo, inicio):
+                # Conta só a primeira ocorrência do termo no nome
+                if self.nomes[posicao].find(termo) != inicio:
+                    continue
+                produto = self.produtos[posicao]
+                if produto['id'] == excluir_id:
+                    continue
+                resultado.append(produto)
+                if len(resultado) >= limite:
+                    return resultado
+        return resultado
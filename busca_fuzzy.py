@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+"""
+Motor de busca fuzzy do catálogo (/api/search)
+
+Pontua todos os nomes do setor (ou só os das marcas pedidas) de uma vez com o
+partial_ratio do RapidFuzz (implementado em C++), com o corte no limiar dentro
+do próprio RapidFuzz. Não há pré-filtro aproximado: os resultados são os
+mesmos da versão antiga, que comparava produto a produto em Python.
+
+Benchmark: python busca_fuzzy.py --produtos 50000 --consultas 1000
+"""
+import random
+import statistics
+import time
+
+from rapidfuzz import fuzz, process
+
+from normalizacao import normalizar
+
+# Mesmo limiar de similaridade usado desde a versão com fuzzywuzzy
+LIMIAR = 60
+
+
+class MotorBuscaFuzzy:
+    """
+    Nomes normalizados e índice marca -> posições de um setor.
+    `produtos` é uma lista de dicts com id, name, brand, description e image;
+    `chaves` são os nomes já normalizados (coluna product.search_key).
+    """
+
+    def __init__(self, produtos, chaves=None):
+        self.produtos = produtos
+        self.nomes = chaves if chaves is not None else [normalizar(p['name']) for p in produtos]
+
+        marcas = {}
+        for posicao, produto in enumerate(produtos):
+            marcas.setdefault(produto['brand'], []).append(posicao)
+        self._marcas = {marca: frozenset(posicoes) for marca, posicoes in marcas.items()}
+
+    def _permitidos(self, marcas):
+        """Posições das marcas pedidas, em ordem de catálogo (None = sem filtro)"""
+        if not marcas:
+            return None
+        permitidos = set()
+        for marca in marcas:
+            permitidos |= self._marcas.get(marca, frozenset())
+        return sorted(permitidos)
+
+    def buscar(self, termo, marcas=None, limite=None):
+        """
+        Produtos do setor filtrados por marca e ordenados pela similaridade com `termo`
+        (todos os que passam do limiar, ou os `limite` primeiros)
+        """
+        termo = normalizar(termo)
+        posicoes = self._permitidos(marcas)
+        if posicoes is None:
+            posicoes = range(len(self.produtos))
+
+        if not termo:
+            return [self.produtos[p] for p in posicoes][:limite]
+
+        nomes = self.nomes if not marcas else [self.nomes[p] for p in posicoes]
+        resultados = process.extract(termo, nomes, scorer=fuzz.partial_ratio, score_cutoff=LIMIAR,
+                                     limit=None)
+        # Score inteiro como no fuzzywuzzy: maior primeiro, empates na ordem do catálogo
+        resultados = [(round(score), indice) for _, score, indice in resultados if round(score) > LIMIAR]
+        resultados.sort(key=lambda r: (-r[0], r[1]))
+        return [self.produtos[posicoes[indice]] for _, indice in resultados[:limite]]
+
+
+def _benchmark(quantidade, consultas):
+    from supabase_local import BancoLocal
+
+    banco = BancoLocal()
+    banco.popular_produtos(quantidade, setores=('automotivo',))
+    produtos = []
+    for linha in banco.tabelas['produtos']:
+        partes = linha['nome'].split()
+        produtos.append({'id': linha['id'], 'name': linha['nome'], 'brand': partes[-1],
+                         'description': linha['descricao'], 'image': None})
+
+    inicio = time.perf_counter()
+    motor = MotorBuscaFuzzy(produtos)
+    print(f"Índice de {quantidade} produtos construído em {time.perf_counter() - inicio:.2f}s")
+
+    rnd = random.Random(1)
+    termos = []
+    for _ in range(consultas):
+        palavras = rnd.choice(produtos)['name'].split()[:rnd.randint(1, 3)]
+        termo = ' '.join(palavras).lower()
+        if len(termo) > 4 and rnd.random() < 0.5:
+            i = rnd.randrange(len(termo))
+            termo = termo[:i] + termo[i + 1:]  # erro de digitação
+        termos.append(termo)
+
+    tempos = []
+    for termo in termos:
+        marcas = [rnd.choice(produtos)['brand']] if rnd.random() < 0.2 else None
+        inicio = time.perf_counter()
+        motor.buscar(termo, marcas)
+        tempos.append((time.perf_counter() - inicio) * 1000)
+
+    tempos.sort()
+    p99 = tempos[int(len(tempos) * 0.99) - 1]
+    print(f"{consultas} buscas: p50 {statistics.median(tempos):.2f} ms | "
+          f"p99 {p99:.2f} ms | máx {tempos[-1]:.2f} ms")
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Benchmark da busca fuzzy')
+    parser.add_argument('--produtos', type=int, default=50000)
+    parser.add_argument('--consultas', type=int, default=1000)
+    args = parser.parse_args()
+    _benchmark(args.produtos, args.consultas)
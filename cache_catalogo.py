@@ -0,0 +1,157 @@
+# -*- coding: utf-8 -*-
+"""
+Cache em memória do catálogo de produtos (Supabase)
+Mantém uma cópia da tabela `produtos` por setor, com TTL e limite de setores
+
+Com max_desatualizado > 0, a cópia vencida (ou invalidada) é guardada até a
+próxima carga dar certo: se o Supabase falhar, ela continua sendo servida,
+marcada como desatualizada, por até max_desatualizado segundos desde a carga,
+e uma nova carga só é tentada a cada `nova_tentativa` segundos.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+
+class EntradaCatalogo:
+    """Produtos de um setor carregados do Supabase"""
+
+    def __init__(self, produtos, versao):
+        self.produtos = produtos
+        self.versao = versao
+        self.carregado_em = time.monotonic()
+        self.vencida = False  # invalidada; só serve se o Supabase estiver fora
+        self.desatualizada = False  # servida no lugar de uma carga que falhou
+        self.nova_tentativa_em = 0.0
+        self._derivados = {}
+        self._lock = threading.Lock()
+
+    def derivado(self, nome, construir):
+        """Estrutura calculada a partir dos produtos (índices etc.), construída uma única vez"""
+        with self._lock:
+            if nome not in self._derivados:
+                self._derivados[nome] = construir(self.produtos)
+            return self._derivados[nome]
+
+    def derivado_pronto(self, nome):
+        """Estrutura já construída ou None (nunca constrói)"""
+        with self._lock:
+            return self._derivados.get(nome)
+
+
+class CatalogoCache:
+    """
+    Cache do catálogo por setor.
+
+    Cada processo (worker) tem a sua própria cópia: as escritas feitas pelo
+    admin invalidam o cache local na hora e o TTL limita o tempo que os
+    outros workers levam para enxergar a mudança.
+    """
+
+    def __init__(self, ttl=300, max_setores=4, max_desatualizado=0, nova_tentativa=15):
+        self.ttl = ttl
+        self.max_setores = max_setores
+        self.max_desatualizado = max_desatualizado
+        self.nova_tentativa = nova_tentativa
+        self._entradas = OrderedDict()
+        self._lock = threading.Lock()
+        self._locks_carga = {}
+        self._versao = 0
+        # Gerações de invalidação (global e por setor): uma carga que começou antes
+        # de uma escrita do admin não pode ser guardada como cópia válida
+        self._geracao = 0
+        self._geracoes = {}
+
+    def _geracao_do_setor(self, setor):
+        """Chamar com self._lock"""
+        return self._geracao, self._geracoes.get(setor, 0)
+
+    def _lock_carga(self, setor):
+        with self._lock:
+            return self._locks_carga.setdefault(setor, threading.Lock())
+
+    def _entrada_valida(self, setor):
+        with self._lock:
+            entrada = self._entradas.get(setor)
+            if entrada is None:
+                return None
+            agora = time.monotonic()
+            # Supabase falhou há pouco: segue com a cópia antiga sem tentar de novo a cada requisição
+            aguardando = entrada.desatualizada and agora < entrada.nova_tentativa_em
+            if not aguardando and (entrada.vencida or agora - entrada.carregado_em > self.ttl):
+                if not self.max_desatualizado:
+                    del self._entradas[setor]
+                return None
+            self._entradas.move_to_end(setor)
+            return entrada
+
+    def _entrada_reserva(self, setor):
+        """Cópia antiga do setor que ainda pode ser servida com o Supabase fora, ou None"""
+        with self._lock:
+            entrada = self._entradas.get(setor)
+        if entrada is None or time.monotonic() - entrada.carregado_em > self.max_desatualizado:
+            return None
+        return entrada
+
+    def entrada_pronta(self, setor):
+        """Entrada válida do setor sem carregar: None quando seria preciso ir ao Supabase"""
+        return self._entrada_valida(setor)
+
+    def obter_entrada(self, setor, carregar):
+        """
+        Retorna a entrada do setor, chamando `carregar(setor)` quando não
+        houver cópia válida. Apenas uma thread carrega cada setor por vez;
+        as demais esperam e reaproveitam o resultado.
+        """
+        entrada = self._entrada_valida(setor)
+        if entrada is not None:
+            return entrada
+
+        with self._lock_carga(setor):
+            # Outra thread pode ter carregado enquanto esperávamos
+            entrada = self._entrada_valida(setor)
+            if entrada is not None:
+                return entrada
+
+            with self._lock:
+                geracao = self._geracao_do_setor(setor)
+            try:
+                produtos = carregar(setor)
+            except Exception as e:
+                entrada = self._entrada_reserva(setor) if self.max_desatualizado else None
+                if entrada is None:
+                    raise
+                idade = int(time.monotonic() - entrada.carregado_em)
+                print(f"Catálogo {setor}: falha ao carregar do Supabase ({e}); servindo cópia de {idade}s atrás")
+                entrada.desatualizada = True
+                entrada.nova_tentativa_em = time.monotonic() + self.nova_tentativa
+                return entrada
+
+            with self._lock:
+                self._versao += 1
+                entrada = EntradaCatalogo(produtos, self._versao)
+                # Invalidada durante a carga: serve esta requisição, mas a próxima recarrega
+                entrada.vencida = geracao != self._geracao_do_setor(setor)
+                self._entradas[setor] = entrada
+                self._entradas.move_to_end(setor)
+                while len(self._entradas) > self.max_setores:
+                    self._entradas.popitem(last=False)
+            return entrada
+
+    def invalidar(self, setor=None):
+        """Descarta o catálogo do setor (ou de todos os setores)"""
+        with self._lock:
+            if setor is None:
+                self._geracao += 1
+            else:
+                self._geracoes[setor] = self._geracoes.get(setor, 0) + 1
+            if self.max_desatualizado:
+                # Guarda a cópia como reserva; a próxima leitura recarrega
+                for nome, entrada in self._entradas.items():
+                    if setor is None or nome == setor:
+                        entrada.vencida = True
+                        entrada.nova_tentativa_em = 0.0
+            elif setor is None:
+                self._entradas.clear()
+            else:
+                self._entradas.pop(setor, None)
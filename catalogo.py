@@ -0,0 +1,250 @@
+# -*- coding: utf-8 -*-
+"""
+Visão materializada do catálogo de um setor
+Marcas e os dicts já formatados para o template, montados uma vez
+por carga do catálogo e reaproveitados por todas as telas
+"""
+import base64
+import gzip
+import hashlib
+import json
+import threading
+from bisect import bisect_right
+
+try:
+    import brotli
+except ImportError:  # Brotli é opcional; sem ele o catálogo sai só em gzip
+    brotli = None
+
+from normalizacao import normalizar
+from imagens_produto import variantes_da_url
+
+
+def extrair_marca(nome):
+    """A marca é a última palavra do nome (produtos de uma palavra não têm marca)"""
+    partes = (nome or '').split()
+    return partes[-1] if len(partes) > 1 else ''
+
+
+def separar_nome_marca(nome):
+    """Retorna (nome sem a marca, marca)"""
+    partes = (nome or '').split()
+    if len(partes) > 1:
+        return ' '.join(partes[:-1]), partes[-1]
+    return nome or '', ''
+
+
+def ids_relacionados(produto):
+    """IDs dos produtos relacionados (catalisadores) como texto separado por vírgula"""
+    if produto.get('produto_relacionado_ids'):
+        return produto['produto_relacionado_ids']
+    # Compatibilidade com campo antigo (single ID)
+    if produto.get('produto_relacionado_id'):
+        return str(produto['produto_relacionado_id'])
+    return ''
+
+
+def lista_ids_relacionados(produto):
+    """IDs dos produtos relacionados como lista de inteiros, sem repetição (ignora valores inválidos)"""
+    ids = []
+    for parte in ids_relacionados(produto).split(','):
+        try:
+            ids.append(int(parte))
+        except ValueError:
+            continue
+    return list(dict.fromkeys(ids))
+
+
+def produto_view_model(produto):
+    """Produto do Supabase no formato esperado pelo index.html"""
+    imagem = produto.get('imagem') or produto.get('image')
+    variantes = variantes_da_url(imagem)
+    return {
+        'id': produto['id'],
+        'name': produto['nome'],
+        'brand': extrair_marca(produto['nome']),
+        'search_key': produto['chave_busca'],
+        'description': produto.get('descricao') or '',
+        # Usar URL da imagem se existir (imagem ou image)
+        'image': imagem,
+        # Versões menores para a grade (None em fotos antigas, sem versões)
+        'image_thumb': variantes['thumb'] if variantes['thumb'] != imagem else None,
+        'image_card': variantes['card'] if variantes['card'] != imagem else None,
+        'related_product_ids': lista_ids_relacionados(produto),
+        'em_queima_estoque': produto.get('em_queima_estoque', False),
+        'preco_original': produto.get('preco_original'),
+        'preco_queima': produto.get('preco_queima')
+    }
+
+
+class SnapshotCatalogo:
+    """Catálogo de um setor pronto para as telas"""
+
+    def __init__(self, produtos):
+        self.produtos = [produto_view_model(p) for p in produtos]
+        self.por_id = {p['id']: p for p in self.produtos}
+
+        self.marcas = sorted({p['brand'] for p in self.produtos if p['brand']})
+
+        # A versão (hash do JSON) sai já na montagem: deltas e ETag não dependem da compressão
+        self._json = json.dumps(self.produtos, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+        self.versao = hashlib.sha256(self._json).hexdigest()[:20]
+        self._payload = None
+        self._lock_payload = threading.Lock()
+
+    @property
+    def payload(self):
+        """Catálogo serializado e comprimido para /api/catalogo (montado uma única vez)"""
+        if self._payload is None:
+            with self._lock_payload:
+                # Quem chega durante a compressão espera por ela em vez de comprimir de novo
+                if self._payload is None:
+                    self._payload = PayloadCatalogo(self.versao, self._json)
+                    self._json = None
+        return self._payload
+
+    def preparar_payload(self):
+        """Comprime o catálogo numa thread, para a primeira requisição já encontrá-lo pronto"""
+        threading.Thread(target=lambda: self.payload, name='catalogo-payload', daemon=True).start()
+
+    @property
+    def payload_pronto(self):
+        """O payload se já foi montado, senão None (nunca monta)"""
+        return self._payload
+
+
+class GrafoRelacionados:
+    """
+    Produtos relacionados (catalisadores) de um setor: arestas diretas
+    (produto -> seus catalisadores) e reversas (catalisador -> quem o usa)
+    """
+
+    def __init__(self, produtos):
+        self.por_id = {p['id']: p for p in produtos}
+        self.diretos = {}
+        self.reversos = {}
+        for produto in produtos:
+            ids = lista_ids_relacionados(produto)
+            if ids:
+                self.diretos[produto['id']] = ids
+                for relacionado in ids:
+                    self.reversos.setdefault(relacionado, []).append(produto['id'])
+
+    def relacionados(self, produto_id, ids=None):
+        """
+        Catalisadores do produto que existem no catálogo. `ids` substitui a lista
+        do catálogo em cache (ex.: a do produto recém-lido do Supabase)
+        """
+        ids = self.diretos.get(produto_id, ()) if ids is None else ids
+        return [self.por_id[i] for i in ids if i in self.por_id]
+
+    def usado_por(self, produto_id):
+        """Produtos que apontam para `produto_id` como catalisador"""
+        return [self.por_id[i] for i in self.reversos.get(produto_id, ())]
+
+    def limpezas(self, produto_id):
+        """
+        Atualizações que tiram `produto_id` dos produtos que apontam para ele,
+        agrupadas por valor novo: lista de (dados, [ids])
+        """
+        grupos = {}
+        for ref_id in self.reversos.get(produto_id, ()):
+            produto = self.por_id[ref_id]
+            restantes = [str(i) for i in lista_ids_relacionados(produto) if i != produto_id]
+            dados = {'produto_relacionado_ids': ','.join(restantes) or None}
+            # Campo antigo (single ID)
+            if produto.get('produto_relacionado_id') == produto_id:
+                dados['produto_relacionado_id'] = None
+            grupos.setdefault(tuple(sorted(dados.items())), []).append(ref_id)
+        return [(dict(chave), ids) for chave, ids in grupos.items()]
+
+
+class ListagemAdmin:
+    """
+    Produtos do setor em ordem de (nome, id) para a listagem paginada do admin.
+    A paginação é por cursor (keyset): cada página começa logo depois do último
+    (nome, id) entregue, com busca binária, sem depender do tamanho do catálogo.
+    """
+
+    def __init__(self, produtos):
+        # Produto sem nome (NULL no Supabase) entra como '' para não quebrar a ordenação
+        self.linhas = sorted(produtos, key=lambda p: (p['nome'] or '', p['id']))
+        self.chaves = [(p['nome'] or '', p['id']) for p in self.linhas]
+        # Índice da promoção: costuma ter poucas dezenas de produtos num setor de milhares
+        self.em_queima = [p for p in self.linhas if p.get('em_queima_estoque')]
+
+    @staticmethod
+    def _confere(produto, palavras, em_queima=None):
+        if em_queima is not None and bool(produto.get('em_queima_estoque')) != em_queima:
+            return False
+        # Todas as palavras da busca devem estar no nome (sem acentos)
+        nome = produto.get('chave_busca') or normalizar(produto['nome'] or '')
+        return all(palavra in nome for palavra in palavras)
+
+    def pagina(self, depois=None, termo='', limite=50, em_queima=None):
+        """Retorna (produtos, cursor da próxima página ou None); `em_queima` filtra pelo status"""
+        inicio = bisect_right(self.chaves, depois) if depois else 0
+        palavras = normalizar(termo).split()
+        filtrar = bool(palavras) or em_queima is not None
+
+        resultado = []
+        for posicao in range(inicio, len(self.linhas)):
+            produto = self.linhas[posicao]
+            if filtrar and not self._confere(produto, palavras, em_queima):
+                continue
+            resultado.append(produto)
+            if len(resultado) >= limite:
+                mais = posicao + 1 < len(self.linhas)
+                return resultado, (self.chaves[posicao] if mais else None)
+        return resultado, None
+
+    def contar(self, termo='', em_queima=None):
+        palavras = normalizar(termo).split()
+        if not palavras:
+            if em_queima is None:
+                return len(self.linhas)
+            return len(self.em_queima) if em_queima else len(self.linhas) - len(self.em_queima)
+        return sum(1 for p in self.linhas if self._confere(p, palavras, em_queima))
+
+
+def codificar_cursor(chave):
+    """(nome, id) -> texto opaco para a URL"""
+    return base64.urlsafe_b64encode(json.dumps(list(chave)).encode('utf-8')).decode('ascii')
+
+
+def decodificar_cursor(cursor):
+    """Inverso de codificar_cursor; ValueError se o cursor for inválido"""
+    try:
+        nome, produto_id = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+    except (TypeError, ValueError, UnicodeError) as e:
+        raise ValueError('Cursor inválido') from e
+    # Cursores antigos podem trazer nome null (produto sem nome)
+    if nome is None:
+        nome = ''
+    if not isinstance(nome, str) or not isinstance(produto_id, int):
+        raise ValueError('Cursor inválido')
+    return nome, produto_id
+
+
+class PayloadCatalogo:
+    """
+    JSON do catálogo em bruto, gzip e brotli. A versão é o hash do conteúdo:
+    o mesmo catálogo gera a mesma versão (e o mesmo ETag) em qualquer worker.
+
+    Níveis de compressão rápidos (dezenas de ms para 5 mil produtos): o brotli
+    quality=11 levava segundos a cada invalidação para ganhar ~20% no tamanho.
+    """
+
+    def __init__(self, versao, produtos_json):
+        self.versao = versao
+        self.bruto = b'{"versao":"' + versao.encode('ascii') + b'","produtos":' + produtos_json + b'}'
+        self.gzip = gzip.compress(self.bruto, compresslevel=6, mtime=0)
+        self.brotli = brotli.compress(self.bruto, quality=5) if brotli else None
+
+    def corpo(self, aceitas):
+        """Retorna (bytes, Content-Encoding) conforme o Accept-Encoding do cliente"""
+        if self.brotli is not None and 'br' in aceitas:
+            return self.brotli, 'br'
+        if 'gzip' in aceitas:
+            return self.gzip, 'gzip'
+        return self.bruto, None
@@ -0,0 +1,331 @@
+# -*- coding: utf-8 -*-
+"""
+Cliente do Supabase preparado para lentidão e falhas do upstream
+
+O create_client padrão abre um pool httpx para o PostgREST e outro para o
+Storage, sem limites ajustados, com timeout fixo e sem repetição: quando o
+Supabase fica lento, todas as threads do Waitress ficam presas esperando e a
+loja para. criar_cliente() devolve o mesmo cliente do supabase-py, mas com os
+dois usando um único transporte compartilhado entre as threads, que tem:
+
+- pool de conexões keep-alive dimensionado (conexoes)
+- timeouts por chamada (conexão, leitura e espera por conexão livre no pool) e
+  um prazo por chamada que inclui as repetições
+- repetição de leituras idempotentes (GET/HEAD) em erro de rede, 429, 502, 503
+  e 504, com espera exponencial e jitter
+- disjuntor: depois de `falhas` falhas seguidas, as chamadas falham na hora
+  (CircuitoAberto) por `espera` segundos; então uma chamada de teste decide se
+  o circuito fecha de novo
+
+Escritas nunca são repetidas aqui (a fila de tarefas cuida disso).
+
+criar_postgrest_async() dá a versão assíncrona do PostgREST para o modo ASGI
+(asgi.py), com as mesmas regras e o mesmo disjuntor.
+
+Benchmark: python cliente_supabase.py --latencia 2 --taxa-erro 0.2
+"""
+import asyncio
+import random
+import threading
+import time
+
+import httpx
+from postgrest._async.client import AsyncPostgrestClient
+from postgrest._sync.client import SyncPostgrestClient
+from storage3._sync.client import SyncStorageClient
+from storage3.utils import SyncClient as SessaoStorage
+from supabase import create_client
+
+METODOS_IDEMPOTENTES = {'GET', 'HEAD'}
+STATUS_REPETIVEIS = {429, 502, 503, 504}
+
+
+class CircuitoAberto(httpx.TransportError):
+    """O Supabase está falhando: a chamada nem foi feita"""
+
+
+class Disjuntor:
+    """Conta falhas seguidas do upstream; aberto, deixa passar uma chamada de teste a cada `espera` segundos"""
+
+    def __init__(self, falhas=5, espera=30.0):
+        self.limite = falhas
+        self.espera = espera
+        self._falhas = 0
+        self._aberto_ate = 0.0
+        self._testando = False
+        self._lock = threading.Lock()
+
+    @property
+    def estado(self):
+        with self._lock:
+            if self._falhas < self.limite:
+                return 'fechado'
+            return 'aberto' if time.monotonic() < self._aberto_ate else 'meio-aberto'
+
+    def permitir(self):
+        with self._lock:
+            if self._falhas < self.limite:
+                return True
+            if time.monotonic() < self._aberto_ate or self._testando:
+                return False
+            self._testando = True
+            return True
+
+    def sucesso(self):
+        with self._lock:
+            self._falhas = 0
+            self._testando = False
+
+    def falha(self):
+        with self._lock:
+            self._falhas += 1
+            self._testando = False
+            if self._falhas >= self.limite:
+                self._aberto_ate = time.monotonic() + self.espera
+
+
+class _Repeticao:
+    """Prazo, repetição e disjuntor comuns aos transportes síncrono e assíncrono"""
+
+    def __init__(self, conexoes=20, tentativas=3, espera_base=0.2, espera_maxima=2.0, prazo=15.0,
+                 disjuntor=None):
+        self.conexoes = conexoes
+        self.tentativas = tentativas
+        self.espera_base = espera_base
+        self.espera_maxima = espera_maxima
+        self.prazo = prazo
+        self.disjuntor = disjuntor or Disjuntor()
+
+    def _limites(self):
+        return httpx.Limits(max_connections=self.conexoes, max_keepalive_connections=self.conexoes,
+                            keepalive_expiry=30)
+
+    def _limitar_timeouts(self, request, restante):
+        """Nenhuma espera da tentativa passa do que sobra do prazo da chamada"""
+        timeouts = request.extensions.get('timeout') or {}
+        request.extensions['timeout'] = {nome: restante if valor is None else min(valor, restante)
+                                         for nome, valor in timeouts.items()}
+
+    def _preparar(self, request, timeouts, inicio):
+        """Antes de cada tentativa: consulta o disjuntor e ajusta os timeouts ao prazo restante"""
+        request.extensions['timeout'] = dict(timeouts)
+        self._limitar_timeouts(request, max(0.1, self.prazo - (time.monotonic() - inicio)))
+        # Por último: daqui até _espera a tentativa precisa ser registrada no disjuntor
+        if not self.disjuntor.permitir():
+            raise CircuitoAberto('Supabase indisponível no momento (circuito aberto)', request=request)
+
+    def _espera(self, request, resposta, tentativa, inicio):
+        """Registra a tentativa no disjuntor; segundos até repetir, ou None se a chamada termina aqui"""
+        if resposta is not None and resposta.status_code < 500:
+            self.disjuntor.sucesso()
+            if resposta.status_code not in STATUS_REPETIVEIS:
+                return None
+        else:
+            self.disjuntor.falha()
+
+        espera = random.uniform(0, min(self.espera_maxima, self.espera_base * 2 ** tentativa))
+        pode_repetir = (request.method in METODOS_IDEMPOTENTES and tentativa < self.tentativas
+                        and (resposta is None or resposta.status_code in STATUS_REPETIVEIS)
+                        and time.monotonic() - inicio + espera < self.prazo)
+        return espera if pode_repetir else None
+
+
+class TransporteResiliente(_Repeticao, httpx.BaseTransport):
+    """Pool httpx compartilhado com prazo, repetição de leituras e disjuntor"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._transporte = httpx.HTTPTransport(limits=self._limites())
+
+    def handle_request(self, request):
+        inicio = time.monotonic()
+        timeouts = dict(request.extensions.get('timeout') or {})
+        tentativa = 0
+        while True:
+            self._preparar(request, timeouts, inicio)
+            resposta = erro = None
+            registrada = False
+            try:
+                try:
+                    resposta = self._transporte.handle_request(request)
+                except httpx.TransportError as e:
+                    erro = e
+                tentativa += 1
+                espera = self._espera(request, resposta, tentativa, inicio)
+                registrada = True
+            finally:
+                # Cancelamento ou erro fora do transporte: conta como falha (e libera a chamada de teste)
+                if not registrada:
+                    self.disjuntor.falha()
+            if espera is None:
+                if erro is not None:
+                    raise erro
+                return resposta
+            if resposta is not None:
+                resposta.close()
+            time.sleep(espera)
+
+    def close(self):
+        self._transporte.close()
+
+
+class TransporteResilienteAsync(_Repeticao, httpx.AsyncBaseTransport):
+    """O mesmo transporte para o httpx.AsyncClient (modo ASGI): as esperas não prendem o event loop"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._transporte = httpx.AsyncHTTPTransport(limits=self._limites())
+
+    async def handle_async_request(self, request):
+        inicio = time.monotonic()
+        timeouts = dict(request.extensions.get('timeout') or {})
+        tentativa = 0
+        while True:
+            self._preparar(request, timeouts, inicio)
+            resposta = erro = None
+            registrada = False
+            try:
+                try:
+                    resposta = await self._transporte.handle_async_request(request)
+                except httpx.TransportError as e:
+                    erro = e
+                tentativa += 1
+                espera = self._espera(request, resposta, tentativa, inicio)
+                registrada = True
+            finally:
+                # Cancelamento ou erro fora do transporte: conta como falha (e libera a chamada de teste)
+                if not registrada:
+                    self.disjuntor.falha()
+            if espera is None:
+                if erro is not None:
+                    raise erro
+                return resposta
+            if resposta is not None:
+                await resposta.aclose()
+            await asyncio.sleep(espera)
+
+    async def aclose(self):
+        await self._transporte.aclose()
+
+
+class _PostgrestResiliente(SyncPostgrestClient):
+    def __init__(self, transporte, tempo, *args, **kwargs):
+        self._transporte = transporte
+        self._tempo = tempo
+        super().__init__(*args, **kwargs)
+
+    def create_session(self, base_url, headers, timeout):
+        return httpx.Client(base_url=base_url, headers=headers, timeout=self._tempo, transport=self._transporte)
+
+
+class _PostgrestResilienteAsync(AsyncPostgrestClient):
+    def __init__(self, transporte, tempo, *args, **kwargs):
+        self._transporte = transporte
+        self._tempo = tempo
+        super().__init__(*args, **kwargs)
+
+    def create_session(self, base_url, headers, timeout):
+        return httpx.AsyncClient(base_url=base_url, headers=headers, timeout=self._tempo,
+                                 transport=self._transporte)
+
+
+class _StorageResiliente(SyncStorageClient):
+    def __init__(self, transporte, tempo, *args, **kwargs):
+        self._transporte = transporte
+        self._tempo = tempo
+        super().__init__(*args, **kwargs)
+
+    def _create_session(self, base_url, headers, timeout, verify=True):
+        return SessaoStorage(base_url=base_url, headers=headers, timeout=self._tempo, verify=bool(verify),
+                             follow_redirects=True, transport=self._transporte)
+
+
+def criar_cliente(url, key, conexoes=20, timeout=10.0, timeout_conexao=3.0, tentativas=3, prazo=15.0,
+                  falhas_disjuntor=5, espera_disjuntor=30.0):
+    """
+    Cliente do supabase-py com PostgREST e Storage no transporte resiliente.
+    O transporte fica em `cliente.transporte` (estado do disjuntor: cliente.transporte.disjuntor.estado).
+    """
+    client = create_client(url, key)
+    transporte = TransporteResiliente(conexoes=conexoes, tentativas=tentativas, prazo=prazo,
+                                      disjuntor=Disjuntor(falhas_disjuntor, espera_disjuntor))
+    tempo = httpx.Timeout(timeout, connect=timeout_conexao, pool=timeout_conexao)
+
+    # O supabase-py cria os clientes sob demanda por estes dois métodos
+    client._init_postgrest_client = lambda rest_url, headers, schema, timeout=None: _PostgrestResiliente(
+        transporte, tempo, rest_url, headers=headers, schema=schema)
+    client._init_storage_client = lambda storage_url, headers, storage_client_timeout=None: _StorageResiliente(
+        transporte, tempo, storage_url, headers)
+    client.transporte = transporte
+    client.tempo = tempo
+    return client
+
+
+def criar_postgrest_async(client):
+    """
+    PostgREST assíncrono (modo ASGI) com a URL, as chaves, os limites e o disjuntor do cliente
+    criado por criar_cliente(): uma queda percebida por um dos lados abre o circuito para os dois.
+    Deve ser criado dentro do event loop que vai usá-lo.
+    """
+    sincrono = client.transporte
+    transporte = TransporteResilienteAsync(conexoes=sincrono.conexoes, tentativas=sincrono.tentativas,
+                                           espera_base=sincrono.espera_base,
+                                           espera_maxima=sincrono.espera_maxima,
+                                           prazo=sincrono.prazo, disjuntor=sincrono.disjuntor)
+    return _PostgrestResilienteAsync(transporte, client.tempo, client.rest_url,
+                                     headers=dict(client.options.headers), schema=client.options.schema)
+
+
+def _benchmark(latencia, taxa_erro, threads):
+    import os
+    from concurrent.futures import ThreadPoolExecutor
+    from supabase_local import BancoLocal, iniciar_servidor
+
+    banco = BancoLocal()
+    banco.popular_produtos(200, setores=('automotivo',))
+    servidor, url = iniciar_servidor(banco)
+    key = os.environ.get('SUPABASE_KEY', 'eyJhbGciOiJIUzI1NiJ9.e30.abc')
+    padrao = create_client(url, key)
+    resiliente = criar_cliente(url, key, timeout=0.5, prazo=1.0, falhas_disjuntor=5, espera_disjuntor=1.0)
+
+    def rodada(client, chamadas):
+        def ler(_):
+            inicio = time.perf_counter()
+            try:
+                client.table('produtos').select('id').eq('id', 1).execute()
+                ok = True
+            except Exception:
+                ok = False
+            return ok, time.perf_counter() - inicio
+        inicio = time.perf_counter()
+        with ThreadPoolExecutor(threads) as executor:
+            resultados = list(executor.map(ler, range(chamadas)))
+        tempos = sorted(t for _, t in resultados)
+        return (sum(ok for ok, _ in resultados), max(tempos), tempos[len(tempos) // 2],
+                time.perf_counter() - inicio)
+
+    print(f"{threads} threads (como o Waitress) lendo um produto")
+    cenarios = (('saudável', 0.0, 0.0, 0.0), (f'{taxa_erro:.0%} de 503', 0.0, taxa_erro, 0.0),
+                (f'{taxa_erro:.0%} de quedas', 0.0, 0.0, taxa_erro),
+                (f'lento ({latencia:.0f}s por chamada)', latencia, 0.0, 0.0))
+    for cenario, lat, erro, queda in cenarios:
+        banco.latencia, banco.taxa_erro, banco.taxa_queda = lat, erro, queda
+        for nome, client in (('padrão', padrao), ('resiliente', resiliente)):
+            chamadas = threads * 2 if lat else 200
+            ok, pior, mediana, total = rodada(client, chamadas)
+            print(f"  {cenario:<22} {nome:<10}: {ok:>3}/{chamadas} ok | mediana {mediana * 1000:6.0f} ms | "
+                  f"pior {pior * 1000:6.0f} ms | total {total:5.1f}s")
+        print(f"  disjuntor: {resiliente.transporte.disjuntor.estado}")
+        resiliente.transporte.disjuntor.sucesso()
+    servidor.shutdown()
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Benchmark do cliente resiliente contra o Supabase local')
+    parser.add_argument('--latencia', type=float, default=2.0, help='latência do cenário lento (s)')
+    parser.add_argument('--taxa-erro', type=float, default=0.2, help='fração de respostas 503')
+    parser.add_argument('--threads', type=int, default=6)
+    args = parser.parse_args()
+    _benchmark(args.latencia, args.taxa_erro, args.threads)
@@ -30,6 +30,53 @@ class Config:
     MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 16MB max
     ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'webp'}
 
+    # Cliente do Supabase: conexões no pool, timeout de cada chamada e prazo total com as
+    # repetições de leituras (segundos); o disjuntor abre após N falhas seguidas por ESPERA segundos
+    SUPABASE_CONEXOES = int(os.environ.get('SUPABASE_CONEXOES', 20))
+    SUPABASE_TIMEOUT = float(os.environ.get('SUPABASE_TIMEOUT', 10))
+    SUPABASE_PRAZO = float(os.environ.get('SUPABASE_PRAZO', 15))
+    SUPABASE_TENTATIVAS = int(os.environ.get('SUPABASE_TENTATIVAS', 3))
+    SUPABASE_DISJUNTOR_FALHAS = int(os.environ.get('SUPABASE_DISJUNTOR_FALHAS', 5))
+    SUPABASE_DISJUNTOR_ESPERA = float(os.environ.get('SUPABASE_DISJUNTOR_ESPERA', 30))
+
+    # Cache do catálogo do Supabase (em segundos / número de setores em memória)
+    CATALOGO_CACHE_TTL = int(os.environ.get('CATALOGO_CACHE_TTL', 300))
+    CATALOGO_CACHE_MAX_SETORES = int(os.environ.get('CATALOGO_CACHE_MAX_SETORES', 4))
+    # Com o Supabase fora, serve a última cópia (marcada como desatualizada) por até N segundos; 0 = nunca
+    CATALOGO_MAX_DESATUALIZADO = int(os.environ.get('CATALOGO_MAX_DESATUALIZADO', 6 * 3600))
+    # Páginas do catálogo buscadas em paralelo no Supabase
+    CATALOGO_PAGINAS_PARALELAS = int(os.environ.get('CATALOGO_PAGINAS_PARALELAS', 8))
+    # Versões do catálogo guardadas por setor para responder deltas (/api/catalog/changes)
+    CATALOGO_DELTA_VERSOES = int(os.environ.get('CATALOGO_DELTA_VERSOES', 32))
+
+    # Contadores do painel administrativo (recalculados em segundo plano após este tempo)
+    ESTATISTICAS_TTL = int(os.environ.get('ESTATISTICAS_TTL', 60))
+
+    # Eventos em tempo real para a vitrine (SSE); porta própria, 0 = desligado.
+    # EVENTOS_URL é o endereço público quando há proxy na frente (ex.: https://loja.com.br/eventos)
+    EVENTOS_PORTA = int(os.environ.get('EVENTOS_PORTA', 0))
+    EVENTOS_URL = os.environ.get('EVENTOS_URL', '')
+
+    # Proxies reversos na frente do app (X-Forwarded-Proto/Host/For); 0 = acesso direto
+    PROXY_SALTOS = int(os.environ.get('PROXY_SALTOS', 0))
+
+    # Fila de tarefas em segundo plano (fotos, queima em lote, limpeza de relacionados).
+    # Arquivo SQLite próprio (padrão: instance/tarefas.db), threads e tentativas por tarefa
+    FILA_TAREFAS_DB = os.environ.get('FILA_TAREFAS_DB', '')
+    FILA_TAREFAS_WORKERS = int(os.environ.get('FILA_TAREFAS_WORKERS', 2))
+    FILA_TAREFAS_TENTATIVAS = int(os.environ.get('FILA_TAREFAS_TENTATIVAS', 5))
+
+    # Modo ASGI (asgi.py): threads para as rotas que continuam no Flask
+    ASGI_THREADS = int(os.environ.get('ASGI_THREADS', 6))
+
+    # Arquivamento de pedidos finalizados há mais de N dias (intervalo em segundos, 0 = só pelo comando)
+    PEDIDOS_ARQUIVAR_DIAS = int(os.environ.get('PEDIDOS_ARQUIVAR_DIAS', 180))
+    PEDIDOS_ARQUIVAR_INTERVALO = int(os.environ.get('PEDIDOS_ARQUIVAR_INTERVALO', 0))
+
+    # Sincronização do catálogo para a tabela local product (0 = desligada)
+    CATALOGO_SYNC_INTERVALO = int(os.environ.get('CATALOGO_SYNC_INTERVALO', 0))
+    CATALOGO_SYNC_COMPLETA = int(os.environ.get('CATALOGO_SYNC_COMPLETA', 6 * 3600))
+
     # Segurança
     SESSION_COOKIE_SECURE = True  # HTTPS only
     SESSION_COOKIE_HTTPONLY = True
@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+"""
+Histórico de versões do catálogo por setor (deltas para a vitrine)
+Cada snapshot novo é comparado com o anterior do mesmo setor e a diferença
+fica guardada num anel curto; /api/catalog/changes junta os deltas entre a
+versão do navegador e a atual. O histórico é de cada processo (worker):
+versão desconhecida aqui vira catálogo completo.
+"""
+import threading
+from collections import deque
+
+
+class Changeset:
+    """Produtos alterados/incluídos e IDs removidos entre duas versões"""
+
+    def __init__(self, de, para, alterados, removidos):
+        self.de = de
+        self.para = para
+        self.alterados = alterados  # id -> produto (formato do index.html)
+        self.removidos = removidos  # set de IDs
+
+
+def comparar(anterior, atual):
+    """Changeset entre dois dicts id -> produto"""
+    alterados = {pid: p for pid, p in atual.items() if anterior.get(pid) != p}
+    removidos = set(anterior) - set(atual)
+    return alterados, removidos
+
+
+class HistoricoCatalogo:
+    """Últimas `max_versoes` mudanças do catálogo de cada setor"""
+
+    def __init__(self, max_versoes=32, max_fracao=0.5):
+        self.max_versoes = max_versoes
+        # Acima desta fração do catálogo o delta não compensa: manda tudo
+        self.max_fracao = max_fracao
+        self._setores = {}
+        self._lock = threading.Lock()
+
+    def registrar(self, setor, snapshot):
+        """Guarda a diferença entre o último snapshot conhecido do setor e `snapshot`"""
+        versao = snapshot.versao
+        with self._lock:
+            estado = self._setores.get(setor)
+            if estado is None:
+                self._setores[setor] = {'versao': versao, 'por_id': snapshot.por_id,
+                                        'changesets': deque(maxlen=self.max_versoes)}
+                return
+            if estado['versao'] == versao:
+                return
+            alterados, removidos = comparar(estado['por_id'], snapshot.por_id)
+            estado['changesets'].append(Changeset(estado['versao'], versao, alterados, removidos))
+            estado['versao'] = versao
+            estado['por_id'] = snapshot.por_id
+
+    def mudancas(self, setor, desde):
+        """
+        Retorna (versao, alterados, removidos) de `desde` até a versão atual,
+        ou None quando `desde` não está no histórico ou o delta ficou grande demais
+        """
+        with self._lock:
+            estado = self._setores.get(setor)
+            if estado is None or not desde:
+                return None
+            if desde == estado['versao']:
+                return estado['versao'], [], []
+
+            changesets = list(estado['changesets'])
+            total = len(estado['por_id'])
+
+        # A ocorrência mais recente de `desde` dá o caminho mais curto até a versão atual
+        inicio = next((i for i in range(len(changesets) - 1, -1, -1)
+                       if changesets[i].de == desde), None)
+        if inicio is None:
+            return None
+
+        alterados = {}
+        removidos = set()
+        for changeset in changesets[inicio:]:
+            for pid in changeset.removidos:
+                alterados.pop(pid, None)
+                removidos.add(pid)
+            for pid, produto in changeset.alterados.items():
+                removidos.discard(pid)
+                alterados[pid] = produto
+            if len(alterados) + len(removidos) > total * self.max_fracao:
+                return None
+        return changesets[-1].para, list(alterados.values()), sorted(removidos)
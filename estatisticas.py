@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+"""
+Contadores do painel administrativo por setor, servidos da memória
+O cálculo roda fora da requisição: o painel sempre recebe o último valor
+conhecido e, quando ele venceu ou uma escrita do admin o marcou como sujo,
+uma thread em segundo plano recalcula (só a primeira visita espera).
+Escritas só marcam o setor como sujo: uma rajada de edições vira um único
+recálculo, na próxima visita ao painel, e não uma recarga do catálogo por escrita.
+"""
+import threading
+import time
+from datetime import datetime
+
+
+class EstatisticasAdmin:
+    """Cache de contadores por setor com atualização em segundo plano"""
+
+    def __init__(self, calcular, ttl=60):
+        self._calcular = calcular  # função(setor) -> dict
+        self.ttl = ttl
+        self._valores = {}  # setor -> (dict, time.monotonic() do cálculo)
+        self._sujos = set()
+        self._atualizando = set()
+        self._lock = threading.Lock()
+
+    def _recalcular(self, setor):
+        try:
+            valores = dict(self._calcular(setor), atualizado_em=datetime.now())
+            with self._lock:
+                self._valores[setor] = (valores, time.monotonic())
+            return valores
+        finally:
+            with self._lock:
+                self._atualizando.discard(setor)
+
+    def _disparar(self, setor):
+        """Recalcula o setor numa thread daemon (uma por setor por vez)"""
+        with self._lock:
+            if setor in self._atualizando:
+                return
+            self._atualizando.add(setor)
+            self._sujos.discard(setor)
+        threading.Thread(target=self._recalcular, args=(setor,),
+                         name=f'estatisticas-{setor}', daemon=True).start()
+
+    def obter(self, setor):
+        """Contadores do setor; vencidos ou sujos são recalculados em segundo plano"""
+        with self._lock:
+            atual = self._valores.get(setor)
+            vencido = atual is not None and (setor in self._sujos or
+                                             time.monotonic() - atual[1] > self.ttl)
+
+        if atual is None:
+            # Primeira visita: não há valor antigo para mostrar, calcula na hora
+            return self._recalcular(setor)
+        if vencido:
+            self._disparar(setor)
+        return atual[0]
+
+    def invalidar(self, setor=None):
+        """Escrita do admin: marca o setor (ou todos quando `setor` é None) para recálculo no próximo obter()"""
+        with self._lock:
+            self._sujos.update(s for s in self._valores if setor is None or s == setor)
@@ -0,0 +1,336 @@
+# -*- coding: utf-8 -*-
+"""
+Eventos do catálogo em tempo real (Server-Sent Events)
+
+Servidor HTTP mínimo em asyncio, numa thread e porta próprias: cada aba da
+vitrine aberta é só um socket e uma fila curta no event loop, sem ocupar uma
+das threads do Waitress. As rotas do admin publicam eventos com publicar();
+o acesso usa um token assinado (itsdangerous) emitido pelo Flask com o setor
+e a origem da página, a única liberada no CORS.
+
+Só um processo por máquina escuta a porta (o dono dos serviços em segundo
+plano, ver app.iniciar_servicos). Os demais processos do app (Passenger,
+gunicorn com vários workers) não têm assinantes: publicar() neles repassa o
+evento, assinado, num datagrama UDP para 127.0.0.1 na mesma porta, e o
+processo dono o distribui às abas.
+
+Teste de carga: python eventos_catalogo.py --assinantes 500 --eventos 50
+"""
+import asyncio
+import json
+import socket
+import threading
+import time
+from urllib.parse import parse_qs, urlsplit
+
+from itsdangerous import BadSignature, URLSafeTimedSerializer
+
+# Intervalo do comentário de keep-alive (proxies derrubam conexões ociosas)
+KEEPALIVE = 25
+# Eventos pendentes por cliente; quem ficar para trás é desconectado e reconecta
+FILA_MAXIMA = 32
+# Tamanho máximo da requisição (linha + cabeçalhos)
+MAX_CABECALHOS = 8192
+# Eventos repassados por outros processos valem por poucos segundos (evita reenvio)
+VALIDADE_REPASSE = 30
+
+
+def serializador(segredo):
+    return URLSafeTimedSerializer(segredo, salt='eventos-catalogo')
+
+
+def codificar_evento(tipo, dados, id_evento=None):
+    """Evento SSE já em bytes (codificado uma vez e compartilhado por todos os clientes)"""
+    linhas = []
+    if id_evento is not None:
+        linhas.append(f'id: {id_evento}')
+    linhas.append(f'event: {tipo}')
+    linhas.append('data: ' + json.dumps(dados, ensure_ascii=False, separators=(',', ':')))
+    return ('\n'.join(linhas) + '\n\n').encode('utf-8')
+
+
+class ServidorEventos:
+    """Servidor SSE por setor rodando num event loop em thread separada"""
+
+    def __init__(self, segredo, host='0.0.0.0', porta=0, validade_token=12 * 3600):
+        self.host = host
+        self.porta = porta
+        self.validade_token = validade_token
+        self._serializador = serializador(segredo)
+        self._assinantes = {}  # setor -> set de filas
+        self._sequencia = 0
+        self._loop = None
+        self._servidor = None
+        self._repasse = None  # transporte UDP que recebe os eventos dos outros processos
+        self._erro = None
+        self._pronto = threading.Event()
+        self._socket_repasse = None
+
+    # ---- lado Flask (threads do Waitress) ----
+
+    def gerar_token(self, setor, origem=None):
+        return self._serializador.dumps({'setor': setor, 'origem': origem})
+
+    @property
+    def ativo(self):
+        return self._servidor is not None and self._pronto.is_set()
+
+    @property
+    def habilitado(self):
+        """Há um servidor de eventos neste processo ou, numa porta fixa, em outro processo"""
+        return self.ativo or self.porta > 0
+
+    def publicar(self, setor, tipo, dados):
+        """Envia um evento para as abas do setor (direto ou pelo processo que escuta a porta)"""
+        if self.ativo:
+            self._loop.call_soon_threadsafe(self._distribuir, setor, tipo, dados)
+        elif self.porta:
+            self._repassar(setor, tipo, dados)
+
+    def _repassar(self, setor, tipo, dados):
+        """Datagrama assinado para o processo dono da porta; sem ninguém escutando, o evento se perde"""
+        if self._socket_repasse is None:
+            self._socket_repasse = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        mensagem = self._serializador.dumps({'setor': setor, 'tipo': tipo, 'dados': dados})
+        try:
+            self._socket_repasse.sendto(mensagem.encode('ascii'), ('127.0.0.1', self.porta))
+        except OSError as e:
+            print(f"Eventos do catálogo: falha ao repassar evento ({e})")
+
+    def iniciar(self):
+        """
+        Sobe o event loop numa thread daemon e espera o socket estar escutando.
+        Levanta o erro do bind (ex.: porta já em uso por outro processo).
+        """
+        threading.Thread(target=self._rodar, name='eventos-catalogo', daemon=True).start()
+        if not self._pronto.wait(10):
+            raise RuntimeError('Servidor de eventos não iniciou em 10 s')
+        if self._erro is not None:
+            raise self._erro
+        return self
+
+    def parar(self):
+        if self.ativo:
+            asyncio.run_coroutine_threadsafe(self._encerrar(), self._loop)
+
+    def total_assinantes(self):
+        return sum(len(filas) for filas in self._assinantes.values())
+
+    # ---- lado asyncio ----
+
+    def _rodar(self):
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        try:
+            servidor = loop.run_until_complete(
+                asyncio.start_server(self._atender, self.host, self.porta, backlog=1024))
+            porta = servidor.sockets[0].getsockname()[1]
+            # Eventos publicados pelos outros processos do app (só da própria máquina)
+            self._repasse, _ = loop.run_until_complete(loop.create_datagram_endpoint(
+                lambda: _ProtocoloRepasse(self), local_addr=('127.0.0.1', porta)))
+        except OSError as e:
+            self._erro = e
+            loop.close()
+            self._pronto.set()
+            return
+        self._loop = loop
+        self._servidor = servidor
+        self.porta = porta
+        print(f"Eventos do catálogo (SSE) na porta {self.porta}")
+        self._pronto.set()
+        self._loop.run_forever()
+
+    def _receber_repasse(self, mensagem):
+        try:
+            evento = self._serializador.loads(mensagem.decode('ascii'), max_age=VALIDADE_REPASSE)
+            self._distribuir(evento['setor'], evento['tipo'], evento['dados'])
+        except (BadSignature, KeyError, TypeError, UnicodeError):
+            pass
+
+    def _distribuir(self, setor, tipo, dados):
+        self._sequencia += 1
+        evento = codificar_evento(tipo, dados, self._sequencia)
+        for fila in list(self._assinantes.get(setor, ())):
+            try:
+                fila.put_nowait(evento)
+            except asyncio.QueueFull:
+                # Cliente lento: None encerra a conexão (o EventSource reconecta sozinho)
+                self._encerrar_fila(fila)
+
+    @staticmethod
+    def _encerrar_fila(fila):
+        while not fila.empty():
+            fila.get_nowait()
+        fila.put_nowait(None)
+
+    async def _encerrar(self):
+        self._servidor.close()
+        self._repasse.close()
+        for filas in list(self._assinantes.values()):
+            for fila in list(filas):
+                self._encerrar_fila(fila)
+        # Dá tempo das conexões fecharem antes de parar o loop
+        for _ in range(100):
+            if not self._assinantes:
+                break
+            await asyncio.sleep(0.01)
+        self._loop.stop()
+
+    async def _ler_requisicao(self, reader):
+        cabecalho = await asyncio.wait_for(reader.readuntil(b'\r\n\r\n'), 10)
+        if len(cabecalho) > MAX_CABECALHOS:
+            raise ValueError('cabeçalho grande demais')
+        linhas = cabecalho.decode('latin-1').split('\r\n')
+        metodo, alvo, _ = linhas[0].split(' ', 2)
+        origem = None
+        for linha in linhas[1:]:
+            nome, _, valor = linha.partition(':')
+            if nome.strip().lower() == 'origin':
+                origem = valor.strip()
+        return metodo, urlsplit(alvo), origem
+
+    async def _responder(self, writer, status, corpo=b''):
+        writer.write(f'HTTP/1.1 {status}\r\nContent-Type: text/plain; charset=utf-8\r\n'
+                     f'Content-Length: {len(corpo)}\r\n'
+                     f'Connection: close\r\n\r\n'.encode('ascii') + corpo)
+        await writer.drain()
+
+    async def _atender(self, reader, writer):
+        fila = None
+        setor = None
+        try:
+            try:
+                metodo, url, origem = await self._ler_requisicao(reader)
+            except (asyncio.TimeoutError, asyncio.IncompleteReadError,
+                    asyncio.LimitOverrunError, ValueError):
+                return
+            if metodo != 'GET' or url.path.rstrip('/') != '/eventos':
+                await self._responder(writer, '404 Not Found')
+                return
+
+            token = parse_qs(url.query).get('token', [''])[0]
+            try:
+                dados = self._serializador.loads(token, max_age=self.validade_token)
+                setor = dados['setor']
+            except (BadSignature, KeyError, TypeError):
+                await self._responder(writer, '403 Forbidden', 'Token inválido'.encode('utf-8'))
+                return
+
+            # CORS só para a origem da página que pediu o token (mesma origem não precisa)
+            cors = ''
+            if origem and origem == dados.get('origem'):
+                cors = f'Access-Control-Allow-Origin: {origem}\r\nVary: Origin\r\n'
+            writer.write(b'HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\n'
+                         b'Cache-Control: no-cache\r\n' + cors.encode('latin-1') +
+                         b'X-Accel-Buffering: no\r\nConnection: keep-alive\r\n\r\n'
+                         b'retry: 5000\n\n')
+            await writer.drain()
+
+            fila = asyncio.Queue(FILA_MAXIMA)
+            self._assinantes.setdefault(setor, set()).add(fila)
+
+            while True:
+                try:
+                    evento = await asyncio.wait_for(fila.get(), KEEPALIVE)
+                except asyncio.TimeoutError:
+                    evento = b': ping\n\n'
+                if evento is None:
+                    break
+                writer.write(evento)
+                await writer.drain()
+        except (ConnectionError, asyncio.CancelledError):
+            pass
+        finally:
+            if fila is not None:
+                filas = self._assinantes.get(setor)
+                filas.discard(fila)
+                if not filas:
+                    self._assinantes.pop(setor, None)
+            writer.close()
+
+
+class _ProtocoloRepasse(asyncio.DatagramProtocol):
+    def __init__(self, servidor):
+        self.servidor = servidor
+
+    def datagram_received(self, data, addr):
+        self.servidor._receber_repasse(data)
+
+
+def _rss_kb():
+    """Memória residente do processo em KB (Linux; 0 onde /proc não existe)"""
+    try:
+        with open('/proc/self/status') as status:
+            for linha in status:
+                if linha.startswith('VmRSS:'):
+                    return int(linha.split()[1])
+    except OSError:
+        pass
+    return 0
+
+
+async def _carga(servidor, assinantes, eventos):
+    token = servidor.gerar_token('automotivo')
+    requisicao = f'GET /eventos?token={token} HTTP/1.1\r\nHost: localhost\r\n\r\n'.encode('ascii')
+    recebidos = []
+
+    async def assinante():
+        reader, writer = await asyncio.open_connection('127.0.0.1', servidor.porta)
+        writer.write(requisicao)
+        await writer.drain()
+        await reader.readuntil(b'retry: 5000\n\n')
+        conectado.release()
+        try:
+            while True:
+                bloco = await reader.readuntil(b'\n\n')
+                if bloco.startswith(b'id:'):
+                    recebidos.append((time.perf_counter(), bloco))
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    conectado = asyncio.Semaphore(0)
+    rss_antes = _rss_kb()
+    tarefas = [asyncio.ensure_future(assinante()) for _ in range(assinantes)]
+    for _ in range(assinantes):
+        await conectado.acquire()
+    await asyncio.sleep(0.2)
+    rss_depois = _rss_kb()
+    print(f"{servidor.total_assinantes()} assinantes ociosos conectados | "
+          f"RSS +{(rss_depois - rss_antes) / 1024:.1f} MB "
+          f"(~{(rss_depois - rss_antes) / max(assinantes, 1):.1f} KB por conexão, servidor + cliente)")
+
+    latencias = []
+    for i in range(eventos):
+        recebidos.clear()
+        inicio = time.perf_counter()
+        servidor.publicar('automotivo', 'queima', {'id': i, 'em_queima_estoque': True})
+        while len(recebidos) < assinantes:
+            await asyncio.sleep(0.001)
+        latencias.append((max(t for t, _ in recebidos) - inicio) * 1000)
+
+    latencias.sort()
+    p99 = latencias[max(int(len(latencias) * 0.99) - 1, 0)]
+    print(f"{eventos} eventos para {assinantes} abas: fan-out p50 {latencias[len(latencias) // 2]:.1f} ms | "
+          f"p99 {p99:.1f} ms | máx {latencias[-1]:.1f} ms")
+
+    for tarefa in tarefas:
+        tarefa.cancel()
+    await asyncio.gather(*tarefas, return_exceptions=True)
+    # Espera o servidor notar as desconexões
+    while servidor.total_assinantes():
+        await asyncio.sleep(0.01)
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Teste de carga do servidor de eventos (SSE)')
+    parser.add_argument('--assinantes', type=int, default=500)
+    parser.add_argument('--eventos', type=int, default=50)
+    args = parser.parse_args()
+
+    servidor = ServidorEventos('segredo-de-teste', host='127.0.0.1').iniciar()
+    asyncio.run(_carga(servidor, args.assinantes, args.eventos))
+    servidor.parar()
@@ -0,0 +1,297 @@
+# -*- coding: utf-8 -*-
+"""
+Exportação do histórico de pedidos (CSV ou JSONL) e arquivamento de pedidos finalizados
+
+A exportação lê os pedidos em streaming (cursor no servidor no PostgreSQL,
+`yield_per` no SQLAlchemy) e gera o arquivo em blocos, então a memória não
+cresce com o número de linhas. Inclui os pedidos arquivados.
+
+O arquivamento move pedidos 'finalizado' sem alteração há mais de N dias para
+orders_archive (uma linha por pedido, itens em JSON), em lotes com commit por
+lote. Os resumos da análise de pedidos não mudam: o pedido continua contando.
+
+Execute: python exportacao_pedidos.py --arquivar [--dias 180]
+         python exportacao_pedidos.py --exportar pedidos.csv [--inicio 2025-01-01 --fim 2025-12-31]
+Benchmark (SQLite temporário): python exportacao_pedidos.py --benchmark --itens 200000
+"""
+if __name__ == '__main__':
+    import os
+    import sys
+    import tempfile
+
+    if '--benchmark' in sys.argv:
+        # Antes de importar o app: o benchmark nunca toca o banco configurado
+        os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'benchmark.db')
+        os.environ.setdefault('SECRET_KEY', 'benchmark')
+        os.environ.setdefault('SUPABASE_URL', 'http://127.0.0.1:1')
+        os.environ.setdefault('SUPABASE_KEY', 'eyJhbGciOiJIUzI1NiJ9.e30.abc')
+
+import argparse
+import csv
+import io
+import json
+import threading
+import time
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import delete, insert, select
+
+from app import app, db, User
+from pedidos import Order, OrderItem, OrderArchive
+
+COLUNAS_CSV = ['pedido_id', 'criado_em_utc', 'setor', 'usuario_id', 'usuario', 'status', 'obs_pedido',
+               'produto_id', 'produto', 'marca', 'quantidade', 'preco_unitario', 'obs_item']
+# Linhas lidas do banco por vez
+TAMANHO_LOTE = 1000
+
+
+def _filtrar(consulta, modelo, inicio=None, fim=None, setor=None, status=None):
+    """inicio/fim são datas (inclusivas) de created_at"""
+    if inicio:
+        consulta = consulta.where(modelo.created_at >= datetime.combine(inicio, datetime.min.time()))
+    if fim:
+        consulta = consulta.where(modelo.created_at < datetime.combine(fim + timedelta(days=1), datetime.min.time()))
+    if setor:
+        consulta = consulta.where(modelo.categoria_loja == setor)
+    if status:
+        consulta = consulta.where(modelo.status == status)
+    return consulta
+
+
+def pedidos_para_exportar(tamanho_lote=TAMANHO_LOTE, **filtros):
+    """
+    Gera os pedidos (dicts com 'items') em ordem de id: primeiro os das tabelas
+    de pedidos, depois os arquivados. As linhas pedido+item vêm num único
+    SELECT lido em partições de `tamanho_lote`.
+    """
+    consulta = select(Order.id, Order.created_at, Order.categoria_loja, Order.user_id, User.username,
+                      Order.status, Order.notes, Order.total_items,
+                      OrderItem.product_id, OrderItem.product_name, OrderItem.product_brand,
+                      OrderItem.quantity, OrderItem.unit_price, OrderItem.notes.label('item_notes')) \
+        .outerjoin(OrderItem, OrderItem.order_id == Order.id) \
+        .outerjoin(User, User.id == Order.user_id)
+    consulta = _filtrar(consulta, Order, **filtros).order_by(Order.id, OrderItem.id) \
+        .execution_options(yield_per=tamanho_lote)
+
+    atual = None
+    for particao in db.session.execute(consulta).partitions():
+        for linha in particao:
+            if atual is None or atual['id'] != linha.id:
+                if atual is not None:
+                    yield atual
+                atual = {'id': linha.id, 'created_at': linha.created_at, 'categoria_loja': linha.categoria_loja,
+                         'user_id': linha.user_id, 'username': linha.username, 'status': linha.status,
+                         'notes': linha.notes, 'total_items': linha.total_items, 'items': []}
+            if linha.product_id is not None:
+                atual['items'].append({'product_id': linha.product_id, 'product_name': linha.product_name,
+                                       'product_brand': linha.product_brand, 'quantity': linha.quantity,
+                                       'unit_price': linha.unit_price, 'notes': linha.item_notes})
+    if atual is not None:
+        yield atual
+
+    consulta = select(OrderArchive.id, OrderArchive.created_at, OrderArchive.categoria_loja, OrderArchive.user_id,
+                      OrderArchive.username, OrderArchive.status, OrderArchive.notes, OrderArchive.total_items,
+                      OrderArchive.items_json)
+    consulta = _filtrar(consulta, OrderArchive, **filtros).order_by(OrderArchive.id) \
+        .execution_options(yield_per=tamanho_lote)
+    for particao in db.session.execute(consulta).mappings().partitions():
+        for arquivado in particao:
+            pedido = dict(arquivado)
+            pedido['items'] = [dict(zip(('product_id', 'product_name', 'product_brand', 'quantity',
+                                         'unit_price', 'notes'), item))
+                               for item in json.loads(pedido.pop('items_json') or '[]')]
+            yield pedido
+
+
+def exportar_csv(pedidos, tamanho_bloco=TAMANHO_LOTE):
+    """CSV com uma linha por item (pedidos sem itens saem numa linha só), gerado em blocos"""
+    buffer = io.StringIO()
+    escritor = csv.writer(buffer, delimiter=';')
+    # BOM para o Excel reconhecer UTF-8
+    buffer.write('\ufeff')
+    escritor.writerow(COLUNAS_CSV)
+
+    linhas = 0
+    for pedido in pedidos:
+        inicio = [pedido['id'], pedido['created_at'].isoformat(sep=' ', timespec='seconds'),
+                  pedido['categoria_loja'] or '', pedido['user_id'], pedido['username'] or '',
+                  pedido['status'] or '', pedido['notes'] or '']
+        for item in pedido['items'] or [None]:
+            if item is None:
+                escritor.writerow(inicio + [''] * 6)
+            else:
+                escritor.writerow(inicio + [item['product_id'], item['product_name'], item['product_brand'] or '',
+                                            item['quantity'],
+                                            '' if item['unit_price'] is None else item['unit_price'],
+                                            item['notes'] or ''])
+            linhas += 1
+        if linhas >= tamanho_bloco:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+            linhas = 0
+    yield buffer.getvalue()
+
+
+def exportar_jsonl(pedidos, tamanho_bloco=TAMANHO_LOTE):
+    """Um pedido por linha (JSON), com os itens dentro, gerado em blocos"""
+    bloco = []
+    for pedido in pedidos:
+        bloco.append(json.dumps(dict(pedido, created_at=pedido['created_at'].isoformat()),
+                                ensure_ascii=False, separators=(',', ':')))
+        if len(bloco) >= tamanho_bloco:
+            yield '\n'.join(bloco) + '\n'
+            bloco = []
+    if bloco:
+        yield '\n'.join(bloco) + '\n'
+
+
+def arquivar_pedidos(dias=180, tamanho_lote=500):
+    """
+    Move pedidos finalizados sem alteração há mais de `dias` dias para orders_archive.
+    Cada lote é copiado e apagado numa transação. Retorna o total arquivado.
+    """
+    limite = datetime.utcnow() - timedelta(days=dias)
+    total = 0
+    while True:
+        pedidos = db.session.execute(
+            select(Order.id, Order.user_id, User.username, Order.categoria_loja, Order.status,
+                   Order.total_items, Order.notes, Order.created_at, Order.updated_at)
+            .outerjoin(User, User.id == Order.user_id)
+            .where(Order.status == 'finalizado', Order.updated_at < limite)
+            .order_by(Order.id).limit(tamanho_lote)).mappings().all()
+        if not pedidos:
+            break
+        ids = [p['id'] for p in pedidos]
+
+        itens = {}
+        consulta_itens = select(OrderItem.order_id, OrderItem.product_id, OrderItem.product_name,
+                                OrderItem.product_brand, OrderItem.quantity, OrderItem.unit_price,
+                                OrderItem.notes) \
+            .where(OrderItem.order_id.in_(ids)).order_by(OrderItem.order_id, OrderItem.id)
+        for item in db.session.execute(consulta_itens):
+            itens.setdefault(item.order_id, []).append(list(item[1:]))
+
+        try:
+            agora = datetime.utcnow()
+            db.session.execute(insert(OrderArchive), [
+                dict(p, archived_at=agora,
+                     items_json=json.dumps(itens.get(p['id'], []), ensure_ascii=False, separators=(',', ':')))
+                for p in pedidos])
+            db.session.execute(delete(OrderItem).where(OrderItem.order_id.in_(ids)))
+            db.session.execute(delete(Order).where(Order.id.in_(ids)))
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        total += len(pedidos)
+    return total
+
+
+def iniciar_arquivamento_periodico(intervalo=None, dias=None):
+    """Arquiva pedidos numa thread daemon a cada `intervalo` segundos"""
+    intervalo = intervalo or app.config['PEDIDOS_ARQUIVAR_INTERVALO']
+    dias = dias or app.config['PEDIDOS_ARQUIVAR_DIAS']
+    if not intervalo:
+        return None
+
+    def loop():
+        while True:
+            with app.app_context():
+                try:
+                    total = arquivar_pedidos(dias)
+                    if total:
+                        print(f"{total} pedidos finalizados arquivados")
+                except Exception as e:
+                    print(f"Erro no arquivamento de pedidos: {e}")
+            time.sleep(intervalo)
+
+    thread = threading.Thread(target=loop, name='arquivar-pedidos', daemon=True)
+    thread.start()
+    return thread
+
+
+def _rss_mb():
+    try:
+        with open('/proc/self/status') as status:
+            for linha in status:
+                if linha.startswith('VmRSS:'):
+                    return int(linha.split()[1]) / 1024
+    except OSError:
+        pass
+    return 0
+
+
+def _benchmark(total_itens):
+    import random
+
+    aleatorio = random.Random(7)
+    itens_por_pedido = 8
+    with app.app_context():
+        db.create_all()
+        db.session.execute(insert(User), [{'username': f'balconista{i}', 'password': 'x'} for i in range(20)])
+        inicio = datetime.utcnow() - timedelta(days=730)
+        quantidade = total_itens // itens_por_pedido
+        for base in range(0, quantidade, 5000):
+            pedidos = [{'user_id': aleatorio.randint(1, 20), 'categoria_loja': 'automotivo',
+                        'status': 'finalizado' if i < quantidade * 0.8 else 'pendente', 'total_items': 16,
+                        'created_at': inicio + timedelta(minutes=i), 'updated_at': inicio + timedelta(minutes=i)}
+                       for i in range(base, min(base + 5000, quantidade))]
+            ids = db.session.scalars(insert(Order).returning(Order.id), pedidos).all()
+            db.session.execute(insert(OrderItem), [
+                {'order_id': order_id, 'product_id': j + 1, 'product_name': f'Tinta Acrílica {j} 18L',
+                 'product_brand': 'Coral', 'quantity': 2, 'unit_price': 49.9 if j % 3 == 0 else None}
+                for order_id in ids for j in range(itens_por_pedido)])
+        db.session.commit()
+        print(f"{quantidade} pedidos / {quantidade * itens_por_pedido} itens")
+
+        for nome, exportar in (('CSV', exportar_csv), ('JSONL', exportar_jsonl)):
+            db.session.expunge_all()
+            rss_antes = _rss_mb()
+            pico = rss_antes
+            t = time.perf_counter()
+            tamanho = 0
+            for i, bloco in enumerate(exportar(pedidos_para_exportar())):
+                tamanho += len(bloco)
+                if i % 50 == 0:
+                    pico = max(pico, _rss_mb())
+            print(f"Exportação {nome}: {tamanho / 1024 / 1024:.0f} MB em {time.perf_counter() - t:.1f}s | "
+                  f"RSS {rss_antes:.0f} MB -> pico {pico:.0f} MB")
+
+        t = time.perf_counter()
+        arquivados = arquivar_pedidos(dias=30)
+        restantes = db.session.query(Order).count()
+        print(f"Arquivamento: {arquivados} pedidos em {time.perf_counter() - t:.1f}s | "
+              f"{restantes} pedidos continuam em orders")
+
+        t = time.perf_counter()
+        linhas = sum(len(p['items']) for p in pedidos_para_exportar())
+        print(f"Exportação após arquivar (tabelas + arquivo): {linhas} itens em {time.perf_counter() - t:.1f}s")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Exportação e arquivamento de pedidos')
+    parser.add_argument('--arquivar', action='store_true', help='Arquivar pedidos finalizados antigos')
+    parser.add_argument('--dias', type=int, help='Idade mínima (dias) dos pedidos arquivados')
+    parser.add_argument('--exportar', metavar='ARQUIVO', help='Exportar para .csv ou .jsonl')
+    parser.add_argument('--inicio', type=date.fromisoformat)
+    parser.add_argument('--fim', type=date.fromisoformat)
+    parser.add_argument('--setor')
+    parser.add_argument('--benchmark', action='store_true', help='Exportar/arquivar num SQLite temporário')
+    parser.add_argument('--itens', type=int, default=200000, help='Itens de pedido gerados no benchmark')
+    args = parser.parse_args()
+
+    if args.benchmark:
+        _benchmark(args.itens)
+    elif args.arquivar:
+        with app.app_context():
+            total = arquivar_pedidos(args.dias or app.config['PEDIDOS_ARQUIVAR_DIAS'])
+            print(f"{total} pedidos arquivados")
+    elif args.exportar:
+        exportar = exportar_jsonl if args.exportar.endswith('.jsonl') else exportar_csv
+        with app.app_context(), open(args.exportar, 'w', encoding='utf-8', newline='') as saida:
+            for bloco in exportar(pedidos_para_exportar(inicio=args.inicio, fim=args.fim, setor=args.setor)):
+                saida.write(bloco)
+        print(f"Pedidos exportados para {args.exportar}")
+    else:
+        parser.print_help()
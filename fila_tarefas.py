@@ -0,0 +1,320 @@
+# -*- coding: utf-8 -*-
+"""
+Fila de tarefas em segundo plano, gravada num arquivo SQLite
+
+As rotas só enfileiram (uma inserção local) e respondem; threads de trabalho
+fazem as chamadas lentas ao Supabase (fotos, queima em lote, limpeza dos
+relacionados). Como a fila fica em disco, um reinício não perde nada: tarefas
+pendentes continuam e as que estavam em execução voltam quando a reserva vence.
+
+- Tentativas com espera exponencial (2s, 4s, 8s... até espera_maxima) e jitter;
+  ErroDefinitivo encerra a tarefa sem repetir
+- Chave de idempotência: enfileirar de novo com a mesma chave devolve a mesma
+  tarefa enquanto ela estiver ativa (ou concluída há menos de `janela` segundos)
+- Vários processos podem usar o mesmo arquivo: a reserva é feita numa
+  transação IMMEDIATE com UPDATE condicional
+
+Benchmark: python fila_tarefas.py --tarefas 200 --latencia 0.2
+"""
+import json
+import random
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+PENDENTE = 'pendente'
+EXECUTANDO = 'executando'
+OK = 'ok'
+ERRO = 'erro'
+
+_ESQUEMA = """
+CREATE TABLE IF NOT EXISTS tarefas (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    tipo TEXT NOT NULL,
+    chave TEXT UNIQUE,
+    setor TEXT,
+    dados TEXT NOT NULL,
+    status TEXT NOT NULL,
+    tentativas INTEGER NOT NULL DEFAULT 0,
+    executar_em REAL NOT NULL,
+    reservada_ate REAL,
+    resultado TEXT,
+    erro TEXT,
+    criada_em REAL NOT NULL,
+    atualizada_em REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ix_tarefas_fila ON tarefas (status, executar_em);
+CREATE INDEX IF NOT EXISTS ix_tarefas_setor ON tarefas (setor, id);
+"""
+
+
+class ErroDefinitivo(Exception):
+    """Falha que não adianta repetir (arquivo sumiu, dados inválidos...)"""
+
+
+class FilaTarefas:
+    """Fila persistente com threads de trabalho; registre os tipos com @fila.tarefa('nome')"""
+
+    def __init__(self, caminho, workers=2, max_tentativas=5, espera_base=2.0, espera_maxima=300.0,
+                 reserva=600.0, janela=900.0, retencao=7 * 24 * 3600, intervalo=1.0):
+        self.caminho = caminho
+        self.workers = workers
+        self.max_tentativas = max_tentativas
+        self.espera_base = espera_base
+        self.espera_maxima = espera_maxima
+        self.reserva = reserva  # tempo máximo de uma execução antes de outra thread/processo retomar
+        self.janela = janela  # idempotência para tarefas já concluídas
+        self.retencao = retencao  # tarefas concluídas são apagadas depois disso
+        self.intervalo = intervalo
+        self._tipos = {}  # tipo -> (função(dados), ao_desistir(dados) ou None)
+        self._lock = threading.Lock()  # uma conexão compartilhada pelas threads do processo
+        self._novas = threading.Event()
+        self._parar = threading.Event()
+        self._threads = []
+        self._ultima_limpeza = 0.0
+
+        self._conexao = sqlite3.connect(caminho, timeout=30, isolation_level=None, check_same_thread=False)
+        self._conexao.row_factory = sqlite3.Row
+        with self._lock:
+            self._conexao.execute('PRAGMA journal_mode=WAL')
+            self._conexao.execute('PRAGMA synchronous=NORMAL')
+            self._conexao.executescript(_ESQUEMA)
+
+    # --- registro e início ---
+    def tarefa(self, tipo, ao_desistir=None):
+        """Decorador que registra a função de um tipo; ao_desistir roda quando a tarefa termina em erro"""
+        def registrar(funcao):
+            self._tipos[tipo] = (funcao, ao_desistir)
+            return funcao
+        return registrar
+
+    def iniciar(self):
+        """Sobe as threads de trabalho (uma vez por processo)"""
+        with self._lock:
+            if self._threads:
+                return
+            for numero in range(self.workers):
+                thread = threading.Thread(target=self._trabalhar, name=f'fila-tarefas-{numero}', daemon=True)
+                self._threads.append(thread)
+                thread.start()
+
+    def parar(self, aguardar=5.0):
+        self._parar.set()
+        self._novas.set()
+        for thread in self._threads:
+            thread.join(aguardar)
+
+    # --- operações das rotas ---
+    def _transacao(self, funcao):
+        with self._lock:
+            self._conexao.execute('BEGIN IMMEDIATE')
+            try:
+                resultado = funcao(self._conexao)
+            except BaseException:
+                self._conexao.execute('ROLLBACK')
+                raise
+            self._conexao.execute('COMMIT')
+            return resultado
+
+    def enfileirar(self, tipo, dados, chave=None, setor=None, janela=None):
+        """
+        Grava a tarefa e acorda as threads; retorna o id.
+        Com chave, devolve a tarefa existente se ela estiver ativa ou tiver terminado há menos de
+        `janela` segundos (padrão da fila); janela=0 deduplica só enquanto ela está ativa.
+        """
+        janela = self.janela if janela is None else janela
+
+        def gravar(conexao):
+            agora = time.time()
+            if chave is not None:
+                existente = conexao.execute('SELECT id, status, atualizada_em FROM tarefas WHERE chave = ?',
+                                            (chave,)).fetchone()
+                if existente is not None:
+                    if existente['status'] in (PENDENTE, EXECUTANDO) or existente['atualizada_em'] >= agora - janela:
+                        return existente['id']
+                    conexao.execute('UPDATE tarefas SET chave = NULL WHERE id = ?', (existente['id'],))
+            cursor = conexao.execute(
+                'INSERT INTO tarefas (tipo, chave, setor, dados, status, executar_em, criada_em, atualizada_em) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                (tipo, chave, setor, json.dumps(dados, default=str), PENDENTE, agora, agora, agora))
+            return cursor.lastrowid
+
+        tarefa_id = self._transacao(gravar)
+        self.iniciar()
+        self._novas.set()
+        return tarefa_id
+
+    def status(self, tarefa_id):
+        with self._lock:
+            linha = self._conexao.execute('SELECT * FROM tarefas WHERE id = ?', (tarefa_id,)).fetchone()
+        return self._para_dict(linha) if linha else None
+
+    def listar(self, setor=None, limite=50):
+        """Tarefas mais recentes (do setor, se informado)"""
+        with self._lock:
+            if setor is None:
+                linhas = self._conexao.execute('SELECT * FROM tarefas ORDER BY id DESC LIMIT ?', (limite,))
+            else:
+                linhas = self._conexao.execute('SELECT * FROM tarefas WHERE setor = ? ORDER BY id DESC LIMIT ?',
+                                               (setor, limite))
+            return [self._para_dict(linha) for linha in linhas.fetchall()]
+
+    def contagem(self):
+        """{'pendente': n, 'executando': n, 'ok': n, 'erro': n}"""
+        with self._lock:
+            linhas = self._conexao.execute('SELECT status, COUNT(*) FROM tarefas GROUP BY status').fetchall()
+        return {**{s: 0 for s in (PENDENTE, EXECUTANDO, OK, ERRO)}, **{s: n for s, n in linhas}}
+
+    @staticmethod
+    def _para_dict(linha):
+        def data(valor):
+            return datetime.fromtimestamp(valor).isoformat(timespec='seconds') if valor else None
+        return {
+            'id': linha['id'],
+            'tipo': linha['tipo'],
+            'setor': linha['setor'],
+            'status': linha['status'],
+            'tentativas': linha['tentativas'],
+            'resultado': json.loads(linha['resultado']) if linha['resultado'] else None,
+            'erro': linha['erro'],
+            'proxima_tentativa': data(linha['executar_em']) if linha['status'] == PENDENTE else None,
+            'criada_em': data(linha['criada_em']),
+            'atualizada_em': data(linha['atualizada_em'])
+        }
+
+    # --- threads de trabalho ---
+    def _reservar(self):
+        """Pega a próxima tarefa vencida (ou com reserva expirada) e marca como em execução"""
+        def reservar(conexao):
+            agora = time.time()
+            while True:
+                linha = conexao.execute(
+                    'SELECT * FROM tarefas WHERE (status = ? AND executar_em <= ?) OR (status = ? AND reservada_ate < ?) '
+                    'ORDER BY executar_em, id LIMIT 1', (PENDENTE, agora, EXECUTANDO, agora)).fetchone()
+                if linha is None:
+                    return None
+                if linha['tentativas'] >= self.max_tentativas:
+                    # Caiu no meio da última tentativa: não repete mais
+                    conexao.execute('UPDATE tarefas SET status = ?, erro = ?, reservada_ate = NULL, atualizada_em = ? '
+                                    'WHERE id = ?', (ERRO, 'Execução interrompida', agora, linha['id']))
+                    continue
+                conexao.execute('UPDATE tarefas SET status = ?, tentativas = tentativas + 1, reservada_ate = ?, '
+                                'atualizada_em = ? WHERE id = ?',
+                                (EXECUTANDO, agora + self.reserva, agora, linha['id']))
+                return {**dict(linha), 'tentativas': linha['tentativas'] + 1}
+        return self._transacao(reservar)
+
+    def _finalizar(self, tarefa_id, status, resultado=None, erro=None, executar_em=None):
+        agora = time.time()
+        with self._lock:
+            self._conexao.execute(
+                'UPDATE tarefas SET status = ?, resultado = ?, erro = ?, executar_em = COALESCE(?, executar_em), '
+                'reservada_ate = NULL, atualizada_em = ? WHERE id = ? AND status = ?',
+                (status, None if resultado is None else json.dumps(resultado, default=str), erro,
+                 executar_em, agora, tarefa_id, EXECUTANDO))
+
+    def _executar(self, tarefa):
+        funcao, ao_desistir = self._tipos.get(tarefa['tipo'], (None, None))
+        dados = json.loads(tarefa['dados'])
+        try:
+            if funcao is None:
+                raise ErroDefinitivo(f"Tipo de tarefa desconhecido: {tarefa['tipo']}")
+            resultado = funcao(dados)
+        except Exception as e:
+            if isinstance(e, ErroDefinitivo) or tarefa['tentativas'] >= self.max_tentativas:
+                print(f"Tarefa {tarefa['id']} ({tarefa['tipo']}) falhou de vez: {e}")
+                self._finalizar(tarefa['id'], ERRO, erro=str(e))
+                if ao_desistir:
+                    try:
+                        ao_desistir(dados)
+                    except Exception as erro:
+                        print(f"Erro ao desistir da tarefa {tarefa['id']}: {erro}")
+            else:
+                espera = min(self.espera_maxima, self.espera_base * 2 ** (tarefa['tentativas'] - 1))
+                espera *= random.uniform(0.8, 1.2)
+                print(f"Tarefa {tarefa['id']} ({tarefa['tipo']}) falhou, nova tentativa em {espera:.1f}s: {e}")
+                self._finalizar(tarefa['id'], PENDENTE, erro=str(e), executar_em=time.time() + espera)
+            return
+        self._finalizar(tarefa['id'], OK, resultado=resultado)
+
+    def _limpar(self):
+        agora = time.time()
+        if agora - self._ultima_limpeza < 3600:
+            return
+        self._ultima_limpeza = agora
+        with self._lock:
+            self._conexao.execute('DELETE FROM tarefas WHERE status IN (?, ?) AND atualizada_em < ?',
+                                  (OK, ERRO, agora - self.retencao))
+
+    def _trabalhar(self):
+        while not self._parar.is_set():
+            # Limpa o aviso antes de procurar: uma tarefa enfileirada depois disso acorda a espera
+            self._novas.clear()
+            try:
+                tarefa = self._reservar()
+                if tarefa is None:
+                    self._limpar()
+            except Exception as e:
+                print(f"Erro na fila de tarefas: {e}")
+                tarefa = None
+            if tarefa is None:
+                self._novas.wait(self.intervalo)
+            else:
+                self._executar(tarefa)
+
+
+def _benchmark(tarefas, latencia, workers):
+    import os
+    import tempfile
+
+    pasta = tempfile.mkdtemp()
+    fila = FilaTarefas(os.path.join(pasta, 'tarefas.db'), workers=workers, espera_base=0.05)
+    falhas = {}
+
+    @fila.tarefa('lento')
+    def lento(dados):
+        # Simula uma chamada ao Supabase; 10% falham na primeira tentativa
+        time.sleep(latencia)
+        if dados['n'] % 10 == 0 and not falhas.get(dados['n']):
+            falhas[dados['n']] = True
+            raise RuntimeError('503 do Supabase')
+        return {'n': dados['n']}
+
+    inicio = time.perf_counter()
+    ids = [fila.enfileirar('lento', {'n': n}, chave=f'bench:{n}') for n in range(tarefas)]
+    enfileirar = (time.perf_counter() - inicio) / tarefas
+    repetidas = {fila.enfileirar('lento', {'n': n}, chave=f'bench:{n}') for n in range(tarefas)}
+    print(f"Enfileirar: {enfileirar * 1000:.2f} ms por tarefa (a requisição só espera isso; "
+          f"chamada simulada ao Supabase: {latencia * 1000:.0f} ms)")
+    print(f"Reenvio com as mesmas chaves: {len(repetidas - set(ids))} tarefas novas")
+
+    while fila.contagem()[OK] + fila.contagem()[ERRO] < tarefas:
+        time.sleep(0.05)
+    total = time.perf_counter() - inicio
+    contagem = fila.contagem()
+    print(f"{tarefas} tarefas com {workers} workers: {total:.1f}s | ok {contagem[OK]}, erro {contagem[ERRO]}, "
+          f"{len(falhas)} repetidas após falha")
+    fila.parar()
+
+    # Reinício: tarefas pendentes no arquivo são retomadas por outra instância
+    fila = FilaTarefas(os.path.join(pasta, 'tarefas.db'), workers=workers)
+    fila.tarefa('lento')(lambda dados: {'n': dados['n']})
+    with fila._lock:
+        fila._conexao.execute('UPDATE tarefas SET status = ?, reservada_ate = ? WHERE id IN (?, ?)',
+                              (EXECUTANDO, time.time() - 1, ids[0], ids[1]))
+    fila.iniciar()
+    time.sleep(0.5)
+    print(f"Após reinício com 2 tarefas presas em execução: {[fila.status(i)['status'] for i in ids[:2]]}")
+    fila.parar()
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Benchmark da fila de tarefas')
+    parser.add_argument('--tarefas', type=int, default=200)
+    parser.add_argument('--latencia', type=float, default=0.2, help='duração simulada de cada tarefa (s)')
+    parser.add_argument('--workers', type=int, default=4)
+    args = parser.parse_args()
+    _benchmark(args.tarefas, args.latencia, args.workers)
@@ -0,0 +1,252 @@
+# -*- coding: utf-8 -*-
+"""
+Fotos dos produtos: versões redimensionadas geradas fora da requisição
+
+A rota só copia o upload, em blocos, para um arquivo temporário enquanto
+calcula o SHA-256 do conteúdo, e enfileira; a fila de tarefas abre a foto,
+corrige a rotação do EXIF e gera três versões (thumb, card e full) em WebP
+(JPEG se o Pillow não tiver WebP), envia ao Storage e grava a URL da versão
+full no produto. As outras versões ficam no mesmo diretório, então a URL full
+basta para achar todas (variantes_da_url).
+
+O diretório é o hash do conteúdo: reenviar a mesma foto (para este ou outro
+produto) não gera nem envia nada de novo, só aponta o produto para os objetos
+que já existem. Como o conteúdo de uma URL nunca muda, os objetos vão com
+Cache-Control de um ano.
+
+Sem o Pillow instalado, a foto original é enviada como está.
+
+Benchmark: python imagens_produto.py --fotos 8
+"""
+import hashlib
+import io
+import os
+import re
+import time
+
+from fila_tarefas import ErroDefinitivo
+
+try:
+    from PIL import Image, ImageOps, features
+except ImportError:  # Pillow é opcional; sem ele a foto vai sem redimensionar
+    Image = None
+
+# Maior lado de cada versão, em pixels (thumb: grade da vitrine, card: telas densas, full: modal)
+VARIANTES = (('thumb', 400), ('card', 800), ('full', 1600))
+QUALIDADE = 80
+# Fotos maiores que isso (em pixels) são recusadas (proteção contra "bombas" de descompressão)
+MAX_PIXELS = 50_000_000
+
+# Diretório das fotos no bucket; troque a versão ao mudar VARIANTES ou QUALIDADE,
+# já que as URLs antigas são imutáveis (ficam em cache nos navegadores)
+PREFIXO_STORAGE = 'imagens/v1'
+CACHE_IMUTAVEL = str(365 * 24 * 3600)  # segundos
+TAMANHO_BLOCO = 64 * 1024
+
+# O cliente do Storage devolve a URL pública com '?' no fim
+_URL_VARIANTE = re.compile(r'/(thumb|card|full)\.(webp|jpg)(\?[^/]*)?$')
+
+
+def formato_saida():
+    """('WEBP', 'webp', 'image/webp') ou o equivalente em JPEG"""
+    if Image is not None and features.check('webp'):
+        return 'WEBP', 'webp', 'image/webp'
+    return 'JPEG', 'jpg', 'image/jpeg'
+
+
+def variantes_da_url(url):
+    """{'thumb', 'card', 'full'} a partir da URL gravada no produto; fotos antigas repetem a URL"""
+    if not url or not _URL_VARIANTE.search(url):
+        return {nome: url for nome, _ in VARIANTES}
+    return {nome: _URL_VARIANTE.sub(lambda m: f'/{nome}.{m.group(2)}{m.group(3) or ""}', url) for nome, _ in VARIANTES}
+
+
+def copiar_com_hash(origem, caminho):
+    """Copia um fluxo para o arquivo em blocos (memória constante); devolve o SHA-256 do conteúdo"""
+    sha = hashlib.sha256()
+    with open(caminho, 'wb') as destino:
+        for bloco in iter(lambda: origem.read(TAMANHO_BLOCO), b''):
+            sha.update(bloco)
+            destino.write(bloco)
+    return sha.hexdigest()
+
+
+def hash_do_arquivo(caminho):
+    sha = hashlib.sha256()
+    with open(caminho, 'rb') as arquivo:
+        for bloco in iter(lambda: arquivo.read(TAMANHO_BLOCO), b''):
+            sha.update(bloco)
+    return sha.hexdigest()
+
+
+def validar_imagem(caminho):
+    """Confere só o cabeçalho do arquivo (rápido, na requisição); ValueError se não for imagem"""
+    if Image is None:
+        return
+    try:
+        with Image.open(caminho) as imagem:
+            largura, altura = imagem.size
+    except Exception:
+        raise ValueError('O arquivo enviado não é uma imagem válida')
+    if largura * altura > MAX_PIXELS:
+        raise ValueError('Imagem grande demais')
+
+
+def gerar_variantes(caminho):
+    """Gera {nome: bytes} para cada versão, da maior para a menor (cada uma reduz a anterior)"""
+    formato, _, _ = formato_saida()
+    maior = VARIANTES[-1][1]
+    with Image.open(caminho) as original:
+        # JPEG: decodifica já reduzido (1/2, 1/4, 1/8) quando a foto é muito maior que a versão full
+        original.draft('RGB', (maior, maior))
+        imagem = ImageOps.exif_transpose(original)
+        if formato == 'JPEG' or imagem.mode not in ('RGB', 'RGBA'):
+            imagem = imagem.convert('RGBA' if formato == 'WEBP' and 'A' in imagem.getbands() else 'RGB')
+
+        versoes = {}
+        for nome, lado in reversed(VARIANTES):
+            imagem = imagem.copy()
+            imagem.thumbnail((lado, lado), Image.LANCZOS)
+            saida = io.BytesIO()
+            imagem.save(saida, formato, quality=QUALIDADE, **({'method': 4} if formato == 'WEBP' else {'optimize': True}))
+            versoes[nome] = saida.getvalue()
+    return versoes
+
+
+class ProcessadorImagens:
+    """Gera as versões de uma foto, envia ao Storage e grava a URL no produto (roda na fila de tarefas)"""
+
+    def __init__(self, client, bucket, ao_concluir=None, tabela='produtos'):
+        self.client = client
+        self.bucket = bucket
+        self.tabela = tabela
+        self._ao_concluir = ao_concluir  # função(setor, produto_id) chamada depois de gravar a URL
+
+    def _url_publica(self, caminho):
+        url = self.client.storage.from_(self.bucket).get_public_url(caminho)
+        return url.get('publicUrl') if isinstance(url, dict) else url
+
+    def _existe(self, pasta, nome):
+        itens = self.client.storage.from_(self.bucket).list(pasta, {'search': nome})
+        return any(item.get('name') == nome for item in itens or [])
+
+    def _subir(self, caminho, conteudo, content_type):
+        """Envia um objeto imutável; se outro envio do mesmo conteúdo chegou antes, aproveita o dele"""
+        try:
+            self.client.storage.from_(self.bucket).upload(
+                caminho, conteudo, {'content-type': content_type, 'cache-control': CACHE_IMUTAVEL})
+        except Exception as e:
+            if 'Duplicate' not in str(e) and '409' not in str(e):
+                raise
+        return self._url_publica(caminho)
+
+    def processar(self, setor, produto_id, caminho, campo_imagem, content_type=None, sha=None):
+        """
+        Processa o arquivo temporário e o apaga no fim; em caso de erro o arquivo fica para a
+        próxima tentativa (descartar() remove quando a fila desiste).
+        sha: hash do conteúdo já calculado no recebimento (senão é calculado aqui)
+        """
+        if not os.path.exists(caminho):
+            raise ErroDefinitivo('O arquivo da foto não existe mais')
+        pasta = f"{PREFIXO_STORAGE}/{sha or hash_do_arquivo(caminho)}"
+        if Image is None:
+            principal = f"original{os.path.splitext(caminho)[1].lower()}"
+        else:
+            _, extensao, tipo = formato_saida()
+            principal = f"full.{extensao}"
+
+        reaproveitada = self._existe(pasta, principal)
+        if reaproveitada:
+            # Mesma foto já enviada antes: nada a gerar nem a enviar
+            url = self._url_publica(f"{pasta}/{principal}")
+        elif Image is None:
+            # O cliente do Storage lê o arquivo pelo caminho, sem carregar tudo antes
+            url = self._subir(f"{pasta}/{principal}", caminho, content_type or 'application/octet-stream')
+        else:
+            # A full vai por último: se ela existe, as outras também existem
+            for nome, conteudo in sorted(gerar_variantes(caminho).items(), key=lambda v: v[0] == 'full'):
+                url = self._subir(f"{pasta}/{nome}.{extensao}", conteudo, tipo)
+
+        self.client.table(self.tabela).update({campo_imagem: url}).eq('id', produto_id).execute()
+        if self._ao_concluir:
+            self._ao_concluir(setor, produto_id)
+        self.descartar(caminho)
+        return {'image_url': url, 'reaproveitada': reaproveitada}
+
+    @staticmethod
+    def descartar(caminho):
+        try:
+            os.remove(caminho)
+        except OSError:
+            pass
+
+
+def _foto_de_celular(caminho, largura=4000, altura=3000):
+    """JPEG sintético do tamanho de uma foto de celular (ruído para não comprimir demais)"""
+    imagem = Image.effect_noise((largura // 4, altura // 4), 60).convert('RGB').resize((largura, altura))
+    imagem.save(caminho, 'JPEG', quality=92)
+
+
+def _benchmark(fotos):
+    import tempfile
+    from supabase import create_client
+    from supabase_local import BancoLocal, iniciar_servidor
+
+    if Image is None:
+        print('Instale o Pillow para rodar o benchmark')
+        return
+
+    banco = BancoLocal()
+    banco.popular_produtos(fotos, setores=('automotivo',))
+    servidor, url = iniciar_servidor(banco)
+    client = create_client(url, os.environ.get('SUPABASE_KEY', 'eyJhbGciOiJIUzI1NiJ9.e30.abc'))
+
+    pasta = tempfile.mkdtemp()
+    modelo = os.path.join(pasta, 'modelo.jpg')
+    _foto_de_celular(modelo)
+    tamanho_original = os.path.getsize(modelo)
+    print(f"Foto de teste: 4000x3000, {tamanho_original / 1024 / 1024:.1f} MB")
+
+    inicio = time.perf_counter()
+    versoes = gerar_variantes(modelo)
+    print(f"Uma foto: {(time.perf_counter() - inicio) * 1000:.0f} ms | " +
+          ', '.join(f"{nome} {len(v) / 1024:.0f} KB" for nome, v in versoes.items()) +
+          f" | grade com thumb: {tamanho_original / len(versoes['thumb']):.0f}x menor")
+
+    # Recebimento: cópia em blocos com hash; o pico de memória não depende do tamanho do upload
+    import tracemalloc
+    tracemalloc.start()
+    with open(modelo, 'rb') as origem:
+        copiar_com_hash(origem, os.path.join(pasta, 'copia.jpg'))
+    pico = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    print(f"Recebimento com hash: pico de {pico / 1024:.0f} KB de memória para {tamanho_original / 1024 / 1024:.1f} MB")
+
+    processador = ProcessadorImagens(client, 'produtos')
+    ids = [p['id'] for p in banco.tabelas['produtos']]
+
+    # Mesma foto enviada para todos os produtos (caso comum no painel)
+    objetos_antes = len(banco.objetos)
+    inicio = time.perf_counter()
+    resultados = []
+    for produto_id in ids:
+        copia = os.path.join(pasta, f'{produto_id}.jpg')
+        with open(modelo, 'rb') as origem:
+            sha = copiar_com_hash(origem, copia)
+        resultados.append(processador.processar('automotivo', produto_id, copia, 'imagem', sha=sha))
+    total = time.perf_counter() - inicio
+    print(f"Mesma foto em {len(ids)} produtos: {total:.1f}s, "
+          f"{sum(r['reaproveitada'] for r in resultados)} reaproveitadas, "
+          f"{len(banco.objetos) - objetos_antes} objetos no Storage (antes: {len(ids) * len(VARIANTES)})")
+    urls = {p['imagem'] for p in banco.tabelas['produtos']}
+    print(f"URLs distintas gravadas nos produtos: {len(urls)}")
+    servidor.shutdown()
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Benchmark do processamento de fotos')
+    parser.add_argument('--fotos', type=int, default=8)
+    args = parser.parse_args()
+    _benchmark(args.fotos)
@@ -0,0 +1,254 @@
+# -*- coding: utf-8 -*-
+"""
+Importação e exportação do catálogo em planilha (CSV ou XLSX)
+
+A importação lê o arquivo linha a linha (o XLSX em modo read_only) e insere
+no Supabase em lotes, então a memória não cresce com o tamanho do arquivo.
+Linhas inválidas não interrompem a importação: voltam no relatório com o
+número da linha e o motivo.
+
+Colunas aceitas: nome, marca, descricao, produto_relacionado_ids
+(também name, brand, description, related_product_ids)
+
+Benchmark: python importacao_catalogo.py --linhas 20000
+"""
+import csv
+import io
+import time
+from itertools import chain
+
+from postgrest.exceptions import APIError
+from postgrest.types import ReturnMethod
+
+from catalogo import separar_nome_marca, ids_relacionados
+
+try:
+    import openpyxl
+except ImportError:  # openpyxl é opcional; sem ele só CSV
+    openpyxl = None
+
+# Nome da coluna na planilha -> campo do produto
+ALIASES = {
+    'nome': 'nome', 'name': 'nome', 'produto': 'nome',
+    'marca': 'marca', 'brand': 'marca',
+    'descricao': 'descricao', 'descrição': 'descricao', 'description': 'descricao',
+    'produto_relacionado_ids': 'produto_relacionado_ids', 'related_product_ids': 'produto_relacionado_ids',
+    'relacionados': 'produto_relacionado_ids',
+}
+COLUNAS_EXPORTACAO = ['id', 'nome', 'marca', 'descricao', 'produto_relacionado_ids',
+                      'em_queima_estoque', 'preco_original', 'preco_queima', 'imagem']
+# Erros guardados no relatório (o resto só é contado)
+MAX_ERROS = 200
+
+
+class ErroImportacao(Exception):
+    """Arquivo que não dá para ler (formato, cabeçalho)"""
+
+
+def _cabecalho(valores):
+    campos = [ALIASES.get(str(v or '').strip().lower()) for v in valores]
+    if 'nome' not in campos:
+        raise ErroImportacao('A planilha precisa de uma coluna "nome"')
+    return campos
+
+
+def linhas_csv(arquivo):
+    """Gera (número da linha, dict) de um CSV binário; aceita ';' ou ',' como separador"""
+    texto = io.TextIOWrapper(arquivo, encoding='utf-8-sig', newline='')
+    try:
+        primeira = next(texto)
+    except StopIteration:
+        raise ErroImportacao('Arquivo vazio')
+    except UnicodeDecodeError:
+        raise ErroImportacao('O CSV precisa estar em UTF-8')
+    separador = ';' if primeira.count(';') > primeira.count(',') else ','
+    leitor = csv.reader(chain([primeira], texto), delimiter=separador)
+    campos = _cabecalho(next(leitor))
+    try:
+        for valores in leitor:
+            if any(v.strip() for v in valores):
+                yield leitor.line_num, {c: v for c, v in zip(campos, valores) if c}
+    except UnicodeDecodeError:
+        raise ErroImportacao(f'Codificação inválida perto da linha {leitor.line_num} (use UTF-8)')
+    finally:
+        # Não fecha o arquivo do upload junto com o wrapper
+        texto.detach()
+
+
+def linhas_xlsx(arquivo):
+    """Gera (número da linha, dict) da primeira aba de um XLSX, sem carregar a planilha inteira"""
+    if openpyxl is None:
+        raise ErroImportacao('Importação de XLSX indisponível (instale o openpyxl) - use CSV')
+    try:
+        planilha = openpyxl.load_workbook(arquivo, read_only=True, data_only=True)
+    except Exception as e:
+        raise ErroImportacao(f'Não foi possível abrir o XLSX: {e}')
+    try:
+        linhas = planilha.worksheets[0].iter_rows(values_only=True)
+        campos = _cabecalho(next(linhas, ()))
+        for numero, valores in enumerate(linhas, start=2):
+            if any(v not in (None, '') for v in valores):
+                yield numero, {c: ('' if v is None else str(v)) for c, v in zip(campos, valores) if c}
+    finally:
+        planilha.close()
+
+
+def ler_planilha(arquivo, nome_arquivo):
+    """Escolhe o leitor pela extensão do arquivo"""
+    extensao = (nome_arquivo or '').rsplit('.', 1)[-1].lower()
+    if extensao == 'csv':
+        return linhas_csv(arquivo)
+    if extensao in ('xlsx', 'xlsm'):
+        return linhas_xlsx(arquivo)
+    raise ErroImportacao('Formato não suportado: envie .csv ou .xlsx')
+
+
+def linha_para_produto(linha, setor):
+    """Valida a linha e monta o produto do Supabase (marca no fim do nome, como na edição)"""
+    nome = (linha.get('nome') or '').strip()
+    marca = (linha.get('marca') or '').strip()
+    if not nome:
+        raise ValueError('Nome vazio')
+
+    nome_completo = f"{nome} {marca}".strip() if marca else nome
+    if len(nome_completo) > 200:
+        raise ValueError('Nome com mais de 200 caracteres')
+
+    produto = {'nome': nome_completo, 'descricao': (linha.get('descricao') or '').strip(),
+               'setor': setor, 'produto_relacionado_ids': None}
+    relacionados = (linha.get('produto_relacionado_ids') or '').strip()
+    if relacionados:
+        try:
+            # Aceita "12,15" ou "12;15"; o Excel às vezes grava "12.0"
+            ids = [str(int(float(i))) for i in relacionados.replace(';', ',').split(',') if i.strip()]
+        except ValueError:
+            raise ValueError(f'IDs relacionados inválidos: {relacionados}')
+        produto['produto_relacionado_ids'] = ','.join(ids) or None
+    return produto
+
+
+def _erro_nos_dados(e):
+    """
+    Erro de dados do PostgreSQL (SQLSTATE 22xxx/23xxx, respondido com 4xx pelo
+    PostgREST): o lote inteiro foi recusado e nada foi gravado. Timeouts, 5xx e
+    circuito aberto não entram: o lote pode ter sido gravado.
+    """
+    return isinstance(e, APIError) and isinstance(e.code, str) and e.code[:2] in ('22', '23')
+
+
+def importar(client, setor, linhas, tamanho_lote=500, tabela='produtos'):
+    """
+    Insere as linhas válidas em lotes. Se o banco recusar os dados de um lote,
+    as linhas dele são reenviadas uma a uma para apontar exatamente quais deram
+    erro; qualquer outra falha marca o lote inteiro como não importado (reenviar
+    poderia duplicar produtos se o lote tiver sido gravado antes da falha).
+    Retorna {'inseridos', 'total_erros', 'erros': [{'linha', 'erro'}, ...]}.
+    """
+    relatorio = {'inseridos': 0, 'total_erros': 0, 'erros': []}
+
+    def erro(numero, mensagem):
+        relatorio['total_erros'] += 1
+        if len(relatorio['erros']) < MAX_ERROS:
+            relatorio['erros'].append({'linha': numero, 'erro': mensagem})
+
+    def enviar(lote):
+        try:
+            client.table(tabela).insert([p for _, p in lote], returning=ReturnMethod.minimal).execute()
+            relatorio['inseridos'] += len(lote)
+        except Exception as e:
+            if not _erro_nos_dados(e):
+                for numero, _ in lote:
+                    erro(numero, f'Lote não confirmado pelo Supabase, confira antes de reimportar: {e}')
+                return
+            for numero, produto in lote:
+                try:
+                    client.table(tabela).insert(produto, returning=ReturnMethod.minimal).execute()
+                    relatorio['inseridos'] += 1
+                except Exception as e:
+                    erro(numero, f'Erro ao inserir: {e}')
+
+    lote = []
+    for numero, linha in linhas:
+        try:
+            lote.append((numero, linha_para_produto(linha, setor)))
+        except ValueError as e:
+            erro(numero, str(e))
+            continue
+        if len(lote) >= tamanho_lote:
+            enviar(lote)
+            lote = []
+    if lote:
+        enviar(lote)
+    return relatorio
+
+
+def exportar_csv(produtos, tamanho_bloco=500):
+    """Gera o CSV do catálogo em blocos (para Response com gerador); reimportável pela importação"""
+    buffer = io.StringIO()
+    escritor = csv.writer(buffer, delimiter=';')
+    # BOM para o Excel reconhecer UTF-8
+    buffer.write('\ufeff')
+    escritor.writerow(COLUNAS_EXPORTACAO)
+
+    for indice, produto in enumerate(produtos, start=1):
+        nome, marca = separar_nome_marca(produto.get('nome'))
+        escritor.writerow([
+            produto['id'], nome, marca, produto.get('descricao') or '', ids_relacionados(produto),
+            'sim' if produto.get('em_queima_estoque') else 'nao',
+            produto.get('preco_original') or '', produto.get('preco_queima') or '',
+            produto.get('imagem') or produto.get('image') or ''
+        ])
+        if indice % tamanho_bloco == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def _benchmark(quantidade):
+    import os
+    import tempfile
+    import tracemalloc
+    from supabase import create_client
+    from supabase_local import BancoLocal, iniciar_servidor
+
+    banco = BancoLocal()
+    servidor, url = iniciar_servidor(banco)
+    client = create_client(url, os.environ.get('SUPABASE_KEY', 'eyJhbGciOiJIUzI1NiJ9.e30.abc'))
+
+    with tempfile.TemporaryFile() as arquivo:
+        texto = io.TextIOWrapper(arquivo, encoding='utf-8', newline='')
+        escritor = csv.writer(texto, delimiter=';')
+        escritor.writerow(['nome', 'marca', 'descricao', 'produto_relacionado_ids'])
+        for i in range(quantidade):
+            # Uma linha inválida a cada 1000 para exercitar o relatório
+            nome = '' if i % 1000 == 999 else f'Tinta Acrílica Fosca {i} 18L'
+            escritor.writerow([nome, 'Coral', f'Produto importado {i}', '' if i % 10 else '1,2'])
+        texto.flush()
+        texto.detach()
+        print(f"CSV de {quantidade} linhas: {arquivo.tell() / 1024 / 1024:.1f} MB")
+        arquivo.seek(0)
+
+        tracemalloc.start()
+        inicio = time.perf_counter()
+        relatorio = importar(client, 'automotivo', linhas_csv(arquivo))
+        duracao = time.perf_counter() - inicio
+        _, pico = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+    print(f"Importação: {relatorio['inseridos']} inseridos, {relatorio['total_erros']} erros "
+          f"em {duracao:.2f}s | pico de memória {pico / 1024 / 1024:.1f} MB (inclui o banco em memória do servidor local)")
+
+    inicio = time.perf_counter()
+    tamanho = sum(len(bloco) for bloco in exportar_csv(banco.tabelas['produtos']))
+    print(f"Exportação: {tamanho / 1024 / 1024:.1f} MB em {time.perf_counter() - inicio:.2f}s")
+    servidor.shutdown()
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Benchmark da importação/exportação do catálogo')
+    parser.add_argument('--linhas', type=int, default=20000)
+    args = parser.parse_args()
+    _benchmark(args.linhas)
@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+"""
+Normalização de texto para busca
+Todas as buscas (servidor e navegador) comparam textos nesta mesma forma:
+sem acentos, minúsculo e com espaços simples ("Tinta  Acrílica" -> "tinta acrilica")
+"""
+import re
+import unicodedata
+
+_ESPACOS = re.compile(r'\s+')
+
+
+def normalizar(texto):
+    """
+    Remove acentos (decomposição NFKD), passa para minúsculas e junta espaços.
+    Espelha normalizarBusca() dos templates: usa lower() (e não casefold())
+    para dar o mesmo resultado que toLowerCase() no navegador.
+    """
+    if not texto:
+        return ''
+    decomposto = unicodedata.normalize('NFKD', texto)
+    sem_acentos = ''.join(c for c in decomposto if not unicodedata.combining(c))
+    return _ESPACOS.sub(' ', sem_acentos.lower()).strip()
+
+
+def anotar_chaves_busca(produtos):
+    """Grava em cada produto do Supabase a chave de busca do nome (uma vez, na carga do catálogo)"""
+    for produto in produtos:
+        produto['chave_busca'] = normalizar(produto.get('nome'))
+    return produtos
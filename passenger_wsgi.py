@@ -20,11 +20,19 @@ sys.path.insert(0, os.path.dirname(__file__))
 # Configura ambiente de produção
 os.environ['FLASK_ENV'] = 'production'
 
+# Na Hostinger o HTTPS termina no proxy da frente: esquema, host e IP vêm dos X-Forwarded-*
+# (o .env é lido antes para que um PROXY_SALTOS configurado lá prevaleça)
+from dotenv import load_dotenv
+load_dotenv(os.path.join(os.path.dirname(__file__), '.env'))
+os.environ.setdefault('PROXY_SALTOS', '1')
+
 # Importa a aplicação Flask
-from app import app, init_db
+from app import app, iniciar_servicos
 
-# Inicializa o banco de dados
-init_db()
+# Banco local, fila de tarefas, sincronização, arquivamento e eventos (como no wsgi.py).
+# Cada processo do Passenger chama, mas só um (trava em instance/servicos.lock) roda
+# sincronização, arquivamento e eventos; os outros assumem se ele terminar
+iniciar_servicos()
 
 # Exporta a aplicação para o Passenger
 application = app
@@ -1,20 +1,58 @@
 # -*- coding: utf-8 -*-
 """
 Sistema de Gerenciamento de Pedidos
-Integração com o app principal Flask
+Integração com o app principal Flask (importado no fim do app.py)
 """
-from app import app, db
-from flask import session
-from datetime import datetime
-from sqlalchemy import Column, Integer, String, Float, DateTime, Text, ForeignKey
-from sqlalchemy.orm import relationship
+if __name__ == '__main__':
+    # Executado diretamente: importa pelo nome do módulo (o app importa este arquivo
+    # e os modelos não podem ser definidos duas vezes) e cria as tabelas
+    import argparse
+    import os
+    import tempfile
+
+    parser = argparse.ArgumentParser(description='Cria as tabelas de pedidos (ou mede o histórico com --benchmark)')
+    parser.add_argument('--benchmark', action='store_true',
+                        help='histórico de um usuário com muitos pedidos, num SQLite temporário')
+    parser.add_argument('--pedidos', type=int, default=5000)
+    parser.add_argument('--itens', type=int, default=10, help='itens por pedido')
+    args = parser.parse_args()
+
+    if args.benchmark:
+        os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'benchmark.db')
+        os.environ.setdefault('SECRET_KEY', 'benchmark')
+        os.environ.setdefault('SUPABASE_URL', 'http://127.0.0.1:1')
+        os.environ.setdefault('SUPABASE_KEY', 'eyJhbGciOiJIUzI1NiJ9.e30.abc')
+        from pedidos import _benchmark
+        _benchmark(args.pedidos, args.itens)
+    else:
+        from pedidos import init_orders_db
+        init_orders_db()
+    raise SystemExit
+
+from app import app, db, login_required, admin_required, categoria_required, snapshot_do_setor, AdminConfig, User
+from flask import Response, request, session, jsonify, stream_with_context
+from datetime import date, datetime
+from urllib.parse import quote
+from sqlalchemy import Column, Integer, String, Float, DateTime, Text, ForeignKey, insert, select, tuple_
+from sqlalchemy.orm import relationship, joinedload, selectinload
+from catalogo import codificar_cursor, decodificar_cursor
+import analise_pedidos
+
+# Limites de um pedido enviado pela vitrine
+MAX_ITENS_PEDIDO = 500
+MAX_QUANTIDADE = 99999
 
 # Modelo de Pedido
 class Order(db.Model):
     __tablename__ = 'orders'
+    # Histórico do usuário: filtro + ordenação + keyset saem do mesmo índice
+    # Arquivamento: pedidos finalizados há mais tempo saem do índice de status
+    __table_args__ = (db.Index('ix_orders_user_created', 'user_id', 'created_at', 'id'),
+                      db.Index('ix_orders_status_updated', 'status', 'updated_at'))
 
     id = Column(Integer, primary_key=True)
     user_id = Column(Integer, ForeignKey('user.id'), nullable=False)
+    categoria_loja = Column(String(20))  # Setor em que o pedido foi feito
     total_items = Column(Integer, default=0)
     status = Column(String(50), default='pendente')  # pendente, enviado, finalizado
     notes = Column(Text)
@@ -36,7 +74,7 @@ class Order(db.Model):
             'id': self.id,
             'user_id': self.user_id,
             'username': self.user.username if self.user else 'Desconhecido',
-            'total_items': self.get_total_items(),
+            'total_items': self.total_items if self.total_items is not None else self.get_total_items(),
             'status': self.status,
             'notes': self.notes,
             'created_at': self.created_at.strftime('%d/%m/%Y %H:%M'),
@@ -49,16 +87,18 @@ class OrderItem(db.Model):
     __tablename__ = 'order_items'
 
     id = Column(Integer, primary_key=True)
-    order_id = Column(Integer, ForeignKey('orders.id'), nullable=False)
-    product_id = Column(Integer, ForeignKey('product.id'), nullable=False)
+    order_id = Column(Integer, ForeignKey('orders.id'), nullable=False, index=True)
+    # ID do produto no Supabase: sem FK para a tabela local product, que só tem o
+    # que a sincronização espelhou (pode estar vazia ou atrasada)
+    product_id = Column(Integer, nullable=False)
     product_name = Column(String(200), nullable=False)
     product_brand = Column(String(100))
     quantity = Column(Integer, default=1)
+    unit_price = Column(Float)  # Preço de queima no momento do pedido (None = sem preço)
     notes = Column(Text)
 
     # Relacionamentos
     order = relationship('Order', back_populates='items')
-    product = relationship('Product')
 
     def __repr__(self):
         return f'<OrderItem {self.id} - {self.product_name} x{self.quantity}>'
@@ -70,70 +110,170 @@ class OrderItem(db.Model):
             'product_name': self.product_name,
             'product_brand': self.product_brand,
             'quantity': self.quantity,
+            'unit_price': self.unit_price,
             'notes': self.notes
         }
 
 
+# Pedido finalizado arquivado (fora das tabelas consultadas no dia a dia)
+class OrderArchive(db.Model):
+    __tablename__ = 'orders_archive'
+
+    id = Column(Integer, primary_key=True)  # Mesmo id do pedido original
+    user_id = Column(Integer)
+    username = Column(String(80))  # Guardado para não depender do usuário existir
+    categoria_loja = Column(String(20))
+    status = Column(String(50))
+    total_items = Column(Integer)
+    notes = Column(Text)
+    created_at = Column(DateTime, index=True)
+    updated_at = Column(DateTime)
+    archived_at = Column(DateTime, default=datetime.utcnow)
+    # Itens compactados: [[product_id, product_name, product_brand, quantity, unit_price, notes], ...]
+    items_json = Column(Text)
+
+    def __repr__(self):
+        return f'<OrderArchive {self.id} - User {self.user_id}>'
+
+
 # Funções auxiliares para gerenciamento de pedidos
 class OrderManager:
     """Classe para gerenciar operações de pedidos"""
 
     @staticmethod
-    def create_order(user_id, items_data, notes=''):
+    def create_order(user_id, items_data, notes='', produtos=None, categoria_loja=None):
         """
         Cria um novo pedido
         items_data: lista de dicts com {product_id, quantity, notes}
+        produtos: dict id -> produto já resolvido ({name, brand, em_queima_estoque, preco_queima}),
+                  normalmente o snapshot do catálogo em cache; sem ele, os produtos vêm
+                  do espelho local numa única consulta
+        Os itens são gravados num único INSERT em lote, na mesma transação do pedido.
         """
         try:
-            from app import Product
+            if produtos is None:
+                produtos = OrderManager.resolver_produtos(int(i['product_id']) for i in items_data)
+
+            linhas = []
+            for item_data in items_data:
+                product = produtos.get(int(item_data['product_id']))
+                if product:
+                    em_queima = product.get('em_queima_estoque') and product.get('preco_queima')
+                    linhas.append({
+                        'product_id': product['id'],
+                        'product_name': product['name'],
+                        'product_brand': product.get('brand'),
+                        'quantity': item_data.get('quantity', 1),
+                        'unit_price': product['preco_queima'] if em_queima else None,
+                        'notes': item_data.get('notes', '')
+                    })
 
             order = Order(
                 user_id=user_id,
+                categoria_loja=categoria_loja,
                 notes=notes,
-                status='pendente'
+                status='pendente',
+                total_items=sum(linha['quantity'] for linha in linhas)
             )
             db.session.add(order)
             db.session.flush()  # Para obter o ID do pedido
 
-            # Adicionar itens ao pedido
-            for item_data in items_data:
-                product = Product.query.get(item_data['product_id'])
-                if product:
-                    order_item = OrderItem(
-                        order_id=order.id,
-                        product_id=product.id,
-                        product_name=product.name,
-                        product_brand=product.brand,
-                        quantity=item_data.get('quantity', 1),
-                        notes=item_data.get('notes', '')
-                    )
-                    db.session.add(order_item)
-
-            order.total_items = order.get_total_items()
-            db.session.commit()
+            if linhas:
+                for linha in linhas:
+                    linha['order_id'] = order.id
+                db.session.execute(insert(OrderItem), linhas)
 
+            # Resumos da análise de pedidos, na mesma transação
+            analise_pedidos.registrar_pedido(order, linhas)
+            db.session.commit()
             return order
         except Exception as e:
             db.session.rollback()
             raise e
 
     @staticmethod
-    def get_user_orders(user_id):
-        """Retorna todos os pedidos de um usuário"""
-        return Order.query.filter_by(user_id=user_id).order_by(Order.created_at.desc()).all()
+    def resolver_produtos(product_ids):
+        """Busca os produtos no espelho local numa única consulta (dict id -> produto)"""
+        from app import Product
+
+        ids = set(product_ids)
+        if not ids:
+            return {}
+        return {
+            p.id: {'id': p.id, 'name': p.name, 'brand': p.brand,
+                   'em_queima_estoque': p.em_queima_estoque, 'preco_queima': p.preco_queima}
+            for p in Product.query.filter(Product.id.in_(ids))
+        }
+
+    @staticmethod
+    def get_user_orders(user_id, limite=None):
+        """Retorna os pedidos de um usuário (mais recentes primeiro) com usuário e itens já carregados"""
+        consulta = Order.query.options(joinedload(Order.user), selectinload(Order.items)) \
+            .filter_by(user_id=user_id).order_by(Order.created_at.desc(), Order.id.desc())
+        if limite:
+            consulta = consulta.limit(limite)
+        return consulta.all()
+
+    @staticmethod
+    def get_order_history(user_id, depois=None, limite=20):
+        """
+        Página do histórico de pedidos do usuário, já em dicts no formato do to_dict().
+        Keyset em (created_at, id) sobre o índice ix_orders_user_created: são sempre
+        duas consultas por página (pedidos e itens), sem montar objetos do ORM.
+        depois: (created_at, id) do último pedido da página anterior
+        Retorna (pedidos, proxima_chave|None)
+        """
+        consulta = select(Order.id, Order.user_id, User.username, Order.total_items, Order.status,
+                          Order.notes, Order.created_at) \
+            .outerjoin(User, User.id == Order.user_id) \
+            .where(Order.user_id == user_id)
+        if depois:
+            consulta = consulta.where(tuple_(Order.created_at, Order.id) < tuple_(*depois))
+        consulta = consulta.order_by(Order.created_at.desc(), Order.id.desc()).limit(limite + 1)
+        linhas = db.session.execute(consulta).all()
+
+        proxima = None
+        if len(linhas) > limite:
+            linhas = linhas[:limite]
+            proxima = (linhas[-1].created_at, linhas[-1].id)
+
+        itens = {}
+        if linhas:
+            consulta_itens = select(OrderItem.order_id, OrderItem.id, OrderItem.product_id, OrderItem.product_name,
+                                    OrderItem.product_brand, OrderItem.quantity, OrderItem.unit_price,
+                                    OrderItem.notes) \
+                .where(OrderItem.order_id.in_([linha.id for linha in linhas])) \
+                .order_by(OrderItem.order_id, OrderItem.id)
+            for item in db.session.execute(consulta_itens).mappings():
+                item = dict(item)
+                itens.setdefault(item.pop('order_id'), []).append(item)
+
+        pedidos = [{
+            'id': linha.id,
+            'user_id': linha.user_id,
+            'username': linha.username or 'Desconhecido',
+            'total_items': linha.total_items,
+            'status': linha.status,
+            'notes': linha.notes,
+            'created_at': linha.created_at.strftime('%d/%m/%Y %H:%M'),
+            'items': itens.get(linha.id, [])
+        } for linha in linhas]
+        return pedidos, proxima
 
     @staticmethod
     def get_order(order_id):
         """Retorna um pedido específico"""
-        return Order.query.get(order_id)
+        return Order.query.options(joinedload(Order.user), selectinload(Order.items)).get(order_id)
 
     @staticmethod
     def update_order_status(order_id, status):
         """Atualiza o status de um pedido"""
-        order = Order.query.get(order_id)
+        order = Order.query.options(selectinload(Order.items)).get(order_id)
         if order:
+            anterior = order.status
             order.status = status
             order.updated_at = datetime.utcnow()
+            analise_pedidos.mudar_status(order, [item.to_dict() for item in order.items], anterior)
             db.session.commit()
             return True
         return False
@@ -141,38 +281,148 @@ class OrderManager:
     @staticmethod
     def delete_order(order_id):
         """Deleta um pedido"""
-        order = Order.query.get(order_id)
+        order = Order.query.options(selectinload(Order.items)).get(order_id)
         if order:
+            analise_pedidos.remover_pedido(order, [item.to_dict() for item in order.items])
             db.session.delete(order)
             db.session.commit()
             return True
         return False
 
     @staticmethod
-    def format_whatsapp_message(order):
-        """Formata a mensagem do pedido para WhatsApp"""
-        from app import User
-
-        user = User.query.get(order.user_id)
-        username = user.username if user else 'Cliente'
-
-        message = f"*Novo Pedido #{order.id}*\n"
-        message += f"👤 Cliente: {username}\n"
-        message += f"📅 Data: {order.created_at.strftime('%d/%m/%Y %H:%M')}\n"
-        message += f"📦 Total de itens: {order.get_total_items()}\n\n"
-        message += "*Itens do Pedido:*\n"
-
-        for idx, item in enumerate(order.items, 1):
-            message += f"\n{idx}. *{item.product_name}*\n"
-            message += f"   Marca: {item.product_brand}\n"
-            message += f"   Quantidade: {item.quantity}\n"
+    def format_whatsapp_message(order, username=None):
+        """Formata a mensagem do pedido para WhatsApp (mesmo formato que a vitrine enviava)"""
+        if username is None:
+            username = order.user.username if order.user else 'Cliente'
+
+        message = f"PEDIDO #{order.id} - {username.upper()}\n\n"
+        for item in order.items:
+            linha = f"- {item.product_name.upper()}  -  {item.quantity} unid"
+            if item.unit_price:
+                # Produto em queima de estoque - mostrar preço
+                linha += f"  -  R$ {item.unit_price:.2f} (Total: R$ {item.unit_price * item.quantity:.2f})"
+            message += linha + "\n"
             if item.notes:
                 message += f"   Obs: {item.notes}\n"
+            message += "\n"
 
         if order.notes:
-            message += f"\n📝 *Observações do pedido:*\n{order.notes}"
+            message += f"Observações: {order.notes}\n"
+
+        return message.rstrip('\n')
+
 
-        return message
+# Rotas de pedidos
+def _validar_itens(itens):
+    """Normaliza os itens do carrinho (ValueError com a mensagem)"""
+    if not isinstance(itens, list) or not itens:
+        raise ValueError('Carrinho vazio')
+    if len(itens) > MAX_ITENS_PEDIDO:
+        raise ValueError(f'Máximo de {MAX_ITENS_PEDIDO} itens por pedido')
+
+    validados = {}
+    for item in itens:
+        if not isinstance(item, dict):
+            raise ValueError('Item inválido')
+        try:
+            product_id = int(item.get('product_id'))
+            quantity = int(item.get('quantity', 1))
+        except (TypeError, ValueError):
+            raise ValueError('Item inválido')
+        if not 0 < quantity <= MAX_QUANTIDADE:
+            raise ValueError(f'Quantidade inválida para o produto {product_id}')
+        if product_id in validados:
+            raise ValueError(f'Produto {product_id} repetido no pedido')
+        validados[product_id] = {'product_id': product_id, 'quantity': quantity,
+                                 'notes': str(item.get('notes') or '')[:500]}
+    return list(validados.values())
+
+
+@app.route('/api/pedidos', methods=['POST'])
+@login_required
+@categoria_required
+def criar_pedido():
+    """Grava o pedido do carrinho e devolve a mensagem/link do WhatsApp montados no servidor"""
+    categoria = session.get('categoria_loja')
+    data = request.get_json(silent=True) or {}
+    try:
+        itens = _validar_itens(data.get('itens'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    # Produtos resolvidos pelo catálogo em cache do setor (nenhuma consulta por item)
+    produtos = snapshot_do_setor(categoria).por_id
+    faltando = [i['product_id'] for i in itens if i['product_id'] not in produtos]
+    if faltando:
+        return jsonify({'error': 'Produtos não encontrados no catálogo', 'product_ids': faltando}), 400
+
+    try:
+        order = OrderManager.create_order(session['user_id'], itens, notes=str(data.get('notes') or '')[:1000],
+                                          produtos=produtos, categoria_loja=categoria)
+    except Exception as e:
+        print(f"Erro ao gravar pedido: {e}")
+        return jsonify({'error': 'Erro ao gravar o pedido'}), 500
+
+    mensagem = OrderManager.format_whatsapp_message(order, username=session.get('username', 'Cliente'))
+    config = AdminConfig.query.first()
+    whatsapp_url = f"https://wa.me/{config.whatsapp_number}?text={quote(mensagem)}" if config else None
+
+    return jsonify({'success': True, 'order_id': order.id, 'total_items': order.total_items,
+                    'message': mensagem, 'whatsapp_url': whatsapp_url}), 201
+
+
+def codificar_cursor_pedido(chave):
+    created_at, order_id = chave
+    return codificar_cursor((created_at.isoformat(), order_id))
+
+
+def decodificar_cursor_pedido(cursor):
+    """(created_at, id) do cursor; ValueError se for inválido"""
+    created_at, order_id = decodificar_cursor(cursor)
+    return datetime.fromisoformat(created_at), order_id
+
+
+@app.route('/api/pedidos')
+@login_required
+def listar_pedidos():
+    """Histórico de pedidos do usuário logado, paginado por cursor (mais recentes primeiro)"""
+    cursor = request.args.get('cursor')
+    try:
+        limite = min(max(int(request.args.get('limit', 20)), 1), 100)
+        depois = decodificar_cursor_pedido(cursor) if cursor else None
+    except ValueError:
+        return jsonify({'error': 'Parâmetros inválidos'}), 400
+
+    pedidos, proxima = OrderManager.get_order_history(session['user_id'], depois=depois, limite=limite)
+    return jsonify({
+        'orders': pedidos,
+        'next_cursor': codificar_cursor_pedido(proxima) if proxima else None
+    })
+
+
+@app.route('/admin/pedidos/export.<formato>')
+@admin_required
+@categoria_required
+def admin_exportar_pedidos(formato):
+    """Histórico de pedidos do setor (inclui arquivados) em CSV ou JSONL, gerado enquanto é enviado"""
+    from exportacao_pedidos import pedidos_para_exportar, exportar_csv, exportar_jsonl
+
+    if formato not in ('csv', 'jsonl'):
+        return jsonify({'error': 'Formato inválido (use csv ou jsonl)'}), 404
+    try:
+        filtros = {
+            'inicio': date.fromisoformat(request.args['inicio']) if request.args.get('inicio') else None,
+            'fim': date.fromisoformat(request.args['fim']) if request.args.get('fim') else None,
+            'status': request.args.get('status') or None,
+            'setor': session.get('categoria_loja')
+        }
+    except ValueError:
+        return jsonify({'error': 'Datas inválidas (use AAAA-MM-DD)'}), 400
+
+    exportar = exportar_csv if formato == 'csv' else exportar_jsonl
+    mimetype = 'text/csv' if formato == 'csv' else 'application/x-ndjson'
+    return Response(stream_with_context(exportar(pedidos_para_exportar(**filtros))), mimetype=mimetype,
+                    headers={'Content-Disposition': f'attachment; filename=pedidos_{filtros["setor"]}.{formato}'})
 
 
 # Inicializar tabelas de pedidos
@@ -183,6 +433,49 @@ def init_orders_db():
         print("Tabelas de pedidos criadas com sucesso!")
 
 
-if __name__ == '__main__':
-    # Se executar este arquivo diretamente, cria as tabelas
-    init_orders_db()
+def _benchmark(quantidade, itens_por_pedido):
+    import time
+    from datetime import timedelta
+    from sqlalchemy import event
+
+    with app.app_context():
+        db.create_all()
+        user = User(username='cliente-pesado', password='x')
+        db.session.add(user)
+        db.session.commit()
+        user_id = user.id
+
+        inicio = datetime(2024, 1, 1)
+        pedidos = [{'user_id': user_id, 'total_items': itens_por_pedido, 'status': 'finalizado',
+                    'created_at': inicio + timedelta(minutes=37 * i)} for i in range(quantidade)]
+        db.session.execute(insert(Order), pedidos)
+        ids = db.session.scalars(select(Order.id).order_by(Order.id)).all()
+        db.session.execute(insert(OrderItem), [
+            {'order_id': order_id, 'product_id': j + 1, 'product_name': f'Produto {j}', 'product_brand': 'Coral',
+             'quantity': 1} for order_id in ids for j in range(itens_por_pedido)])
+        db.session.commit()
+        print(f"{quantidade} pedidos x {itens_por_pedido} itens para um usuário")
+
+        consultas = [0]
+        event.listen(db.engine, 'before_cursor_execute', lambda *a, **k: consultas.__setitem__(0, consultas[0] + 1))
+
+        def medir(nome, funcao):
+            db.session.expunge_all()
+            consultas[0] = 0
+            t = time.perf_counter()
+            total = funcao()
+            print(f"{nome:<48} {(time.perf_counter() - t) * 1000:8.1f} ms | {consultas[0]:>5} consultas | {total} pedidos")
+
+        # Antes: todos os pedidos, usuário e itens carregados sob demanda em to_dict()
+        medir('lazy (todos os pedidos, to_dict)', lambda: len([
+            o.to_dict() for o in Order.query.filter_by(user_id=user_id).order_by(Order.created_at.desc()).all()]))
+        medir('selectinload (todos os pedidos, to_dict)', lambda: len([
+            o.to_dict() for o in OrderManager.get_user_orders(user_id)]))
+        medir('histórico: primeira página (20)', lambda: len(OrderManager.get_order_history(user_id)[0]))
+
+        # Cursor perto do fim do histórico: o custo não depende da profundidade
+        perto_do_fim = tuple(db.session.execute(
+            select(Order.created_at, Order.id).where(Order.user_id == user_id)
+            .order_by(Order.created_at, Order.id).offset(20)).first())
+        medir('histórico: página perto do fim (20)',
+              lambda: len(OrderManager.get_order_history(user_id, depois=perto_do_fim)[0]))
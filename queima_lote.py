@@ -0,0 +1,183 @@
+# -*- coding: utf-8 -*-
+"""
+Operações em lote da queima de estoque (status e preços)
+Valida todos os itens antes de escrever, confere a existência de todos os
+produtos numa única consulta e grava em poucas chamadas ao Supabase: um
+update (PATCH com in_ de até `tamanho_lote` IDs) por combinação de valores
+(status e/ou preços). Só as colunas da queima são escritas; nome, setor e o
+status de quem só mudou preço nunca são regravados com valores lidos antes.
+
+Benchmark: python queima_lote.py --latencia 0.01 --produtos 2000
+"""
+import time
+
+from postgrest.types import ReturnMethod
+
+MAX_ITENS = 1000
+
+
+def validar_precos(preco_original, preco_queima):
+    """Converte os preços para float e aplica a regra da queima (ValueError com a mensagem)"""
+    try:
+        preco_original = float(preco_original)
+        preco_queima = float(preco_queima)
+    except (TypeError, ValueError):
+        raise ValueError('Preços inválidos')
+    if preco_original <= 0 or preco_queima <= 0 or preco_queima >= preco_original:
+        raise ValueError('Preços inválidos. O preço de queima deve ser menor que o original')
+    return preco_original, preco_queima
+
+
+def _validar_item(item):
+    """Item normalizado {'id', 'em_queima_estoque'?, 'preco_original'?, 'preco_queima'?}"""
+    if not isinstance(item, dict):
+        raise ValueError('Item inválido')
+    try:
+        produto_id = int(item.get('id'))
+    except (TypeError, ValueError):
+        raise ValueError('ID inválido')
+
+    validado = {'id': produto_id}
+    if 'em_queima_estoque' in item:
+        if not isinstance(item['em_queima_estoque'], bool):
+            raise ValueError('em_queima_estoque deve ser true ou false')
+        validado['em_queima_estoque'] = item['em_queima_estoque']
+
+    tem_precos = item.get('preco_original') is not None or item.get('preco_queima') is not None
+    if tem_precos:
+        validado['preco_original'], validado['preco_queima'] = validar_precos(
+            item.get('preco_original'), item.get('preco_queima'))
+
+    if len(validado) == 1:
+        raise ValueError('Nada para alterar')
+    return validado
+
+
+def validar_itens(itens):
+    """
+    Valida o lote antes de enfileirar: (itens normalizados, erros por item).
+    Erros: [{'indice', 'id', 'error'}] na ordem recebida (lista vazia = lote válido).
+    """
+    validos = {}
+    erros = []
+    for indice, item in enumerate(itens):
+        try:
+            validado = _validar_item(item)
+        except ValueError as e:
+            erros.append({'indice': indice, 'id': item.get('id') if isinstance(item, dict) else None,
+                          'error': str(e)})
+            continue
+        if validado['id'] in validos:
+            erros.append({'indice': indice, 'id': validado['id'], 'error': 'ID repetido no lote'})
+            continue
+        validos[validado['id']] = validado
+    return list(validos.values()), erros
+
+
+def _lotes(lista, tamanho):
+    for inicio in range(0, len(lista), tamanho):
+        yield lista[inicio:inicio + tamanho]
+
+
+def aplicar_lote(client, repo, setor, itens, tamanho_lote=500, tabela='produtos'):
+    """
+    Aplica status/preços de queima a vários produtos do setor.
+    Retorna um resultado por item, na ordem recebida:
+    {'id', 'success': True} ou {'id', 'success': False, 'error'}.
+    """
+    resultados = []
+    validos = {}
+    for item in itens:
+        try:
+            validado = _validar_item(item)
+        except ValueError as e:
+            resultados.append({'id': item.get('id') if isinstance(item, dict) else None,
+                               'success': False, 'error': str(e)})
+            continue
+        if validado['id'] in validos:
+            resultados.append({'id': validado['id'], 'success': False, 'error': 'ID repetido no lote'})
+            continue
+        validos[validado['id']] = validado
+        resultados.append({'id': validado['id'], 'success': None})
+
+    # Uma consulta para conferir que todos existem no setor
+    existentes = {p['id'] for p in repo.buscar_varios(list(validos), setor, colunas='id')}
+    erros = {pid: 'Produto não encontrado' for pid in validos if pid not in existentes}
+
+    # Um update por combinação de valores: {'em_queima_estoque'?, 'preco_original'?, 'preco_queima'?}
+    por_valores = {}
+    for pid, item in validos.items():
+        if pid in erros:
+            continue
+        valores = tuple(sorted((campo, valor) for campo, valor in item.items() if campo != 'id'))
+        por_valores.setdefault(valores, []).append(pid)
+
+    for valores, ids in por_valores.items():
+        for lote in _lotes(ids, tamanho_lote):
+            try:
+                client.table(tabela).update(dict(valores), returning=ReturnMethod.minimal) \
+                    .in_('id', lote).eq('setor', setor).execute()
+            except Exception as e:
+                erros.update({pid: f'Erro ao atualizar produto: {e}' for pid in lote})
+
+    for resultado in resultados:
+        if resultado['success'] is None:
+            pid = resultado['id']
+            resultado['success'] = pid not in erros
+            if pid in erros:
+                resultado['error'] = erros[pid]
+    return resultados
+
+
+def _benchmark(latencia, produtos):
+    import os
+    from supabase import create_client
+    from repositorio_catalogo import CatalogoRepositorio
+    from supabase_local import BancoLocal, iniciar_servidor
+
+    banco = BancoLocal()
+    banco.popular_produtos(produtos, setores=('automotivo',))
+    servidor, url = iniciar_servidor(banco)
+    banco.latencia = latencia
+    client = create_client(url, os.environ.get('SUPABASE_KEY', 'eyJhbGciOiJIUzI1NiJ9.e30.abc'))
+    repo = CatalogoRepositorio(client)
+    ids = [linha['id'] for linha in banco.tabelas['produtos']]
+
+    print(f"Latência simulada por chamada: {latencia * 1000:.0f} ms")
+    for quantidade in (1, 50, 500):
+        alvo = ids[:quantidade]
+        itens = [{'id': pid, 'em_queima_estoque': True, 'preco_original': 100.0, 'preco_queima': 79.9}
+                 for pid in alvo]
+
+        # Fluxo atual da tela: toggle (ler + gravar) e save-prices (ler + gravar) por produto
+        inicio = time.perf_counter()
+        chamadas = banco.requisicoes
+        for pid in alvo:
+            repo.buscar(pid, 'automotivo', colunas='id, em_queima_estoque')
+            client.table('produtos').update({'em_queima_estoque': True}).eq('id', pid).execute()
+            repo.buscar(pid, 'automotivo', colunas='id')
+            client.table('produtos').update({'preco_original': 100.0, 'preco_queima': 79.9}).eq('id', pid).execute()
+        individual = time.perf_counter() - inicio
+        chamadas_individual = banco.requisicoes - chamadas
+
+        inicio = time.perf_counter()
+        chamadas = banco.requisicoes
+        resultados = aplicar_lote(client, repo, 'automotivo', itens)
+        lote = time.perf_counter() - inicio
+        chamadas_lote = banco.requisicoes - chamadas
+        assert all(r['success'] for r in resultados), resultados[:3]
+
+        print(f"{quantidade:>4} itens: individual {individual * 1000:8.0f} ms ({chamadas_individual} chamadas) | "
+              f"lote {lote * 1000:6.0f} ms ({chamadas_lote} chamadas)")
+
+    servidor.shutdown()
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Benchmark das operações em lote da queima de estoque')
+    parser.add_argument('--latencia', type=float, default=0.01, help='latência por chamada ao Supabase (s)')
+    parser.add_argument('--produtos', type=int, default=2000)
+    args = parser.parse_args()
+    _benchmark(args.latencia, args.produtos)
@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+"""
+Acesso à tabela `produtos` do Supabase
+Centraliza a paginação (com busca paralela das páginas) e a projeção de colunas
+
+CatalogoRepositorioAsync faz as leituras do modo ASGI (asgi.py) com o
+PostgREST assíncrono, sem prender thread enquanto o Supabase responde.
+"""
+from concurrent.futures import ThreadPoolExecutor
+
+
+class CatalogoRepositorio:
+    """Consultas de leitura ao catálogo de produtos no Supabase"""
+
+    def __init__(self, client, tabela='produtos', page_size=1000, max_workers=8):
+        self.client = client
+        self.tabela = tabela
+        self.page_size = page_size
+        self._executor = ThreadPoolExecutor(max_workers=max_workers,
+                                            thread_name_prefix='catalogo-paginas')
+
+    def _query(self, colunas, count=None):
+        return self.client.table(self.tabela).select(colunas, count=count)
+
+    @staticmethod
+    def _filtrar(query, setor, filtros, a_partir_de=None):
+        if setor is not None:
+            query = query.eq('setor', setor)
+        for coluna, valor in (filtros or {}).items():
+            query = query.eq(coluna, valor)
+        for coluna, valor in (a_partir_de or {}).items():
+            query = query.gte(coluna, valor)
+        return query
+
+    def contar(self, setor, **filtros):
+        """Quantidade de produtos do setor (sem trazer as linhas)"""
+        query = self._filtrar(self._query('id', count='exact'), setor, filtros)
+        response = query.limit(1).execute()
+        return response.count or 0
+
+    def listar(self, setor, colunas='*', ordem='nome', a_partir_de=None, **filtros):
+        """
+        Retorna todos os produtos do setor.
+
+        `a_partir_de` ({coluna: valor}) limita a busca às linhas com
+        coluna >= valor (usado pela sincronização incremental).
+
+        A primeira página já traz o total (count='exact'); as demais são
+        buscadas em paralelo no pool de threads. A ordenação sempre termina
+        em `id` para que as páginas não se sobreponham.
+        """
+        def pagina(offset, limite, count=None):
+            query = self._filtrar(self._query(colunas, count=count), setor, filtros, a_partir_de)
+            criterio = f'{ordem},id' if ordem and ordem != 'id' else 'id'
+            return query.order(criterio).limit(limite).offset(offset).execute()
+
+        primeira = pagina(0, self.page_size, count='exact')
+        produtos = list(primeira.data or [])
+        total = primeira.count or 0
+        if len(produtos) >= total or not produtos:
+            return produtos
+
+        # O servidor pode limitar o tamanho da página (max-rows) abaixo do pedido
+        tamanho = len(produtos)
+        offsets = range(tamanho, total, tamanho)
+        for response in self._executor.map(lambda offset: pagina(offset, tamanho), offsets):
+            produtos.extend(response.data or [])
+        return produtos
+
+    def buscar(self, produto_id, setor=None, colunas='*'):
+        """Um produto pelo id (opcionalmente restrito ao setor) ou None"""
+        query = self._filtrar(self._query(colunas), setor, None)
+        response = query.eq('id', produto_id).execute()
+        return response.data[0] if response.data else None
+
+    def buscar_varios(self, ids, setor=None, colunas='*'):
+        """Vários produtos numa única consulta (in_), na ordem de `ids`"""
+        if not ids:
+            return []
+        query = self._filtrar(self._query(colunas), setor, None)
+        por_id = {p['id']: p for p in query.in_('id', list(ids)).execute().data or []}
+        return [por_id[i] for i in ids if i in por_id]
+
+
+class CatalogoRepositorioAsync:
+    """Leituras do catálogo no PostgREST assíncrono (cliente_supabase.criar_postgrest_async)"""
+
+    def __init__(self, client, tabela='produtos'):
+        self.client = client
+        self.tabela = tabela
+
+    async def buscar(self, produto_id, setor=None, colunas='*'):
+        """Um produto pelo id (opcionalmente restrito ao setor) ou None"""
+        query = CatalogoRepositorio._filtrar(self.client.table(self.tabela).select(colunas), setor, None)
+        response = await query.eq('id', produto_id).execute()
+        return response.data[0] if response.data else None
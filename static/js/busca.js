@@ -0,0 +1,6 @@
+// Normalização de texto para busca, igual à do servidor (normalizacao.py):
+// sem acentos, minúsculo e com espaços simples ("Tinta  Acrílica" -> "tinta acrilica")
+function normalizarBusca(texto) {
+    return (texto || '').normalize('NFKD').replace(/[\u0300-\u036f]/g, '')
+        .toLowerCase().replace(/\s+/g, ' ').trim();
+}
@@ -0,0 +1,67 @@
+// Cópia local do catálogo (IndexedDB), uma por setor, atualizada por deltas
+// de /api/catalog/changes. Sem IndexedDB (modo privado etc.) tudo vira no-op.
+const CATALOGO_DB = 'pauliceia_catalogo';
+const CATALOGO_STORE = 'catalogos';
+
+function abrirCatalogoDb() {
+    return new Promise((resolve, reject) => {
+        if (!window.indexedDB) return reject(new Error('IndexedDB indisponível'));
+        const req = indexedDB.open(CATALOGO_DB, 1);
+        req.onupgradeneeded = () => req.result.createObjectStore(CATALOGO_STORE, { keyPath: 'setor' });
+        req.onsuccess = () => resolve(req.result);
+        req.onerror = () => reject(req.error);
+    });
+}
+
+async function lerCatalogoLocal(setor) {
+    try {
+        const db = await abrirCatalogoDb();
+        return await new Promise((resolve, reject) => {
+            const req = db.transaction(CATALOGO_STORE).objectStore(CATALOGO_STORE).get(setor);
+            req.onsuccess = () => resolve(req.result || null);
+            req.onerror = () => reject(req.error);
+        });
+    } catch (error) {
+        return null;
+    }
+}
+
+async function salvarCatalogoLocal(setor, versao, produtos) {
+    try {
+        const db = await abrirCatalogoDb();
+        db.transaction(CATALOGO_STORE, 'readwrite').objectStore(CATALOGO_STORE)
+            .put({ setor: setor, versao: versao, produtos: produtos });
+    } catch (error) {
+        console.warn('Não foi possível salvar o catálogo local:', error);
+    }
+}
+
+// Aplica um delta do servidor sobre a lista local, mantendo a ordem por nome
+function aplicarMudancasCatalogo(produtos, alterados, removidos) {
+    const removidosSet = new Set(removidos);
+    const alteradosPorId = new Map(alterados.map(p => [p.id, p]));
+    let reordenar = false;
+
+    const resultado = [];
+    for (const p of produtos) {
+        if (removidosSet.has(p.id)) continue;
+        const novo = alteradosPorId.get(p.id);
+        if (novo) {
+            alteradosPorId.delete(p.id);
+            if (novo.name !== p.name) reordenar = true;
+            resultado.push(novo);
+        } else {
+            resultado.push(p);
+        }
+    }
+    // O que sobrou são produtos novos
+    if (alteradosPorId.size) {
+        resultado.push(...alteradosPorId.values());
+        reordenar = true;
+    }
+    if (reordenar) {
+        const collator = new Intl.Collator('pt-BR');
+        resultado.sort((a, b) => collator.compare(a.name, b.name) || a.id - b.id);
+    }
+    return resultado;
+}
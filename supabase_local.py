@@ -0,0 +1,419 @@
+# -*- coding: utf-8 -*-
+"""
+Servidor local que imita a API REST do Supabase (PostgREST + Storage)
+Usado para desenvolvimento offline e para os benchmarks dos módulos do catálogo
+
+Execute: python supabase_local.py --produtos 5000 --porta 54321
+e aponte SUPABASE_URL para http://127.0.0.1:54321
+"""
+import argparse
+import json
+import random
+import re
+import socket
+import sys
+import threading
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, unquote, urlsplit
+
+
+def _agora():
+    return datetime.now(timezone.utc).isoformat()
+
+
+def _converter(valor, referencia):
+    """Converte o valor textual do filtro para o tipo da coluna"""
+    if valor == 'null':
+        return None
+    if isinstance(referencia, bool):
+        return valor.lower() == 'true'
+    if isinstance(referencia, int):
+        try:
+            return int(valor)
+        except ValueError:
+            return valor
+    if isinstance(referencia, float):
+        try:
+            return float(valor)
+        except ValueError:
+            return valor
+    return valor
+
+
+def _comparar(op, atual, valor):
+    if op == 'is':
+        if valor == 'null':
+            return atual is None
+        return atual is (valor.lower() == 'true')
+    if op == 'in':
+        opcoes = {v.strip().strip('"') for v in valor.strip('()').split(',') if v.strip()}
+        if atual is None:
+            return False
+        return (str(atual).lower() if isinstance(atual, bool) else str(atual)) in opcoes
+    if op in ('like', 'ilike'):
+        padrao = re.escape(valor).replace(r'\*', '.*').replace('%', '.*')
+        flags = re.IGNORECASE if op == 'ilike' else 0
+        return atual is not None and re.fullmatch(padrao, str(atual), flags) is not None
+    if atual is None:
+        return False
+    valor = _converter(valor, atual)
+    try:
+        if op == 'eq':
+            return atual == valor
+        if op == 'neq':
+            return atual != valor
+        if op == 'gt':
+            return atual > valor
+        if op == 'gte':
+            return atual >= valor
+        if op == 'lt':
+            return atual < valor
+        if op == 'lte':
+            return atual <= valor
+    except TypeError:
+        return False
+    raise ValueError(f'Operador não suportado: {op}')
+
+
+def _dividir_or(expr):
+    """Divide 'a.eq.1,and(b.gt.2,c.lt.3)' respeitando parênteses"""
+    partes, nivel, atual = [], 0, ''
+    for ch in expr:
+        if ch == ',' and nivel == 0:
+            partes.append(atual)
+            atual = ''
+            continue
+        if ch == '(':
+            nivel += 1
+        elif ch == ')':
+            nivel -= 1
+        atual += ch
+    if atual:
+        partes.append(atual)
+    return partes
+
+
+def _avaliar_logico(linha, expr, modo):
+    resultados = []
+    for parte in _dividir_or(expr.strip('()')):
+        if parte.startswith('and('):
+            resultados.append(_avaliar_logico(linha, parte[3:], 'and'))
+        elif parte.startswith('or('):
+            resultados.append(_avaliar_logico(linha, parte[2:], 'or'))
+        else:
+            coluna, op, valor = parte.split('.', 2)
+            if valor.startswith('"') and valor.endswith('"'):
+                valor = valor[1:-1]
+            resultados.append(_comparar(op, linha.get(coluna), valor))
+    return all(resultados) if modo == 'and' else any(resultados)
+
+
+class BancoLocal:
+    """Tabelas em memória no formato usado pelo PostgREST"""
+
+    def __init__(self):
+        self.tabelas = {}
+        self.sequencias = {}
+        self.objetos = {}
+        self.cabecalhos_objetos = {}  # chave -> cabeçalhos devolvidos no GET (Cache-Control etc.)
+        self.lock = threading.Lock()
+        self.requisicoes = 0
+        # Injeção de falhas para testar resiliência
+        self.latencia = 0.0
+        self.taxa_erro = 0.0
+        self.taxa_queda = 0.0  # fração de requisições em que a conexão cai sem resposta
+
+    def inserir(self, tabela, linha):
+        linhas = self.tabelas.setdefault(tabela, [])
+        linha = dict(linha)
+        if 'id' not in linha or linha['id'] is None:
+            self.sequencias[tabela] = self.sequencias.get(tabela, 0) + 1
+            linha['id'] = self.sequencias[tabela]
+        else:
+            self.sequencias[tabela] = max(self.sequencias.get(tabela, 0), linha['id'])
+        linha.setdefault('updated_at', _agora())
+        linhas.append(linha)
+        return linha
+
+    def popular_produtos(self, quantidade, setores=('automotivo', 'imobiliario'), semente=42):
+        """Gera produtos sintéticos parecidos com o catálogo real"""
+        rnd = random.Random(semente)
+        tipos = ['Tinta', 'Verniz', 'Massa', 'Primer', 'Esmalte', 'Thinner', 'Lixa', 'Catalisador',
+                 'Fundo', 'Selador', 'Textura', 'Removedor', 'Spray', 'Acrílica', 'Poliéster']
+        cores = ['Branco', 'Preto', 'Azul', 'Vermelho', 'Cinza', 'Prata', 'Amarelo', 'Verde',
+                 'Marfim', 'Grafite', 'Pérola', 'Bege']
+        tamanhos = ['900ml', '3,6L', '18L', '450ml', '1L', '5L', '250g', '1kg']
+        marcas = ['Suvinil', 'Coral', 'Sherwin', 'Lazzuril', 'Maxi', 'Wanda', 'Renner', 'Eucatex',
+                  'Iquine', 'Anjo', 'Colorgin', 'Farben']
+        for i in range(quantidade):
+            nome = f"{rnd.choice(tipos)} {rnd.choice(cores)} {rnd.choice(tamanhos)} {i} {rnd.choice(marcas)}"
+            self.inserir('produtos', {
+                'nome': nome,
+                'descricao': f'Descrição do produto {i}',
+                'setor': setores[i % len(setores)],
+                'imagem': None,
+                'produto_relacionado_ids': None,
+                'produto_relacionado_id': None,
+                'em_queima_estoque': False,
+                'preco_original': None,
+                'preco_queima': None,
+            })
+
+
+class ManipuladorPostgrest(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    banco: BancoLocal = None
+
+    def log_message(self, format, *args):
+        pass
+
+    # --- utilidades ---
+    def _responder(self, status, corpo=None, cabecalhos=None):
+        dados = b'' if corpo is None else json.dumps(corpo, default=str).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(dados)))
+        for chave, valor in (cabecalhos or {}).items():
+            self.send_header(chave, valor)
+        self.end_headers()
+        if self.command != 'HEAD':
+            self.wfile.write(dados)
+
+    def _ler_corpo(self):
+        tamanho = int(self.headers.get('Content-Length') or 0)
+        return self.rfile.read(tamanho) if tamanho else b''
+
+    def _falha_injetada(self):
+        banco = self.banco
+        with banco.lock:
+            banco.requisicoes += 1
+        if banco.latencia:
+            threading.Event().wait(banco.latencia)
+        if banco.taxa_queda and random.random() < banco.taxa_queda:
+            self.close_connection = True
+            self.connection.shutdown(socket.SHUT_RDWR)
+            return True
+        if banco.taxa_erro and random.random() < banco.taxa_erro:
+            if self.command not in ('GET', 'HEAD'):
+                # Descarta o corpo para não sobrar lixo na conexão keep-alive (do_GET já descartou)
+                self._ler_corpo()
+            self._responder(503, {'message': 'falha injetada'})
+            return True
+        return False
+
+    def _filtrar(self, linhas, params):
+        for chave, valor in params:
+            if chave in ('select', 'order', 'limit', 'offset', 'on_conflict', 'columns'):
+                continue
+            if chave in ('or', 'and'):
+                linhas = [l for l in linhas if _avaliar_logico(l, valor, chave)]
+                continue
+            op, _, alvo = valor.partition('.')
+            if op == 'not':
+                op, _, alvo = alvo.partition('.')
+                linhas = [l for l in linhas if not _comparar(op, l.get(chave), alvo)]
+            else:
+                linhas = [l for l in linhas if _comparar(op, l.get(chave), alvo)]
+        return linhas
+
+    @staticmethod
+    def _ordenar(linhas, ordem):
+        for item in reversed(ordem.split(',')):
+            partes = item.split('.')
+            coluna = partes[0]
+            desc = 'desc' in partes[1:]
+            linhas = sorted(linhas, key=lambda l: (l.get(coluna) is None, l.get(coluna)), reverse=desc)
+        return linhas
+
+    @staticmethod
+    def _projetar(linhas, select):
+        if not select or select.strip() == '*':
+            return [dict(l) for l in linhas]
+        colunas = [c.strip() for c in select.split(',') if c.strip()]
+        return [{c: l.get(c) for c in colunas} for l in linhas]
+
+    def _rota(self):
+        url = urlsplit(self.path)
+        return url.path, parse_qsl(url.query, keep_blank_values=True)
+
+    # --- PostgREST ---
+    def do_GET(self):
+        # O cliente do PostgREST envia corpo '{}' até em GET; descarta para manter a conexão íntegra
+        self._ler_corpo()
+        caminho, params = self._rota()
+        if caminho.startswith('/storage/v1/'):
+            return self._storage_get(caminho)
+        if self._falha_injetada():
+            return
+        tabela = caminho.rsplit('/', 1)[-1]
+        with self.banco.lock:
+            linhas = list(self.banco.tabelas.get(tabela, []))
+        linhas = self._filtrar(linhas, params)
+        p = dict(params)
+        if 'order' in p:
+            linhas = self._ordenar(linhas, p['order'])
+        total = len(linhas)
+
+        inicio, fim = 0, None
+        if self.headers.get('Range'):
+            a, _, b = self.headers['Range'].partition('-')
+            inicio, fim = int(a), int(b) + 1
+        if 'offset' in p:
+            inicio = int(p['offset'])
+        if 'limit' in p:
+            fim = inicio + int(p['limit'])
+        pagina = linhas[inicio:fim]
+
+        cabecalhos = {}
+        if 'count=exact' in (self.headers.get('Prefer') or ''):
+            ultimo = inicio + len(pagina) - 1
+            faixa = f'{inicio}-{ultimo}' if pagina else '*'
+            cabecalhos['Content-Range'] = f'{faixa}/{total}'
+        self._responder(200, self._projetar(pagina, p.get('select')), cabecalhos)
+
+    do_HEAD = do_GET
+
+    def do_POST(self):
+        caminho, params = self._rota()
+        if caminho.startswith('/storage/v1/'):
+            return self._storage_post(caminho)
+        if self._falha_injetada():
+            return
+        tabela = caminho.rsplit('/', 1)[-1]
+        dados = json.loads(self._ler_corpo() or b'[]')
+        if isinstance(dados, dict):
+            dados = [dados]
+        prefer = self.headers.get('Prefer') or ''
+        upsert = 'resolution=merge-duplicates' in prefer
+        conflito = dict(params).get('on_conflict', 'id')
+        resultado = []
+        with self.banco.lock:
+            linhas = self.banco.tabelas.setdefault(tabela, [])
+            for item in dados:
+                existente = None
+                if upsert and item.get(conflito) is not None:
+                    existente = next((l for l in linhas if l.get(conflito) == item[conflito]), None)
+                if existente is not None:
+                    existente.update(item)
+                    existente['updated_at'] = _agora()
+                    resultado.append(dict(existente))
+                else:
+                    resultado.append(dict(self.banco.inserir(tabela, item)))
+        self._responder(201, resultado if 'return=representation' in prefer else None)
+
+    def do_PATCH(self):
+        caminho, params = self._rota()
+        if self._falha_injetada():
+            return
+        tabela = caminho.rsplit('/', 1)[-1]
+        dados = json.loads(self._ler_corpo() or b'{}')
+        with self.banco.lock:
+            alvo = self._filtrar(self.banco.tabelas.get(tabela, []), params)
+            for linha in alvo:
+                linha.update(dados)
+                linha['updated_at'] = _agora()
+            resultado = [dict(l) for l in alvo]
+        self._responder(200, resultado)
+
+    def do_DELETE(self):
+        self._ler_corpo()
+        caminho, params = self._rota()
+        if self._falha_injetada():
+            return
+        tabela = caminho.rsplit('/', 1)[-1]
+        with self.banco.lock:
+            linhas = self.banco.tabelas.get(tabela, [])
+            alvo = self._filtrar(linhas, params)
+            ids = {id(l) for l in alvo}
+            self.banco.tabelas[tabela] = [l for l in linhas if id(l) not in ids]
+            resultado = [dict(l) for l in alvo]
+        self._responder(200, resultado)
+
+    # --- Storage ---
+    def _storage_post(self, caminho):
+        if self._falha_injetada():
+            return
+        if caminho.startswith('/storage/v1/object/list/'):
+            return self._storage_listar(caminho)
+        chave = unquote(caminho.split('/object/', 1)[-1])
+        corpo = self._ler_corpo()
+        with self.banco.lock:
+            if chave in self.banco.objetos and self.headers.get('x-upsert') != 'true':
+                return self._responder(400, {'statusCode': '409', 'error': 'Duplicate',
+                                             'message': 'The resource already exists'})
+            self.banco.objetos[chave] = corpo
+            self.banco.cabecalhos_objetos[chave] = {'Cache-Control': self.headers.get('cache-control') or 'no-cache'}
+        self._responder(200, {'Key': chave})
+
+    def _storage_listar(self, caminho):
+        """Objetos diretamente dentro de uma pasta do bucket (filtro 'search' por trecho do nome)"""
+        bucket = unquote(caminho.rsplit('/', 1)[-1])
+        opcoes = json.loads(self._ler_corpo() or b'{}')
+        prefixo = f"{bucket}/{opcoes.get('prefix') or ''}".rstrip('/') + '/'
+        busca = opcoes.get('search') or ''
+        with self.banco.lock:
+            nomes = sorted(chave[len(prefixo):] for chave in self.banco.objetos if chave.startswith(prefixo))
+        itens = [{'name': nome, 'id': nome, 'metadata': {}} for nome in nomes if '/' not in nome and busca in nome]
+        self._responder(200, itens[:int(opcoes.get('limit') or 100)])
+
+    def _storage_get(self, caminho):
+        chave = unquote(caminho.split('/object/', 1)[-1])
+        if chave.startswith('public/'):
+            chave = chave[len('public/'):]
+        with self.banco.lock:
+            corpo = self.banco.objetos.get(chave)
+            cabecalhos = self.banco.cabecalhos_objetos.get(chave) or {}
+        if corpo is None:
+            return self._responder(404, {'error': 'not_found'})
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(corpo)))
+        for nome, valor in cabecalhos.items():
+            self.send_header(nome, valor)
+        self.end_headers()
+        if self.command != 'HEAD':
+            self.wfile.write(corpo)
+
+class ServidorLocal(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 128  # o padrão (5) recusa conexões quando há muitas threads no cliente
+
+    def handle_error(self, request, client_address):
+        # Cliente que desistiu (timeout) ou conexão derrubada de propósito: nada a registrar
+        if not isinstance(sys.exc_info()[1], OSError):
+            super().handle_error(request, client_address)
+
+
+def iniciar_servidor(banco=None, host='127.0.0.1', porta=0):
+    """
+    Sobe o servidor em uma thread daemon e retorna (servidor, url).
+    Use porta=0 para escolher uma porta livre.
+    """
+    banco = banco or BancoLocal()
+    manipulador = type('Manipulador', (ManipuladorPostgrest,), {'banco': banco})
+    servidor = ServidorLocal((host, porta), manipulador)
+    servidor.banco = banco
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    return servidor, f'http://{host}:{servidor.server_address[1]}'
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Supabase/PostgREST local para desenvolvimento')
+    parser.add_argument('--porta', type=int, default=54321)
+    parser.add_argument('--produtos', type=int, default=1000, help='Quantidade de produtos sintéticos')
+    parser.add_argument('--latencia', type=float, default=0.0, help='Latência artificial por requisição (s)')
+    parser.add_argument('--taxa-erro', type=float, default=0.0, help='Fração de requisições que falham com 503')
+    parser.add_argument('--taxa-queda', type=float, default=0.0, help='Fração de requisições sem resposta (conexão cai)')
+    args = parser.parse_args()
+
+    banco = BancoLocal()
+    banco.popular_produtos(args.produtos)
+    banco.latencia = args.latencia
+    banco.taxa_erro = args.taxa_erro
+    banco.taxa_queda = args.taxa_queda
+    servidor, url = iniciar_servidor(banco, porta=args.porta)
+    print(f"Supabase local em {url} ({args.produtos} produtos)")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        servidor.shutdown()
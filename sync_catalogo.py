@@ -0,0 +1,199 @@
+# -*- coding: utf-8 -*-
+"""
+Sincronização incremental do catálogo do Supabase para a tabela local `product`
+
+A primeira execução copia o setor inteiro; as seguintes trazem apenas as
+linhas com marca d'água (updated_at, ou id quando a tabela não tiver essa
+coluna) maior ou igual à última vista, e removem localmente os produtos que
+sumiram do Supabase. Sem uma coluna updated_at mantida por trigger, só
+as inclusões são incrementais; as edições entram na próxima sync completa
+(CATALOGO_SYNC_COMPLETA).
+
+Execute: python sync_catalogo.py [--setor automotivo] [--completa] [--intervalo 60]
+Para testar offline, suba `python supabase_local.py` e aponte SUPABASE_URL para ele.
+"""
+import argparse
+import threading
+import time
+from datetime import datetime
+
+from sqlalchemy import delete, insert, select, update
+
+from app import app, db, Product, SyncCatalogo, SETORES, catalogo_repo
+from normalizacao import normalizar
+from catalogo import extrair_marca, ids_relacionados
+
+# Colunas da tabela local comparadas para decidir se uma linha mudou
+CAMPOS_ESPELHADOS = ('name', 'brand', 'description', 'image', 'categoria_loja',
+                     'related_product_ids', 'em_queima_estoque', 'preco_original',
+                     'preco_queima', 'supabase_updated_at', 'search_key')
+
+
+def produto_local(linha, coluna_watermark):
+    """Converte uma linha do Supabase para as colunas da tabela product"""
+    nome = linha.get('nome') or ''
+    watermark = linha.get(coluna_watermark)
+    return {
+        'id': linha['id'],
+        'name': nome,
+        'brand': extrair_marca(nome),
+        'description': linha.get('descricao') or '',
+        'image': linha.get('imagem') or linha.get('image'),
+        'categoria_loja': linha.get('setor'),
+        'related_product_ids': ids_relacionados(linha) or None,
+        'em_queima_estoque': bool(linha.get('em_queima_estoque', False)),
+        'preco_original': linha.get('preco_original'),
+        'preco_queima': linha.get('preco_queima'),
+        'supabase_updated_at': str(watermark) if watermark is not None else None,
+        'search_key': normalizar(nome),
+    }
+
+
+class SincronizadorCatalogo:
+    """Aplica no banco local as mudanças do catálogo do Supabase"""
+
+    def __init__(self, repo, intervalo_completa=6 * 3600, lote=500):
+        self.repo = repo
+        self.intervalo_completa = intervalo_completa
+        self.lote = lote
+
+    def _em_lotes(self, itens):
+        itens = list(itens)
+        for i in range(0, len(itens), self.lote):
+            yield itens[i:i + self.lote]
+
+    def _aplicar(self, linhas):
+        """Insere/atualiza as linhas recebidas; retorna (novos, alterados)"""
+        atuais = {}
+        colunas = [getattr(Product, c) for c in CAMPOS_ESPELHADOS]
+        for ids in self._em_lotes(l['id'] for l in linhas):
+            for row in db.session.execute(select(Product.id, *colunas).where(Product.id.in_(ids))):
+                atuais[row[0]] = dict(zip(CAMPOS_ESPELHADOS, row[1:]))
+
+        novos, alterados = [], []
+        for dados in linhas:
+            atual = atuais.get(dados['id'])
+            if atual is None:
+                novos.append(dados)
+            elif any(atual[c] != dados[c] for c in CAMPOS_ESPELHADOS):
+                alterados.append(dados)
+
+        for lote in self._em_lotes(novos):
+            db.session.execute(insert(Product), lote)
+        for lote in self._em_lotes(alterados):
+            db.session.execute(update(Product), lote)
+        return len(novos), len(alterados)
+
+    def _remover_ausentes(self, setor, ids_remotos):
+        locais = set(db.session.scalars(select(Product.id).where(Product.categoria_loja == setor)))
+        ausentes = locais - ids_remotos
+        for ids in self._em_lotes(ausentes):
+            db.session.execute(delete(Product).where(Product.id.in_(ids)))
+        return len(ausentes)
+
+    def sincronizar(self, setor, completa=False):
+        """Sincroniza um setor; deve rodar dentro de um app_context"""
+        estado = db.session.get(SyncCatalogo, setor)
+        if estado is None:
+            estado = SyncCatalogo(setor=setor, versao=0)
+            db.session.add(estado)
+
+        agora = datetime.utcnow()
+        if estado.ultima_sync_completa is None or estado.watermark is None or \
+                (agora - estado.ultima_sync_completa).total_seconds() > self.intervalo_completa:
+            completa = True
+
+        try:
+            if completa:
+                linhas = self.repo.listar(setor, colunas='*', ordem='id')
+                coluna = 'updated_at' if linhas and 'updated_at' in linhas[0] else 'id'
+                ids_remotos = {l['id'] for l in linhas}
+            else:
+                coluna = estado.coluna_watermark
+                linhas = self.repo.listar(setor, colunas='*', ordem=coluna,
+                                          a_partir_de={coluna: estado.watermark})
+                # Só os ids: barato e suficiente para detectar exclusões
+                ids_remotos = {l['id'] for l in self.repo.listar(setor, colunas='id', ordem='id')}
+
+            dados = [produto_local(l, coluna) for l in linhas]
+            novos, alterados = self._aplicar(dados)
+            removidos = self._remover_ausentes(setor, ids_remotos)
+
+            marcas = [l[coluna] for l in linhas if l.get(coluna) is not None]
+            if marcas:
+                estado.watermark = str(max(marcas))
+            estado.coluna_watermark = coluna
+            if novos or alterados or removidos:
+                estado.versao += 1
+            estado.ultima_sync = agora
+            if completa:
+                estado.ultima_sync_completa = agora
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+
+        return {
+            'setor': setor,
+            'completa': completa,
+            'novos': novos,
+            'alterados': alterados,
+            'removidos': removidos,
+            'versao': estado.versao,
+        }
+
+
+def sincronizar_todos(sincronizador, setores=None, completa=False):
+    """Sincroniza os setores informados (ou todos), registrando erros sem interromper"""
+    resultados = []
+    with app.app_context():
+        for setor in setores or SETORES:
+            try:
+                resultados.append(sincronizador.sincronizar(setor, completa=completa))
+            except Exception as e:
+                print(f"Erro na sincronização do catálogo ({setor}): {e}")
+    return resultados
+
+
+def iniciar_sync_periodico(intervalo=None):
+    """Roda a sincronização em uma thread daemon a cada `intervalo` segundos"""
+    intervalo = intervalo or app.config['CATALOGO_SYNC_INTERVALO']
+    if not intervalo:
+        return None
+
+    sincronizador = SincronizadorCatalogo(catalogo_repo,
+                                          intervalo_completa=app.config['CATALOGO_SYNC_COMPLETA'])
+
+    def loop():
+        while True:
+            sincronizar_todos(sincronizador)
+            time.sleep(intervalo)
+
+    thread = threading.Thread(target=loop, name='sync-catalogo', daemon=True)
+    thread.start()
+    return thread
+
+
+if __name__ == '__main__':
+    from app import init_db
+
+    parser = argparse.ArgumentParser(description='Sincroniza o catálogo do Supabase com o banco local')
+    parser.add_argument('--setor', choices=SETORES, help='Sincronizar apenas este setor')
+    parser.add_argument('--completa', action='store_true', help='Ignorar a marca d\'água e copiar tudo')
+    parser.add_argument('--intervalo', type=int, default=0,
+                        help='Repetir a cada N segundos (0 = executar uma vez)')
+    args = parser.parse_args()
+
+    init_db()
+    sincronizador = SincronizadorCatalogo(catalogo_repo,
+                                          intervalo_completa=app.config['CATALOGO_SYNC_COMPLETA'])
+    setores = [args.setor] if args.setor else None
+
+    while True:
+        for r in sincronizar_todos(sincronizador, setores, completa=args.completa):
+            tipo = 'completa' if r['completa'] else 'incremental'
+            print(f"[{r['setor']}] sync {tipo}: {r['novos']} novos, {r['alterados']} alterados, "
+                  f"{r['removidos']} removidos (versão {r['versao']})")
+        if not args.intervalo:
+            break
+        time.sleep(args.intervalo)
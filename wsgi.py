@@ -11,14 +11,14 @@ import io
 sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
 
 from waitress import serve
-from app import app, init_db
+from app import app, iniciar_servicos
 
 if __name__ == '__main__':
     # Configurar para produção
     os.environ['FLASK_ENV'] = 'production'
 
-    # Inicializar banco de dados
-    init_db()
+    # Banco local, fila de tarefas, sincronização, arquivamento e eventos
+    iniciar_servicos()
 
     # Obter IP local
     import socket